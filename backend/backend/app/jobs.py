@@ -0,0 +1,459 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Any, Optional
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from backend.genie.cache import CACHE_DIR
+from backend.genie.metrics import listener_var, metrics_context
+
+logger = logging.getLogger(__name__)
+
+# point at a persistent volume in production; jobs survive process restarts
+JOBS_PATH = os.getenv("GENIE_JOBS_PATH", os.path.join(CACHE_DIR, "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("GENIE_JOB_WORKERS", "2"))
+# a running job whose lease isn't renewed (its worker died) is picked up again
+JOB_LEASE_S = float(os.getenv("GENIE_JOB_LEASE_S", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("GENIE_JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_S = float(os.getenv("GENIE_JOB_POLL_S", "1.0"))
+# a succeeded job is returned for an identical submission for this long; after
+# that (or with force) it runs again, in case its output was since changed
+JOB_REUSE_S = float(os.getenv("GENIE_JOB_REUSE_S", "3600"))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class Job(BaseModel):
+    job_id: str
+    kind: str
+    course_id: Optional[str] = None
+    status: str
+    progress: dict[str, dict] = {}
+    result: Any = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: float
+    updated_at: float
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+
+def input_hash(**inputs) -> str:
+    """Hash of everything a job's output depends on."""
+    payload = json.dumps(jsonable_encoder(inputs), sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class JobStore:
+    """
+    Durable job table on SQLite. A job is identified for idempotency by
+    (kind, course_id, input hash); workers claim queued jobs under a lease.
+    """
+
+    def __init__(self, path: str = JOBS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None, timeout=30
+            )
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    course_id TEXT,
+                    idempotency_key TEXT NOT NULL UNIQUE,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress TEXT NOT NULL DEFAULT '{}',
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_until REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at)"
+            )
+        return self._conn
+
+    @staticmethod
+    def _job(row: sqlite3.Row) -> Job:
+        return Job(
+            job_id=row["job_id"],
+            kind=row["kind"],
+            course_id=row["course_id"],
+            status=row["status"],
+            progress=json.loads(row["progress"]),
+            result=json.loads(row["result"]) if row["result"] else None,
+            error=row["error"],
+            attempts=row["attempts"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+        )
+
+    def _select(self, conn, where: str, args: tuple) -> Optional[sqlite3.Row]:
+        return conn.execute(f"SELECT * FROM jobs WHERE {where}", args).fetchone()
+
+    def submit(
+        self,
+        kind: str,
+        course_id: Optional[str],
+        params: dict,
+        key: str,
+        force: bool = False,
+    ) -> tuple[Job, bool]:
+        """
+        (job, created). An identical job that is queued or running is
+        returned as is, and so is one that succeeded within JOB_REUSE_S
+        unless `force`; a failed or older one is queued again.
+        """
+        now = time.time()
+        idempotency_key = f"{kind}:{course_id}:{key}"
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._select(conn, "idempotency_key = ?", (idempotency_key,))
+                if row is not None and (
+                    row["status"] in (QUEUED, RUNNING)
+                    or (
+                        row["status"] == SUCCEEDED
+                        and not force
+                        and now - row["updated_at"] < JOB_REUSE_S
+                    )
+                ):
+                    conn.execute("COMMIT")
+                    return self._job(row), False
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, params = ?, progress = '{}', "
+                        "result = NULL, error = NULL, attempts = 0, lease_until = NULL, "
+                        "updated_at = ? WHERE job_id = ?",
+                        (QUEUED, json.dumps(params), now, row["job_id"]),
+                    )
+                    job_id = row["job_id"]
+                else:
+                    job_id = uuid.uuid4().hex
+                    conn.execute(
+                        "INSERT INTO jobs (job_id, kind, course_id, idempotency_key, "
+                        "params, status, created_at, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            job_id,
+                            kind,
+                            course_id,
+                            idempotency_key,
+                            json.dumps(params),
+                            QUEUED,
+                            now,
+                            now,
+                        ),
+                    )
+                job = self._job(self._select(conn, "job_id = ?", (job_id,)))
+                conn.execute("COMMIT")
+                return job, True
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def claim(self, lease_s: float = JOB_LEASE_S) -> Optional[tuple[Job, dict]]:
+        """
+        Take the oldest queued job, or a running one whose lease expired,
+        as (job, params). Jobs past JOB_MAX_ATTEMPTS are failed instead.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ? "
+                    "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                    (
+                        FAILED,
+                        "abandoned: its worker stopped too many times",
+                        now,
+                        RUNNING,
+                        now,
+                        JOB_MAX_ATTEMPTS,
+                    ),
+                )
+                row = self._select(
+                    conn,
+                    "status = ? OR (status = ? AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (QUEUED, RUNNING, now),
+                )
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, "
+                    "lease_until = ?, updated_at = ? WHERE job_id = ?",
+                    (RUNNING, now + lease_s, now, row["job_id"]),
+                )
+                job = self._job(self._select(conn, "job_id = ?", (row["job_id"],)))
+                conn.execute("COMMIT")
+                return job, json.loads(row["params"])
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._connect().execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?",
+                (*fields.values(), job_id),
+            )
+
+    def renew(self, job_id: str, progress: dict, lease_s: float = JOB_LEASE_S):
+        self._update(
+            job_id, progress=json.dumps(progress), lease_until=time.time() + lease_s
+        )
+
+    def finish(self, job_id: str, progress: dict, result: Any):
+        self._update(
+            job_id,
+            status=SUCCEEDED,
+            progress=json.dumps(progress),
+            result=json.dumps(jsonable_encoder(result)),
+            lease_until=None,
+        )
+
+    def fail(self, job_id: str, progress: dict, error: str):
+        self._update(
+            job_id,
+            status=FAILED,
+            progress=json.dumps(progress),
+            error=error,
+            lease_until=None,
+        )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._select(self._connect(), "job_id = ?", (job_id,))
+        return self._job(row) if row is not None else None
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+                .fetchall()
+            )
+        return {row[0]: row[1] for row in rows}
+
+
+class JobProgress:
+    """
+    Per-stage progress of a running job: {stage: {"completed", "total"}}.
+    Stages are the metrics stages of the job's LLM calls (chunking, lessons,
+    tests, ...), each finished call counting one; handlers add totals and
+    their own stages with `set`.
+    """
+
+    def __init__(self):
+        self.stages: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def set(
+        self, name: str, completed: Optional[int] = None, total: Optional[int] = None
+    ):
+        with self._lock:
+            entry = self.stages.setdefault(name, {"completed": 0, "total": None})
+            if completed is not None:
+                entry["completed"] = completed
+            if total is not None:
+                entry["total"] = total
+
+    def advance(self, name: str, amount: int = 1):
+        with self._lock:
+            entry = self.stages.setdefault(name, {"completed": 0, "total": None})
+            entry["completed"] += amount
+
+    def on_call(self, record):
+        if record.error != "cancelled":
+            self.advance(record.stage or "other")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: dict(entry) for name, entry in self.stages.items()}
+
+
+current_progress: ContextVar[Optional[JobProgress]] = ContextVar(
+    "current_progress", default=None
+)
+
+
+def report_progress(
+    name: str, completed: Optional[int] = None, total: Optional[int] = None
+):
+    """Update a stage of the running background job; a no-op outside jobs."""
+    progress = current_progress.get()
+    if progress is not None:
+        progress.set(name, completed, total)
+
+
+class JobQueue:
+    """
+    Background jobs run by a pool of async workers in the app process, from
+    a durable SQLite queue. Handlers are registered per kind and called with
+    the job's params; what they return is stored as the job's result.
+    """
+
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS):
+        self.store = store
+        self.workers = workers
+        self.handlers = {}
+        self._tasks = []
+        self._wakeup = None
+
+    def handler(self, kind: str):
+        def register(func):
+            self.handlers[kind] = func
+            return func
+
+        return register
+
+    def submit(
+        self,
+        kind: str,
+        params: dict,
+        course_id: Optional[str] = None,
+        key: str = "",
+        force: bool = False,
+    ) -> Job:
+        if kind not in self.handlers:
+            raise ValueError(f"No handler for job kind {kind}")
+        job, created = self.store.submit(
+            kind, course_id, params, key or input_hash(**params), force
+        )
+        if created:
+            logger.info(f"Queued {kind} job {job.job_id} for course {course_id}")
+            if self._wakeup is not None:
+                self._wakeup.set()
+        return job
+
+    def start(self):
+        if self._tasks or self.workers <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+
+    async def close(self):
+        # running jobs keep their lease and are resumed after the restart
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, index: int):
+        while True:
+            try:
+                claimed = await asyncio.to_thread(self.store.claim)
+            except Exception as e:
+                logger.error(f"Job worker {index} failed to claim a job: {e}")
+                claimed = None
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_S)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job, _ = claimed
+            try:
+                await self._run(*claimed)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # a job must never take its worker down; if it couldn't be
+                # marked failed either, its lease runs out and it is retried
+                logger.exception(
+                    f"Job worker {index} failed running {job.kind} job {job.job_id}"
+                )
+
+    async def _run(self, job: Job, params: dict):
+        logger.info(f"Running {job.kind} job {job.job_id} (attempt {job.attempts})")
+        progress = JobProgress()
+        task = asyncio.create_task(self._call(job, params, progress))
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=JOB_LEASE_S / 3)
+                if not task.done():
+                    try:
+                        await asyncio.to_thread(
+                            self.store.renew, job.job_id, progress.snapshot()
+                        )
+                    except Exception:
+                        logger.exception(
+                            f"Could not renew the lease of job {job.job_id}"
+                        )
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+
+        if task.cancelled():
+            detail = "cancelled"
+            logger.error(f"{job.kind} job {job.job_id} was cancelled")
+        elif (error := task.exception()) is not None:
+            detail = error.detail if isinstance(error, HTTPException) else str(error)
+            logger.error(
+                f"{job.kind} job {job.job_id} failed: {detail}", exc_info=error
+            )
+        else:
+            try:
+                await asyncio.to_thread(
+                    self.store.finish, job.job_id, progress.snapshot(), task.result()
+                )
+                logger.info(f"Finished {job.kind} job {job.job_id}")
+                return
+            except Exception as e:  # e.g. a result that can't be stored as JSON
+                logger.exception(f"Could not store the result of job {job.job_id}")
+                detail = f"could not store the result: {e}"
+        await asyncio.to_thread(
+            self.store.fail, job.job_id, progress.snapshot(), str(detail)
+        )
+
+    async def _call(self, job: Job, params: dict, progress: JobProgress):
+        current_progress.set(progress)
+        listener_var.set(progress.on_call)
+        with metrics_context(course_id=job.course_id):
+            return await self.handlers[job.kind](**params)
+
+    def stats(self) -> dict:
+        return {"workers": len(self._tasks), "jobs": self.store.counts()}
+
+
+job_queue = JobQueue(JobStore())
+
+
+def job_response(job: Job) -> JSONResponse:
+    """202 Accepted with the job, for endpoints that submit background work."""
+    return JSONResponse(status_code=202, content=jsonable_encoder(job))
@@ -2,10 +2,9 @@ from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, AsyncGenerator
-from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage, SystemMessage, AIMessage
 from backend.supabase_client import supabase
-import os
+from backend.genie.llm import stream_chat
+from backend.genie.metrics import metrics_context
 import logging
 from collections import defaultdict
 
@@ -32,16 +31,10 @@ async def get_chunks(course_id: str) -> list:
     return res.data
 
 async def generate_response(messages: List[dict]) -> AsyncGenerator[str, None]:
-    llm = ChatOpenAI(
-        model_name="gpt-4o-mini",
-        temperature=0.7,
-        streaming=True,
-        api_key=os.getenv("OPENAI_API_KEY")
-    )
-
-    async for chunk in llm.astream(messages):
-        if chunk.content:
-            yield chunk.content
+    async for token in stream_chat(
+        model="gpt-4o-mini", messages=messages, temperature=0.7
+    ):
+        yield token
 
 @router.post("/{course_id}/chat")
 async def chat(course_id: str, chat_request: ChatRequest):
@@ -58,7 +51,7 @@ async def chat(course_id: str, chat_request: ChatRequest):
         user_messages = recent_messages[chat_request.user_id]
         
         messages = [
-            SystemMessage(content=f"""
+            {"role": "system", "content": f"""
             You are an AI tutor helping students understand course content.
             Use the following course details and content chunks to answer questions:
 
@@ -71,26 +64,27 @@ async def chat(course_id: str, chat_request: ChatRequest):
             Keep responses focused on course material while maintaining a broad perspective.
             If asked about something outside course scope, relate it back to course content if possible.
             Be concise but informative. Add some emojis and make it more engaging.
-            """),
+            """},
         ]
         
         # Add recent message history
         messages.extend(user_messages)
         
         # Add current message
-        messages.append(HumanMessage(content=chat_request.message))
+        messages.append({"role": "user", "content": chat_request.message})
 
         # Create a wrapper to capture the full response
         full_response = []
         async def event_generator():
-            async for token in generate_response(messages):
-                full_response.append(token)
-                yield f"data: {token}\n\n"
+            with metrics_context(course_id=course_id, stage="chat"):
+                async for token in generate_response(messages):
+                    full_response.append(token)
+                    yield f"data: {token}\n\n"
             yield "data: [DONE]\n\n"
             
             # After generating full response, update the message history
-            user_messages.append(HumanMessage(content=chat_request.message))
-            user_messages.append(AIMessage(content=''.join(full_response)))
+            user_messages.append({"role": "user", "content": chat_request.message})
+            user_messages.append({"role": "assistant", "content": ''.join(full_response)})
             
             # Keep only the last MAX_HISTORY messages
             if len(user_messages) > MAX_HISTORY:
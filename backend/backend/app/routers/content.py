@@ -4,6 +4,8 @@ from backend.supabase_client import supabase
 from typing import Dict, List, Literal
 from backend.genie.utils import ingest_url  # Ensure this import is correct
 from backend.genie.tools import gen_chunks_with_model
+from backend.genie.metrics import metrics_context
+from backend.app.jobs import job_queue, job_response, report_progress, input_hash
 
 router = APIRouter()
 
@@ -30,15 +32,24 @@ async def ingest_source(source: ContentSource):
 
 
 @router.post("/content", status_code=200)
-async def handle_content(user_id: str, data: Content, request: Request):
-    # Process the link and extract content
-    source = ContentSource(type="web_link", source=data.link)
-    content = await ingest_source(source)
+async def handle_content(
+    user_id: str,
+    data: Content,
+    request: Request,
+    background: bool = False,
+    force: bool = False,
+):
+    if background:
+        return job_response(
+            job_queue.submit(
+                "content", {"user_id": user_id, **data.model_dump()}, force=force
+            )
+        )
 
-    # TODO: fix this
+    # An existing course for this link needs no download or processing
     check = (
         supabase.table("courses")
-        .select("*")
+        .select("course_id")
         .eq("source", data.link)
         .eq("author_id", user_id)
         .execute()
@@ -48,6 +59,12 @@ async def handle_content(user_id: str, data: Content, request: Request):
         return check.data[0]["course_id"]
 
     else:
+        # Process the link and extract content
+        report_progress("ingestion", completed=0, total=1)
+        source = ContentSource(type="web_link", source=data.link)
+        content = await ingest_source(source)
+        report_progress("ingestion", completed=1)
+
         # Insert into database
         res = (
             supabase.table("courses")
@@ -88,8 +105,25 @@ class UpdateContent(BaseModel):
 
 @router.put("/update-course/{course_id}", status_code=200)
 async def update_course(
-    course_id: str, user_id: str, data: UpdateContent, request: Request
+    course_id: str,
+    user_id: str,
+    data: UpdateContent,
+    request: Request,
+    background: bool = False,
+    force: bool = False,
 ):
+    if background:
+        params = {"course_id": course_id, "user_id": user_id, **data.model_dump()}
+        return job_response(
+            job_queue.submit(
+                "update_course",
+                params,
+                course_id=course_id,
+                key=input_hash(user_id=user_id, **data.model_dump()),
+                force=force,
+            )
+        )
+
     try:
         # Fetch existing course data
         existing_course = (
@@ -139,7 +173,8 @@ async def update_course(
         markdown = data.markdown if content_changed else existing_markdown
 
         # instructs = supabase.table("instruct").select("title", "summary", "instructions").eq("course_id", course_id).execute()
-        chunks = await gen_chunks_with_model(markdown)
+        with metrics_context(course_id=course_id):
+            chunks = await gen_chunks_with_model(markdown)
 
         # Prepare chunks data
         chunks_data: List[Dict[str, str]] = [
@@ -162,3 +197,14 @@ async def update_course(
     except Exception as e:
         print(f"Error in update_course: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@job_queue.handler("content")
+async def content_job(user_id: str, link: str, name: str):
+    return await handle_content(user_id, Content(link=link, name=name), None)
+
+
+@job_queue.handler("update_course")
+async def update_course_job(course_id: str, user_id: str, name: str, markdown: str):
+    data = UpdateContent(name=name, markdown=markdown)
+    return await update_course(course_id, user_id, data, None)
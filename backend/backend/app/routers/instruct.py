@@ -2,6 +2,8 @@ from fastapi import APIRouter, Request, HTTPException  # noqa
 from backend.supabase_client import supabase
 from backend.genie.tools import gen_instructions_with_model, gen_image_with_model
 from backend.genie.datatypes import InstructionUnit
+from backend.genie.metrics import metrics_context
+from backend.app.jobs import job_queue, job_response, input_hash
 
 router = APIRouter()
 
@@ -74,15 +76,39 @@ async def create_or_update_instruct(
 
 
 @router.post("/generate-instructions/{course_id}", status_code=200)
-async def generate_instructions(course_id: str, user_id: str, request: Request):
+async def generate_instructions(
+    course_id: str,
+    user_id: str,
+    request: Request,
+    background: bool = False,
+    force: bool = False,
+):
     res = (
         supabase.table("courses")
         .select("markdown")
         .eq("course_id", course_id)
         .execute()
     )
+    if background:
+        return job_response(
+            job_queue.submit(
+                "instructions",
+                {"course_id": course_id, "user_id": user_id},
+                course_id=course_id,
+                key=input_hash(markdown=res.data[0]["markdown"]),
+                force=force,
+            )
+        )
 
-    InstructionUnit = await gen_instructions_with_model(res.data[0]["markdown"])
+    with metrics_context(course_id=course_id):
+        InstructionUnit = await gen_instructions_with_model(res.data[0]["markdown"])
+    if InstructionUnit is None:
+        # the model refused or failed on the document (every section of a
+        # long one); also fails the background job with this message
+        raise HTTPException(
+            status_code=500,
+            detail="Could not generate instructions for this course's content",
+        )
 
     check = supabase.table("instruct").select("*").eq("course_id", course_id).execute()
     # change the course title to this title
@@ -116,3 +142,8 @@ async def generate_instructions(course_id: str, user_id: str, request: Request):
         )
         ret = push.data[0]
         return ret
+
+
+@job_queue.handler("instructions")
+async def instructions_job(course_id: str, user_id: str):
+    return await generate_instructions(course_id, user_id, None)
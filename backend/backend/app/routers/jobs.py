@@ -0,0 +1,46 @@
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from backend.app.jobs import job_queue, JOB_POLL_S
+
+router = APIRouter()
+
+
+def get_job_or_404(job_id: str):
+    job = job_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/{job_id}", status_code=200)
+async def get_job(job_id: str):
+    """Status, per-stage progress and, once done, result or error of a job."""
+    return get_job_or_404(job_id)
+
+
+@router.get("/{job_id}/events", status_code=200)
+async def job_events(job_id: str, request: Request):
+    """
+    SSE feed of a job: a `progress` event whenever its status or progress
+    changes, then a final `done` event with the full job, then [DONE].
+    """
+    get_job_or_404(job_id)
+
+    async def event_generator():
+        last = None
+        while not await request.is_disconnected():
+            job = await asyncio.to_thread(job_queue.store.get, job_id)
+            if job.done:
+                yield f"event: done\ndata: {json.dumps(jsonable_encoder(job))}\n\n"
+                break
+            state = {"status": job.status, "progress": job.progress}
+            if state != last:
+                yield f"event: progress\ndata: {json.dumps(state)}\n\n"
+                last = state
+            await asyncio.sleep(JOB_POLL_S)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
@@ -1,9 +1,18 @@
+import asyncio
 import datetime
-from backend.genie.tools import gen_lessons_with_model
+from backend.genie.tools import (
+    gen_lessons_with_model,
+    gen_tests_with_model,
+    gen_lessons_and_tests_with_model,
+)
 from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel
 from backend.supabase_client import supabase
 from backend.genie.datatypes import InstructionUnit
+from backend.app.utils import plan_regeneration, generation_inputs
+from backend.app.jobs import job_queue, job_response, report_progress, input_hash
+from backend.genie.metrics import metrics_context
+from backend.app.routers.test import format_tests, insert_tests
 
 router = APIRouter()
 
@@ -48,8 +57,39 @@ async def delete_lesson(lesson_id: str, user_id: str, request: Request):
     return res.data
 
 
+def format_lessons(
+    course_id: str, chunks: list[dict], lessons: list, hashes: dict
+) -> list[dict]:
+    return [
+        {
+            "course_id": course_id,
+            "chunk_id": chunk["chunk_id"],
+            "title": lesson.title,
+            "subtitle": lesson.subtitle,
+            "bullet_points": lesson.bullet_points,
+            "source_hash": hashes[chunk["chunk_id"]],
+            "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        for chunk, lesson in zip(chunks, lessons)
+        if lesson is not None
+    ]
+
+
 @router.post("/generate-lessons/{course_id}", status_code=200)
-async def generate_lessons(course_id: str, request: Request):
+async def generate_lessons(
+    course_id: str, request: Request, background: bool = False, force: bool = False
+):
+    if background:
+        return job_response(
+            job_queue.submit(
+                "lessons",
+                {"course_id": course_id},
+                course_id=course_id,
+                key=input_hash(**generation_inputs(course_id)),
+                force=force,
+            )
+        )
+
     try:
         # Fetch the chunks for the course
         chunk_res = (
@@ -59,38 +99,6 @@ async def generate_lessons(course_id: str, request: Request):
             return {"error": "No chunks found for this course"}
         chunks = chunk_res.data
 
-        # Get the latest last_modified timestamp among the chunks
-        latest_chunk_modified = max(
-            datetime.datetime.fromisoformat(chunk["last_modified"]) for chunk in chunks
-        )
-
-        # Fetch existing lessons for the course
-        lessons_res = (
-            supabase.table("lessons")
-            .select("generated_at")
-            .eq("course_id", course_id)
-            .execute()
-        )
-        lessons = lessons_res.data
-
-        if lessons:
-            # Get the latest generated_at timestamp among the lessons
-            latest_lesson_generated = max(
-                datetime.datetime.fromisoformat(lesson["generated_at"])
-                for lesson in lessons
-            )
-
-            # Compare timestamps
-            if latest_chunk_modified <= latest_lesson_generated:
-                # Chunks haven't changed since lessons were generated
-                return {"message": "Lessons are up to date"}
-            else:
-                # Chunks have changed, delete existing lessons
-                supabase.table("lessons").delete().eq("course_id", course_id).execute()
-        else:
-            # No lessons exist, proceed to generate
-            pass
-
         # GET INSTRUCTIONS
         _instruct_res = (
             supabase.table("instruct")
@@ -99,25 +107,22 @@ async def generate_lessons(course_id: str, request: Request):
             .execute()
         )
         instruct = InstructionUnit.model_validate(_instruct_res.data[0])
+
+        # Only chunks whose content (or the instructions) changed need new
+        # lessons; stale and orphaned lessons are removed
+        chunks, hashes = plan_regeneration("lessons", course_id, chunks, instruct)
+        if not chunks:
+            return {"message": "Lessons are up to date"}
+        report_progress("lessons", total=len(chunks))
+
         # Generate lessons
-        lessons_data = await gen_lessons_with_model(chunks, instruct)
+        with metrics_context(course_id=course_id):
+            lessons_data = await gen_lessons_with_model(chunks, instruct)
         lessons_list = lessons_data["lessons"]  # Extract the list of lessons
         print(lessons_list)
 
         # Insert the lessons into the database
-        formatted_lessons = []
-        for chunk, lesson in zip(chunks, lessons_list):
-            formatted_lesson = {
-                "course_id": course_id,
-                "chunk_id": chunk["chunk_id"],
-                "title": lesson.title,
-                "subtitle": lesson.subtitle,
-                "bullet_points": lesson.bullet_points,
-                "generated_at": datetime.datetime.now(
-                    datetime.timezone.utc
-                ).isoformat(),
-            }
-            formatted_lessons.append(formatted_lesson)
+        formatted_lessons = format_lessons(course_id, chunks, lessons_list, hashes)
         print(formatted_lessons)
         supabase.table("lessons").insert(formatted_lessons).execute()
 
@@ -126,3 +131,73 @@ async def generate_lessons(course_id: str, request: Request):
     except Exception as e:
         print(f"Error in generate_lessons: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/generate-lessons-and-tests/{course_id}", status_code=200)
+async def generate_lessons_and_tests(course_id: str, request: Request):
+    """
+    Combined mode: chunks missing both their lesson and their tests get them
+    from a single call per chunk. Chunks missing only one of the two fall
+    back to the separate generators for that table.
+    """
+    try:
+        chunk_res = (
+            supabase.table("chunks").select("*").eq("source_id", course_id).execute()
+        )
+        if not chunk_res.data:
+            return {"error": "No chunks found for this course"}
+        chunks = chunk_res.data
+
+        _instruct_res = (
+            supabase.table("instruct")
+            .select("title", "summary", "instructions")
+            .eq("course_id", course_id)
+            .execute()
+        )
+        instruct = InstructionUnit.model_validate(_instruct_res.data[0])
+
+        lesson_chunks, hashes = plan_regeneration(
+            "lessons", course_id, chunks, instruct
+        )
+        test_chunks, _ = plan_regeneration("tests", course_id, chunks, instruct)
+        if not lesson_chunks and not test_chunks:
+            return {"message": "Lessons and tests are up to date"}
+
+        lesson_ids = {chunk["chunk_id"] for chunk in lesson_chunks}
+        test_ids = {chunk["chunk_id"] for chunk in test_chunks}
+        both = [chunk for chunk in lesson_chunks if chunk["chunk_id"] in test_ids]
+        lessons_only = [c for c in lesson_chunks if c["chunk_id"] not in test_ids]
+        tests_only = [c for c in test_chunks if c["chunk_id"] not in lesson_ids]
+
+        with metrics_context(course_id=course_id):
+            joint, lessons_data, tests = await asyncio.gather(
+                gen_lessons_and_tests_with_model(both, instruct),
+                gen_lessons_with_model(lessons_only, instruct),
+                gen_tests_with_model(tests_only, instruct),
+            )
+
+        formatted_lessons = format_lessons(
+            course_id, both, joint["lessons"], hashes
+        ) + format_lessons(course_id, lessons_only, lessons_data["lessons"], hashes)
+        formatted_tests = []
+        for chunk, test in zip(both + tests_only, joint["tests"] + tests):
+            formatted_tests += format_tests(
+                course_id, chunk, test, hashes[chunk["chunk_id"]]
+            )
+
+        if formatted_lessons:
+            supabase.table("lessons").insert(formatted_lessons).execute()
+        insert_tests(formatted_tests)
+
+        return {
+            "message": f"Generated {len(formatted_lessons)} lessons and {len(formatted_tests)} questions"
+        }
+
+    except Exception as e:
+        print(f"Error in generate_lessons_and_tests: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@job_queue.handler("lessons")
+async def lessons_job(course_id: str):
+    return await generate_lessons(course_id, None)
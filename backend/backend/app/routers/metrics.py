@@ -0,0 +1,34 @@
+from fastapi import APIRouter
+from backend.app.jobs import job_queue
+from backend.genie.cache import response_cache, image_cache, ingest_cache
+from backend.genie.hedging import hedger
+from backend.genie.html_utils import html_savings
+from backend.genie.metrics import registry
+from backend.genie.ratelimit import scheduler
+from backend.genie.singleflight import flights
+from backend.genie.workers import parser_pool
+
+router = APIRouter()
+
+
+@router.get("/")
+async def get_metrics():
+    """Token, latency and cost rollups for every LLM call since startup."""
+    return {
+        **registry.summary(),
+        "response_cache": response_cache.stats(),
+        "image_cache": image_cache.stats(),
+        "ingest_cache": ingest_cache.stats(),
+        "scheduler": scheduler.stats(),
+        "hedging": hedger.stats(),
+        "single_flight": flights.stats(),
+        "parsers": parser_pool.stats(),
+        "html": html_savings.stats(),
+        "jobs": job_queue.stats(),
+    }
+
+
+@router.get("/course/{course_id}")
+async def get_course_metrics(course_id: str):
+    """Per-stage cost and latency for one course, with its slowest calls."""
+    return registry.course_summary(course_id)
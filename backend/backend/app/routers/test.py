@@ -1,9 +1,14 @@
 import datetime
+import json
 from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from backend.supabase_client import supabase
-from backend.genie.tools import gen_tests_with_model
+from backend.genie.tools import gen_tests_with_model, stream_tests_with_model
 from backend.genie.datatypes import InstructionUnit
+from backend.app.utils import plan_regeneration, generation_inputs
+from backend.app.jobs import job_queue, job_response, report_progress, input_hash
+from backend.genie.metrics import metrics_context
 
 router = APIRouter()
 
@@ -54,94 +59,164 @@ async def submit_tests(tests: list[Test], user_id: str, request: Request):
     return {"message": "Tests submitted successfully", "tests": tests}
 
 
-@router.post("/generate-tests/{course_id}", status_code=200)
-async def generate_tests(course_id: str, request: Request):
-    try:
-        # Fetch the chunks for the course
-        chunk_res = (
-            supabase.table("chunks").select("*").eq("source_id", course_id).execute()
-        )
-        if not chunk_res.data:
-            return {"error": "No chunks found for this course"}
-        chunks = chunk_res.data
+def format_tests(course_id: str, chunk: dict, test, source_hash: str) -> list[dict]:
+    # Skip any None or invalid test results
+    if not test or not hasattr(test, "questions"):
+        return []
+
+    return [
+        {
+            "course_id": course_id,
+            "chunk_id": chunk["chunk_id"],
+            "test_question": question.question,
+            "correct_option": question.correct_answer,
+            "incorrect_options": question.incorrect_answers,
+            "source_hash": source_hash,
+            "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        for question in test.questions
+    ]
+
+
+def insert_tests(formatted_tests: list[dict], batch_size: int = 50):
+    # Insert in smaller batches if needed
+    for i in range(0, len(formatted_tests), batch_size):
+        batch = formatted_tests[i : i + batch_size]
+        supabase.table("tests").insert(batch).execute()
+
+
+def prepare_test_generation(course_id: str):
+    """
+    Returns (chunks, instructions, hashes) for the chunks whose tests need
+    (re)generating, or a message dict when there is nothing to do. Tests of
+    changed or deleted chunks are removed here.
+    """
+    # Fetch the chunks for the course
+    chunk_res = (
+        supabase.table("chunks").select("*").eq("source_id", course_id).execute()
+    )
+    if not chunk_res.data:
+        return {"error": "No chunks found for this course"}
+    chunks = chunk_res.data
+
+    # GET INSTRUCTIONS
+    _instruct_res = (
+        supabase.table("instruct")
+        .select("title", "summary", "instructions")
+        .eq("course_id", course_id)
+        .execute()
+    )
+    instruct = InstructionUnit.model_validate(_instruct_res.data[0])
 
-        # Get the latest last_modified timestamp among the chunks
-        latest_chunk_modified = max(
-            datetime.datetime.fromisoformat(chunk["last_modified"]) for chunk in chunks
-        )
+    chunks, hashes = plan_regeneration("tests", course_id, chunks, instruct)
+    if not chunks:
+        return {"message": "Tests are up to date"}
+    return chunks, instruct, hashes
 
-        # Fetch existing tests for the course
-        tests_res = (
-            supabase.table("tests")
-            .select("generated_at")
-            .eq("course_id", course_id)
-            .execute()
-        )
-        tests = tests_res.data
 
-        if tests:
-            # Get the latest generated_at timestamp among the tests
-            latest_test_generated = max(
-                datetime.datetime.fromisoformat(test["generated_at"]) for test in tests
+@router.post("/generate-tests/{course_id}", status_code=200)
+async def generate_tests(
+    course_id: str, request: Request, background: bool = False, force: bool = False
+):
+    if background:
+        return job_response(
+            job_queue.submit(
+                "tests",
+                {"course_id": course_id},
+                course_id=course_id,
+                key=input_hash(**generation_inputs(course_id)),
+                force=force,
             )
-
-            # Compare timestamps
-            if latest_chunk_modified <= latest_test_generated:
-                # Chunks haven't changed since tests were generated
-                return {"message": "Tests are up to date"}
-            else:
-                # Chunks have changed, delete existing tests
-                supabase.table("tests").delete().eq("course_id", course_id).execute()
-        else:
-            # No tests exist, proceed to generate
-            pass
-
-        # GET INSTRUCTIONS
-        _instruct_res = (
-            supabase.table("instruct")
-            .select("title", "summary", "instructions")
-            .eq("course_id", course_id)
-            .execute()
         )
-        instruct = InstructionUnit.model_validate(_instruct_res.data[0])
+
+    try:
+        prepared = prepare_test_generation(course_id)
+        if isinstance(prepared, dict):
+            return prepared
+        chunks, instruct, hashes = prepared
+        report_progress("tests", total=len(chunks))
+
         # Generate tests with a max_tokens limit
-        tests = await gen_tests_with_model(
-            chunks, 
-            instruct,
-            max_tokens=4000  # Set a reasonable limit for completion tokens
-        )
+        with metrics_context(course_id=course_id):
+            tests = await gen_tests_with_model(
+                chunks,
+                instruct,
+                max_tokens=4000  # Set a reasonable limit for completion tokens
+            )
 
         # Format and insert tests
         formatted_tests = []
         for chunk, test in zip(chunks, tests):
-            # Skip any None or invalid test results
-            if not test or not hasattr(test, 'questions'):
-                continue
-                
-            for question in test.questions:
-                formatted_test = {
-                    "course_id": course_id,
-                    "chunk_id": chunk["chunk_id"],
-                    "test_question": question.question,
-                    "correct_option": question.correct_answer,
-                    "incorrect_options": question.incorrect_answers,
-                    "generated_at": datetime.datetime.now(
-                        datetime.timezone.utc
-                    ).isoformat(),
-                }
-                formatted_tests.append(formatted_test)
+            formatted_tests += format_tests(
+                course_id, chunk, test, hashes[chunk["chunk_id"]]
+            )
 
         if not formatted_tests:
             return {"message": "No valid tests could be generated"}
 
-        # Insert in smaller batches if needed
-        batch_size = 50
-        for i in range(0, len(formatted_tests), batch_size):
-            batch = formatted_tests[i:i + batch_size]
-            supabase.table("tests").insert(batch).execute()
+        insert_tests(formatted_tests)
 
         return {"message": f"Generated {len(formatted_tests)} test questions"}
 
     except Exception as e:
         print(f"Error in generate_tests: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/generate-tests-stream/{course_id}", status_code=200)
+async def generate_tests_stream(course_id: str, request: Request):
+    """
+    Streaming variant of generate_tests (SSE). Each chunk's questions are
+    persisted and sent as a `questions` event as soon as its completion
+    returns, followed by a `progress` event; the stream ends with [DONE].
+    """
+    try:
+        prepared = prepare_test_generation(course_id)
+    except Exception as e:
+        print(f"Error in generate_tests_stream: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_generator():
+        if isinstance(prepared, dict):
+            yield f"event: message\ndata: {json.dumps(prepared)}\n\n"
+            yield "data: [DONE]\n\n"
+            return
+
+        chunks, instruct, hashes = prepared
+        completed = 0
+        total_questions = 0
+        try:
+            with metrics_context(course_id=course_id):
+                async for index, test in stream_tests_with_model(
+                    chunks, instruct, max_tokens=4000
+                ):
+                    chunk = chunks[index]
+                    formatted_tests = format_tests(
+                        course_id, chunk, test, hashes[chunk["chunk_id"]]
+                    )
+                    insert_tests(formatted_tests)
+                    completed += 1
+                    total_questions += len(formatted_tests)
+
+                    payload = {
+                        "chunk_id": chunk["chunk_id"],
+                        "questions": formatted_tests,
+                    }
+                    yield f"event: questions\ndata: {json.dumps(payload)}\n\n"
+                    progress = {
+                        "completed": completed,
+                        "total": len(chunks),
+                        "questions": total_questions,
+                    }
+                    yield f"event: progress\ndata: {json.dumps(progress)}\n\n"
+        except Exception as e:
+            print(f"Error in generate_tests_stream: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+
+@job_queue.handler("tests")
+async def tests_job(course_id: str):
+    return await generate_tests(course_id, None)
@@ -1,5 +1,9 @@
 from backend.supabase_client import supabase
+from backend.genie.datatypes import InstructionUnit
+from backend.genie.tools import MODEL_DEPLOYED
 from datetime import datetime
+import hashlib
+import json
 
 
 async def is_paid_user(user_id: str | None):
@@ -13,4 +17,76 @@ async def is_paid_user(user_id: str | None):
     if end_at_str is None:
         return False
     end_at_date = datetime.strptime(end_at_str, '%Y-%m-%d')
-    return end_at_date > datetime.today()
\ No newline at end of file
+    return end_at_date > datetime.today()
+
+
+def source_hash(chunk: dict, instructions: InstructionUnit) -> str:
+    """Hash of everything a chunk's lesson/tests are generated from."""
+    payload = json.dumps(
+        {
+            "title": chunk["chunk_title"],
+            "content": chunk["chunk_content"],
+            "instructions": instructions.instructions,
+            "model": MODEL_DEPLOYED,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def generation_inputs(course_id: str) -> dict:
+    """
+    A course's chunks and instructions, as a stable dict: what its lessons
+    and tests are generated from (keys background jobs for idempotency).
+    """
+    chunks = (
+        supabase.table("chunks")
+        .select("chunk_id, chunk_title, chunk_content")
+        .eq("source_id", course_id)
+        .execute()
+    ).data
+    instruct = (
+        supabase.table("instruct")
+        .select("title, summary, instructions")
+        .eq("course_id", course_id)
+        .execute()
+    ).data
+    return {
+        "chunks": sorted(chunks, key=lambda chunk: chunk["chunk_id"]),
+        "instruct": instruct,
+        "model": MODEL_DEPLOYED,
+    }
+
+
+def plan_regeneration(
+    table: str, course_id: str, chunks: list[dict], instructions: InstructionUnit
+):
+    """
+    Incremental regeneration for a per-chunk table (lessons, tests). Rows
+    whose source hash no longer matches their chunk, and rows whose chunk was
+    deleted, are removed. Returns (chunks that need generating, hash per
+    chunk_id); a chunk is up to date when all its rows carry its current hash.
+    """
+    hashes = {chunk["chunk_id"]: source_hash(chunk, instructions) for chunk in chunks}
+
+    rows = (
+        supabase.table(table)
+        .select("chunk_id, source_hash")
+        .eq("course_id", course_id)
+        .execute()
+    ).data
+
+    stale_chunk_ids = {
+        row["chunk_id"]
+        for row in rows
+        if row["chunk_id"] not in hashes
+        or row.get("source_hash") != hashes[row["chunk_id"]]
+    }
+    if stale_chunk_ids:
+        supabase.table(table).delete().eq("course_id", course_id).in_(
+            "chunk_id", list(stale_chunk_ids)
+        ).execute()
+
+    fresh_chunk_ids = {row["chunk_id"] for row in rows} - stale_chunk_ids
+    pending = [chunk for chunk in chunks if chunk["chunk_id"] not in fresh_chunk_ids]
+    return pending, hashes
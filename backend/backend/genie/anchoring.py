@@ -0,0 +1,144 @@
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import NamedTuple
+from fuzzysearch import find_near_matches
+
+NGRAM_SIZE = 8
+MAX_L_DIST = 1
+# how many candidate alignments get a fuzzy check, and how many postings per
+# n-gram are considered when voting for them
+MAX_CANDIDATES = 4
+MAX_POSTINGS = 64
+AFFIX_LEN = 25
+# excerpts are searched for in a window that starts at the previous anchor
+# before falling back to the rest of the document
+SEARCH_WINDOW = 20000
+
+
+class Anchor(NamedTuple):
+    start: int
+    end: int
+
+
+class ExcerptAnchorer:
+    """
+    Locates model-quoted excerpts in a source document.
+
+    Excerpts come back in document order, so each lookup first searches a
+    window that starts at a cursor which only moves forward: an exact match,
+    then a fuzzy scan of that window alone. Only when that fails does it look
+    at the rest of the document, where the excerpt's n-grams vote on likely
+    positions in an n-gram index of the source (built once, on first need)
+    and the fuzzy check runs around the best candidates only.
+    """
+
+    def __init__(self, source: str, ngram_size: int = NGRAM_SIZE):
+        self.source = source
+        self.n = ngram_size
+        self.stride = max(1, ngram_size // 2)
+        self.cursor = 0
+        self._index = None
+
+    @property
+    def index(self) -> dict[str, list[int]]:
+        """n-gram -> sorted source positions, sampled every `stride` chars."""
+        if self._index is None:
+            index = defaultdict(list)
+            source, n = self.source, self.n
+            for i in range(0, len(source) - n + 1, self.stride):
+                index[source[i : i + n]].append(i)
+            self._index = index
+        return self._index
+
+    def _exact(self, needle: str, lo: int, hi: int) -> Anchor | None:
+        pos = self.source.find(needle, lo, hi)
+        if pos == -1:
+            return None
+        return Anchor(pos, pos + len(needle))
+
+    def _scan(self, needle: str, lo: int, hi: int) -> Anchor | None:
+        matches = find_near_matches(needle, self.source[lo:hi], max_l_dist=MAX_L_DIST)
+        if not matches:
+            return None
+        best = min(matches, key=lambda m: (m.dist, m.start))
+        return Anchor(lo + best.start, lo + best.end)
+
+    def _candidates(self, needle: str, lo: int, hi: int) -> list[int]:
+        # the source is sampled every `stride` chars, so the needle is probed
+        # at every offset to line up with whichever positions were indexed
+        votes = Counter()
+        index = self.index
+        for i in range(len(needle) - self.n + 1):
+            postings = index.get(needle[i : i + self.n])
+            if not postings:
+                continue
+            first = bisect_left(postings, lo)
+            for pos in postings[first : first + MAX_POSTINGS]:
+                if pos >= hi:
+                    break
+                votes[pos - i] += 1
+        return [diag for diag, _ in votes.most_common(MAX_CANDIDATES)]
+
+    def _indexed(self, needle: str, lo: int, hi: int) -> Anchor | None:
+        if len(needle) < self.n:
+            return None
+        pad = MAX_L_DIST + self.n
+        for diag in self._candidates(needle, lo, hi):
+            match = self._scan(
+                needle, max(lo, diag - pad), min(hi, diag + len(needle) + pad)
+            )
+            if match is not None:
+                return match
+        return None
+
+    def _find(self, needle: str, lo: int, hi: int, local: bool) -> Anchor | None:
+        fuzzy = self._scan if local else self._indexed
+        return self._exact(needle, lo, hi) or fuzzy(needle, lo, hi)
+
+    def _ranges(self, lo: int):
+        """
+        (lo, hi, local): the window after `lo`, then the rest of the document
+        after it, then the whole document.
+        """
+        size = len(self.source)
+        ranges = [(lo, min(size, lo + SEARCH_WINDOW), True)]
+        if lo + SEARCH_WINDOW < size:
+            ranges.append((lo, size, False))
+        if lo > 0:
+            ranges.append((0, size, False))
+        return ranges
+
+    def find(self, excerpt: str, direction: str, lo: int = 0) -> Anchor | None:
+        """
+        Same contract as tools.get_match: full excerpt first, then its first
+        (direction="start") or last (direction="end") 25 characters.
+        """
+        if not excerpt:
+            return None
+        affix = None
+        if len(excerpt) > AFFIX_LEN:
+            affix = (
+                excerpt[:AFFIX_LEN] if direction == "start" else excerpt[-AFFIX_LEN:]
+            )
+        for start, stop, local in self._ranges(lo):
+            match = self._find(excerpt, start, stop, local)
+            if match is None and affix is not None:
+                match = self._find(affix, start, stop, local)
+            if match is not None:
+                return match
+        return None
+
+    def anchor(self, title: str, start: str, end: str):
+        """
+        Resolve one excerpt to (title, start, end) offsets, or None. Advances
+        the cursor so the next excerpt is searched from here on.
+        """
+        m1 = self.find(start, "start", self.cursor)
+        if m1 is None:
+            return None
+        m2 = self.find(end, "end", m1.start)
+        if m2 is None or m2.end <= m1.start:
+            return None
+        # a match found behind the cursor (an excerpt out of order) leaves it
+        self.cursor = max(self.cursor, m1.start)
+        return (title, m1.start, m2.end)
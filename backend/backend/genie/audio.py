@@ -0,0 +1,235 @@
+import contextvars
+import io
+import logging
+import os
+import re
+import subprocess
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError
+from pydub.silence import detect_silence
+from .llm import transcribe_sync
+from .metrics import metrics_context
+
+logger = logging.getLogger(__name__)
+
+# segment length and the audio shared by neighbouring segments
+SEGMENT_S = float(os.getenv("GENIE_AUDIO_SEGMENT_S", "300"))
+OVERLAP_S = float(os.getenv("GENIE_AUDIO_OVERLAP_S", "5"))
+# cuts are moved to the longest pause within this much before the target
+SILENCE_SEARCH_S = float(os.getenv("GENIE_AUDIO_SILENCE_SEARCH_S", "20"))
+MIN_SILENCE_MS = 300
+# audio past this is not transcribed (0 = no limit)
+MAX_DURATION_S = float(os.getenv("GENIE_AUDIO_MAX_MINUTES", "180")) * 60
+# audio is decoded straight to what whisper uses anyway, 16 kHz mono 16-bit:
+# about 2 MB a minute, so the default limit decodes to ~350 MB and fits the
+# parser workers' memory limit (GENIE_PARSER_MAX_MEMORY_MB) next to the upload
+DECODE_RATE = 16000
+# WAV input is read and downmixed this many seconds at a time
+DECODE_BLOCK_S = 60
+SEGMENT_CONCURRENCY = int(os.getenv("GENIE_AUDIO_CONCURRENCY", "4"))
+SEGMENT_FORMAT = os.getenv("GENIE_AUDIO_SEGMENT_FORMAT", "mp3")
+# how far into each transcript the overlap is looked for, in words
+STITCH_WINDOW_WORDS = 60
+STITCH_MIN_WORDS = 3
+
+
+def find_cut(audio: AudioSegment, target_ms: int, silence_thresh: float) -> int:
+    """
+    A cut point near `target_ms`: the middle of the longest pause (quieter
+    than `silence_thresh` dBFS) in the SILENCE_SEARCH_S before it, or the
+    target itself if there is none.
+    """
+    if silence_thresh == float("-inf"):
+        return target_ms
+    lo = max(0, target_ms - int(SILENCE_SEARCH_S * 1000))
+    silences = detect_silence(
+        audio[lo:target_ms],
+        min_silence_len=MIN_SILENCE_MS,
+        silence_thresh=silence_thresh,
+    )
+    if not silences:
+        return target_ms
+    # longest pause, the later one on ties so segments stay near full length
+    start, end = max(silences, key=lambda s: (s[1] - s[0], s[0]))
+    return lo + (start + end) // 2
+
+
+def plan_segments(audio: AudioSegment) -> list[tuple[int, int]]:
+    """(start_ms, end_ms) segments covering `audio`, overlapping by OVERLAP_S."""
+    total = len(audio)
+    segment_ms = int(SEGMENT_S * 1000)
+    overlap_ms = int(OVERLAP_S * 1000)
+    # loudness of the whole recording: one pass over it, not one per cut
+    silence_thresh = audio.dBFS - 16
+    segments, start = [], 0
+    while True:
+        if total - start <= segment_ms:
+            segments.append((start, total))
+            return segments
+        end = find_cut(audio, start + segment_ms, silence_thresh)
+        if end - start <= overlap_ms:
+            end = start + segment_ms
+        segments.append((start, end))
+        start = end - overlap_ms
+
+
+def _words(text: str) -> list[str]:
+    return [re.sub(r"\W+", "", w).lower() for w in text.split()]
+
+
+def stitch(left: str, right: str) -> str:
+    """
+    Join two transcripts of overlapping audio. The longest run of words the
+    end of `left` shares with the start of `right` is the overlap; `right` is
+    appended from the end of that run. Without a credible run they are
+    simply concatenated.
+    """
+    left_words, right_words = left.split(), right.split()
+    tail = max(0, len(left_words) - STITCH_WINDOW_WORDS)
+    head = min(len(right_words), STITCH_WINDOW_WORDS)
+    matcher = SequenceMatcher(
+        None,
+        _words(" ".join(left_words[tail:])),
+        _words(" ".join(right_words[:head])),
+        autojunk=False,
+    )
+    match = matcher.find_longest_match()
+    if match.size < STITCH_MIN_WORDS:
+        return " ".join(left_words + right_words)
+    cut_left = tail + match.a + match.size
+    cut_right = match.b + match.size
+    return " ".join(left_words[:cut_left] + right_words[cut_right:])
+
+
+def sniff_audio_format(content: bytes):
+    """Formats pydub decodes without ffmpeg; None lets ffmpeg probe."""
+    if content[:4] == b"RIFF" and content[8:12] == b"WAVE":
+        return "wav"
+    return None
+
+
+def _for_speech(audio: AudioSegment) -> AudioSegment:
+    return audio.set_channels(1).set_frame_rate(DECODE_RATE).set_sample_width(2)
+
+
+def _decode_wav(content: bytes) -> AudioSegment:
+    """16 kHz mono of a PCM WAV, downmixed a block at a time."""
+    with wave.open(io.BytesIO(content)) as wav:
+        rate, channels, width = (
+            wav.getframerate(),
+            wav.getnchannels(),
+            wav.getsampwidth(),
+        )
+        if width == 1:  # unsigned samples; pydub knows how to read those
+            return _for_speech(AudioSegment.from_file(io.BytesIO(content), "wav"))
+        remaining = wav.getnframes()
+        if MAX_DURATION_S:
+            remaining = min(remaining, int(MAX_DURATION_S * rate))
+        blocks = []
+        while remaining > 0:
+            data = wav.readframes(min(remaining, DECODE_BLOCK_S * rate))
+            if not data:
+                break
+            remaining -= len(data) // (width * channels)
+            block = AudioSegment(
+                data=data, sample_width=width, frame_rate=rate, channels=channels
+            )
+            blocks.append(_for_speech(block).raw_data)
+    return AudioSegment(
+        data=b"".join(blocks), sample_width=2, frame_rate=DECODE_RATE, channels=1
+    )
+
+
+def _decode_ffmpeg(content: bytes) -> AudioSegment:
+    """16 kHz mono of anything ffmpeg reads, resampled by ffmpeg itself."""
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0", "-vn"]
+    if MAX_DURATION_S:
+        command += ["-t", str(MAX_DURATION_S)]
+    command += ["-ac", "1", "-ar", str(DECODE_RATE), "-f", "s16le", "pipe:1"]
+    result = subprocess.run(command, input=content, capture_output=True, check=False)
+    if result.returncode != 0 or not result.stdout:
+        raise CouldntDecodeError(
+            f"Decoding failed: {result.stderr.decode(errors='ignore').strip()}"
+        )
+    return AudioSegment(
+        data=result.stdout, sample_width=2, frame_rate=DECODE_RATE, channels=1
+    )
+
+
+def decode_audio(content: bytes) -> AudioSegment:
+    """
+    `content` (up to MAX_DURATION_S) as 16 kHz mono. The full-rate audio is
+    never held in memory: a 90 minute 44.1 kHz stereo recording would be
+    ~950 MB decoded, 170 MB like this.
+    """
+    if sniff_audio_format(content) != "wav":
+        return _decode_ffmpeg(content)
+    try:
+        return _decode_wav(content)
+    except wave.Error:  # e.g. float samples, which the wave module can't read
+        audio = AudioSegment.from_file(io.BytesIO(content), "wav")
+    if MAX_DURATION_S:
+        audio = audio[: int(MAX_DURATION_S * 1000)]
+    return _for_speech(audio)
+
+
+def segment_audio(content: bytes) -> list[tuple[int, int, bytes]]:
+    """
+    The CPU-bound half of transcribe_audio: decode (up to MAX_DURATION_S),
+    split into overlapping segments at pauses and encode each one, as
+    (start_ms, end_ms, encoded bytes).
+    """
+    audio = decode_audio(content)
+    if MAX_DURATION_S and len(audio) >= MAX_DURATION_S * 1000:
+        logger.warning(
+            f"Audio transcribed up to the {MAX_DURATION_S / 60:.0f} minute limit only"
+        )
+
+    segments = []
+    for start, end in plan_segments(audio):
+        buffer = io.BytesIO()
+        audio[start:end].export(buffer, format=SEGMENT_FORMAT)
+        segments.append((start, end, buffer.getvalue()))
+    logger.info(
+        f"Split {len(audio) / 1000:.0f}s of audio into {len(segments)} segments"
+    )
+    return segments
+
+
+def transcribe_segment(start: int, end: int, data: bytes) -> str:
+    with metrics_context(stage="transcription", item=f"{start // 1000}-{end // 1000}s"):
+        return transcribe_sync(
+            data,
+            f"segment.{SEGMENT_FORMAT}",
+            model="whisper-1",
+            duration_s=(end - start) / 1000,
+        )
+
+
+def transcribe_segments(segments: list[tuple[int, int, bytes]]) -> str:
+    """
+    The model-bound half of transcribe_audio: transcribe the segments
+    concurrently and stitch the transcripts.
+    """
+    with ThreadPoolExecutor(max_workers=SEGMENT_CONCURRENCY) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, transcribe_segment, *s)
+            for s in segments
+        ]
+        transcripts = [future.result() for future in futures]
+
+    text = transcripts[0] if transcripts else ""
+    for transcript in transcripts[1:]:
+        text = stitch(text, transcript)
+    return text
+
+
+def transcribe_audio(content: bytes) -> str:
+    """
+    Decode audio (up to MAX_DURATION_S), split it into overlapping segments
+    at pauses, transcribe them concurrently and stitch the transcripts.
+    """
+    return transcribe_segments(segment_audio(content))
@@ -0,0 +1,285 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.getenv("GENIE_CACHE_ENABLED", "1") not in ("0", "false", "False")
+CACHE_DIR = os.getenv(
+    "GENIE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "genie-cache")
+)
+CACHE_MAX_BYTES = int(float(os.getenv("GENIE_CACHE_MAX_MB", "512")) * 1024 * 1024)
+CACHE_TTL = float(os.getenv("GENIE_CACHE_TTL", "0")) or None  # seconds, 0 = forever
+IMAGE_CACHE_MAX_BYTES = int(
+    float(os.getenv("GENIE_IMAGE_CACHE_MAX_MB", "64")) * 1024 * 1024
+)
+INGEST_CACHE_MAX_BYTES = int(
+    float(os.getenv("GENIE_INGEST_CACHE_MAX_MB", "256")) * 1024 * 1024
+)
+# sources that can't be revalidated (YouTube, Drive) are reused for this long
+INGEST_MAX_AGE_S = float(os.getenv("GENIE_INGEST_MAX_AGE_S", "86400"))
+
+
+class ResponseCache:
+    """
+    Content-addressed key/value store on top of SQLite.
+
+    Entries are bounded by total payload size and evicted least recently
+    used first. An optional TTL expires entries on read.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = CACHE_MAX_BYTES,
+        ttl: Optional[float] = CACHE_TTL,
+        enabled: bool = True,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @staticmethod
+    def make_key(**request) -> str:
+        """Hash the full request (model, messages, schema, params) into a key."""
+        payload = json.dumps(request, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed_at)"
+            )
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str):
+        if not self.enabled:
+            return
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at ASC"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        logger.info(f"Evicted {len(evicted)} entries from cache {self.path}")
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM entries")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = (
+                self._connect()
+                .execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries")
+                .fetchone()
+            )
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class ImageDescriptionCache(ResponseCache):
+    """
+    Image descriptions keyed by a hash of the decoded pixels. Entries can
+    also carry a 64-bit perceptual hash, so a near-identical image (re-saved,
+    recompressed, slightly resized) can reuse a description via get_near.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.near_hits = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = super()._connect()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS phashes (key TEXT PRIMARY KEY, phash TEXT NOT NULL)"
+            )
+        return self._conn
+
+    def set(self, key: str, value: str, phash: Optional[int] = None):
+        super().set(key, value)
+        if not self.enabled or phash is None:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO phashes VALUES (?, ?)", (key, f"{phash:016x}")
+            )
+            # drop hashes whose entries were evicted
+            conn.execute(
+                "DELETE FROM phashes WHERE key NOT IN (SELECT key FROM entries)"
+            )
+
+    def get_near(self, phash: int, max_distance: int) -> Optional[str]:
+        """Description of the closest stored image within `max_distance` bits."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            rows = self._connect().execute("SELECT key, phash FROM phashes").fetchall()
+        best = None
+        for key, stored in rows:
+            distance = (int(stored, 16) ^ phash).bit_count()
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, key)
+        if best is None:
+            return None
+        value = self.get(best[1])
+        if value is not None:
+            # get() counted the lookup as a hit; it was really a near hit
+            self.hits -= 1
+            self.near_hits += 1
+        return value
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        lookups = self.hits + self.misses
+        stats["near_hits"] = self.near_hits
+        stats["hit_rate"] = (self.hits + self.near_hits) / lookups if lookups else 0.0
+        return stats
+
+
+class IngestionCache(ResponseCache):
+    """
+    Processed markdown per source URL, stored with the validators needed to
+    revalidate it: ETag, Last-Modified and a hash of the raw body.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.revalidated = 0
+
+    def lookup(self, url: str) -> Optional[dict]:
+        value = self.get(self.make_key(url=url))
+        return json.loads(value) if value is not None else None
+
+    def store(
+        self,
+        url: str,
+        markdown: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        content_hash: Optional[str] = None,
+    ):
+        entry = {
+            "markdown": markdown,
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_hash": content_hash,
+            "stored_at": time.time(),
+        }
+        self.set(self.make_key(url=url), json.dumps(entry))
+
+    def fresh(self, url: str, max_age: float = INGEST_MAX_AGE_S) -> Optional[str]:
+        """Markdown stored for `url` less than `max_age` seconds ago."""
+        entry = self.lookup(url)
+        if entry is None or time.time() - entry["stored_at"] > max_age:
+            return None
+        return entry["markdown"]
+
+    @staticmethod
+    def conditional_headers(entry: Optional[dict]) -> dict:
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def stats(self) -> dict:
+        return {**super().stats(), "revalidated": self.revalidated}
+
+
+response_cache = ResponseCache(
+    os.path.join(CACHE_DIR, "responses.sqlite3"), enabled=CACHE_ENABLED
+)
+image_cache = ImageDescriptionCache(
+    os.path.join(CACHE_DIR, "images.sqlite3"),
+    max_bytes=IMAGE_CACHE_MAX_BYTES,
+    enabled=CACHE_ENABLED,
+)
+ingest_cache = IngestionCache(
+    os.path.join(CACHE_DIR, "ingest.sqlite3"),
+    max_bytes=INGEST_CACHE_MAX_BYTES,
+    enabled=CACHE_ENABLED,
+)
+
+
+def cached_parse_key(response_format, **params) -> str:
+    """Cache key for a structured-output completion request."""
+    return ResponseCache.make_key(
+        response_format=response_format.model_json_schema(), **params
+    )
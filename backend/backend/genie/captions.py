@@ -0,0 +1,199 @@
+import html
+import json
+import logging
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+from typing import Optional
+import yt_dlp
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# use a video's subtitles when it has them; 0 always transcribes the audio
+YOUTUBE_CAPTIONS = os.getenv("GENIE_YOUTUBE_CAPTIONS", "1") == "1"
+# caption languages in order of preference; the video's own language follows
+CAPTION_LANGUAGES = [
+    lang.strip().lower()
+    for lang in os.getenv("GENIE_CAPTION_LANGUAGES", "en").split(",")
+    if lang.strip()
+]
+# a timestamped paragraph starts at the first cue after this many seconds
+CAPTION_PARAGRAPH_S = float(os.getenv("GENIE_CAPTION_PARAGRAPH_S", "60"))
+# subtitle formats yt-dlp offers for YouTube, most convenient first
+CAPTION_FORMATS = ("json3", "srv3", "vtt")
+
+VTT_TIMING = re.compile(
+    r"^((?:\d+:)?\d{1,2}:\d{2}\.\d{3})\s+-->\s+((?:\d+:)?\d{1,2}:\d{2}\.\d{3})"
+)
+VTT_TAG = re.compile(r"<[^>]*>")
+
+
+class CaptionTrack(BaseModel):
+    kind: str  # manual | auto
+    language: str
+    ext: str
+    url: str
+
+
+class Cue(BaseModel):
+    start: float
+    end: float
+    text: str
+
+
+def fetch_video_info(url: str) -> dict:
+    """yt-dlp's metadata for a video, subtitle tracks included; downloads nothing."""
+    options = {"skip_download": True, "quiet": True, "no_warnings": True}
+    with yt_dlp.YoutubeDL(options) as ydl:
+        return ydl.sanitize_info(ydl.extract_info(url, download=False))
+
+
+def _matches(key: str, language: str) -> bool:
+    key = key.lower()
+    return key == language or key.split("-")[0] == language
+
+
+def pick_caption_track(
+    info: dict, languages: list[str] = CAPTION_LANGUAGES
+) -> Optional[CaptionTrack]:
+    """
+    The best subtitle track of a video: uploaded subtitles before YouTube's
+    automatic ones, then by language preference (the video's own language
+    after `languages`), then by format. None if the video has no captions.
+    """
+    video_language = (info.get("language") or "").lower()
+    wanted = list(
+        dict.fromkeys(languages + ([video_language] if video_language else []))
+    )
+    sources = (
+        ("manual", info.get("subtitles") or {}),
+        ("auto", info.get("automatic_captions") or {}),
+    )
+    for kind, tracks in sources:
+        for language in wanted:
+            # automatic tracks come translated into every language; prefer
+            # the untranslated one ("en-orig") when there is one
+            keys = sorted(
+                (
+                    key
+                    for key in tracks
+                    if key != "live_chat" and _matches(key, language)
+                ),
+                key=lambda key: (not key.endswith("-orig"), key != language, key),
+            )
+            for key in keys:
+                formats = {f.get("ext"): f for f in tracks[key] if f.get("url")}
+                for ext in CAPTION_FORMATS:
+                    if ext in formats:
+                        return CaptionTrack(
+                            kind=kind, language=key, ext=ext, url=formats[ext]["url"]
+                        )
+    return None
+
+
+def parse_json3(content: bytes) -> list[Cue]:
+    """Cues of a YouTube json3 subtitle file."""
+    cues = []
+    for event in json.loads(content).get("events", []):
+        text = "".join(seg.get("utf8", "") for seg in event.get("segs") or [])
+        text = " ".join(text.split())
+        if not text:
+            continue  # styling and line-append events
+        start = event.get("tStartMs", 0) / 1000
+        cues.append(
+            Cue(start=start, end=start + event.get("dDurationMs", 0) / 1000, text=text)
+        )
+    return cues
+
+
+def parse_srv3(content: bytes) -> list[Cue]:
+    """Cues of a YouTube srv3 (timedtext XML) subtitle file."""
+    try:
+        root = ElementTree.fromstring(content)
+    except ElementTree.ParseError as e:  # a SyntaxError, not a ValueError
+        raise ValueError(f"Malformed srv3 captions: {e}") from e
+    cues = []
+    for p in root.iter("p"):
+        text = " ".join("".join(p.itertext()).split())
+        if not text:
+            continue
+        start = int(p.get("t", 0)) / 1000
+        cues.append(Cue(start=start, end=start + int(p.get("d", 0)) / 1000, text=text))
+    return cues
+
+
+def _seconds(timestamp: str) -> float:
+    seconds = 0.0
+    for part in timestamp.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def parse_vtt(content: bytes) -> list[Cue]:
+    """
+    Cues of a WebVTT file. YouTube's automatic captions roll: each cue
+    repeats the line before it, so lines already seen in the previous cue
+    are dropped.
+    """
+    cues, previous = [], set()
+    # cues end at an empty line; YouTube puts lines of one space inside cues
+    text = content.decode("utf-8-sig").replace("\r", "")
+    for block in re.split(r"\n\n+", text):
+        lines = block.strip().split("\n")
+        timing = next(
+            (i for i, line in enumerate(lines) if VTT_TIMING.match(line)), None
+        )
+        if timing is None:
+            continue  # header, NOTE or STYLE block
+        start, end = VTT_TIMING.match(lines[timing]).groups()
+        texts = [
+            " ".join(html.unescape(VTT_TAG.sub("", line)).split())
+            for line in lines[timing + 1 :]
+        ]
+        texts = [text for text in texts if text]
+        new = [text for text in texts if text not in previous]
+        if texts:
+            previous = set(texts)
+        if new:
+            cues.append(
+                Cue(start=_seconds(start), end=_seconds(end), text=" ".join(new))
+            )
+    return cues
+
+
+def parse_captions(ext: str, content: bytes) -> list[Cue]:
+    match ext:
+        case "json3":
+            return parse_json3(content)
+        case "srv3":
+            return parse_srv3(content)
+        case "vtt":
+            return parse_vtt(content)
+        case _:
+            raise ValueError(f"Unsupported caption format: {ext}")
+
+
+def format_timestamp(seconds: float) -> str:
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+
+def captions_to_markdown(
+    cues: list[Cue], title: str = "", paragraph_s: float = CAPTION_PARAGRAPH_S
+) -> str:
+    """Cues as markdown paragraphs of about `paragraph_s`, each led by its start time."""
+    paragraphs, current, started = [], [], 0.0
+    for cue in cues:
+        if current and cue.start - started >= paragraph_s:
+            paragraphs.append(f"**[{format_timestamp(started)}]** " + " ".join(current))
+            current = []
+        if not current:
+            started = cue.start
+        current.append(cue.text)
+    if current:
+        paragraphs.append(f"**[{format_timestamp(started)}]** " + " ".join(current))
+    if title:
+        paragraphs.insert(0, f"# {title}")
+    return "\n\n".join(paragraphs)
@@ -0,0 +1,101 @@
+import os
+from functools import lru_cache
+import tiktoken
+from .datatypes import TextWindow
+
+# token budget per excerpt-extraction call and overlap between windows
+WINDOW_TOKENS = int(os.getenv("GENIE_CHUNK_WINDOW_TOKENS", "6000"))
+WINDOW_OVERLAP_TOKENS = int(os.getenv("GENIE_CHUNK_OVERLAP_TOKENS", "300"))
+
+
+@lru_cache(maxsize=8)
+def get_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str) -> int:
+    return len(get_encoding(model).encode(text, disallowed_special=()))
+
+
+def _snap_to_break(text: str, start: int, end: int) -> int:
+    """
+    Move a window end back to the nearest paragraph (or line) break in its
+    last quarter so windows don't cut sentences in half where avoidable.
+    """
+    floor = start + (end - start) * 3 // 4
+    for sep in ("\n\n", "\n"):
+        pos = text.rfind(sep, floor, end)
+        if pos != -1:
+            return pos + len(sep)
+    return end
+
+
+def split_into_windows(
+    text: str,
+    model: str,
+    max_tokens: int = WINDOW_TOKENS,
+    overlap_tokens: int = WINDOW_OVERLAP_TOKENS,
+) -> list[TextWindow]:
+    """
+    Split `text` into overlapping windows of at most `max_tokens` tokens.
+    Window offsets index into the original string.
+    """
+    enc = get_encoding(model)
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return [TextWindow(start=0, end=len(text), text=text)]
+
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    _, offsets = enc.decode_with_offsets(tokens)
+
+    windows = []
+    tok = 0
+    while tok < len(tokens):
+        tok_end = min(tok + max_tokens, len(tokens))
+        start = offsets[tok]
+        if tok_end == len(tokens):
+            end = len(text)
+        else:
+            end = _snap_to_break(text, start, offsets[tok_end])
+        windows.append(TextWindow(start=start, end=end, text=text[start:end]))
+        if end == len(text):
+            break
+
+        # next window starts `overlap_tokens` before this one's end
+        next_tok = tok
+        while next_tok < len(tokens) and offsets[next_tok] < end:
+            next_tok += 1
+        tok = max(tok + 1, next_tok - overlap_tokens)
+
+    return windows
+
+
+def merge_spans(spans: list[tuple[str, int, int]]) -> list[tuple[str, int, int]]:
+    """
+    Merge (title, start, end) spans found in overlapping windows into one
+    ordered, non-overlapping list. A span that mostly repeats the previous one
+    (the same section seen from two windows) keeps whichever is longer; a
+    partial overlap is trimmed so each character belongs to one chunk.
+    """
+    merged = []
+    for title, start, end in sorted(spans, key=lambda s: (s[1], -s[2])):
+        if end <= start:
+            continue
+        if not merged:
+            merged.append((title, start, end))
+            continue
+
+        prev_title, prev_start, prev_end = merged[-1]
+        overlap = prev_end - start
+        if overlap <= 0:
+            merged.append((title, start, end))
+        elif overlap * 2 >= min(end - start, prev_end - prev_start):
+            keep_title = title if end - start > prev_end - prev_start else prev_title
+            merged[-1] = (keep_title, prev_start, max(end, prev_end))
+        elif end > prev_end:
+            merged.append((title, prev_end, end))
+
+    return merged
@@ -17,11 +17,11 @@ class InstructionUnit(BaseModel):
     # tags: list[str]
 
 
-# class ReportUnit(BaseModel):
-#     summary: str
-#     tags: list[str]
-#     key_insights: list[str]
-#     testable_questions: list[str]
+class ReportUnit(BaseModel):
+    summary: str
+    tags: list[str]
+    key_insights: list[str]
+    testable_questions: list[str]
 
 
 # ingest types
@@ -45,6 +45,12 @@ class ExcerptData(BaseModel):
     excerpts: list[ExcerptItem]
 
 
+class TextWindow(BaseModel):
+    start: int
+    end: int
+    text: str
+
+
 # chunk types
 class ContentChunk(BaseModel):
     title: str
@@ -102,6 +108,13 @@ class SaveTestsRequest(BaseModel):
     edited: list[TestItem]
 
 
+class LessonWithTest(BaseModel):
+    """Lesson and test for one chunk, generated in a single call."""
+
+    lesson: Lesson
+    test: TestItem
+
+
 # graph gen types
 class LessonGraphNode(BaseModel):
     title: str
@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import importlib.util
+import logging
+import os
+import tempfile
+from collections import defaultdict
+from urllib.parse import urlparse
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("GENIE_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("GENIE_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_S = float(os.getenv("GENIE_HTTP_KEEPALIVE_S", "30"))
+# concurrent requests to any one host, so one big ingest can't hog a site
+HTTP_MAX_PER_HOST = int(os.getenv("GENIE_HTTP_MAX_PER_HOST", "8"))
+HTTP_CONNECT_TIMEOUT_S = float(os.getenv("GENIE_HTTP_CONNECT_TIMEOUT_S", "10"))
+HTTP_READ_TIMEOUT_S = float(os.getenv("GENIE_HTTP_READ_TIMEOUT_S", "60"))
+# HTTP/2 needs the optional h2 package
+HTTP2_ENABLED = os.getenv("GENIE_HTTP2", "1") not in ("0", "false", "False")
+HTTP_USER_AGENT = os.getenv("GENIE_HTTP_USER_AGENT", "genie-ingest/1.0")
+# downloads are refused past this size, which is what bounds an ingestion's
+# memory: parsers take the whole body as bytes. Bodies past SPOOL_MAX are
+# written to a temp file while they download
+MAX_DOWNLOAD_BYTES = int(float(os.getenv("GENIE_MAX_DOWNLOAD_MB", "200")) * 1024 * 1024)
+SPOOL_MAX_BYTES = int(float(os.getenv("GENIE_SPOOL_MAX_MB", "8")) * 1024 * 1024)
+
+
+class DownloadTooLarge(ValueError):
+    pass
+
+
+class Download:
+    """
+    A fetched body, spooled to a temp file once it outgrows SPOOL_MAX_BYTES.
+    Holds the final URL, status and headers of the response, and a sha256 of
+    the body. A 304 Not Modified has an empty body.
+
+    Spooling only keeps the body off the heap while it downloads: read()
+    returns all of it, as the parsers (and the pickling into the parser
+    pool) need, so MAX_DOWNLOAD_BYTES is the actual memory limit.
+    """
+
+    def __init__(self, url: str, status_code: int, headers: httpx.Headers):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.size = 0
+        self.hash = hashlib.sha256()
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get("Content-Type", "text/html")
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == 304
+
+    @property
+    def content_hash(self) -> str:
+        return self.hash.hexdigest()
+
+    def read(self) -> bytes:
+        """The whole body, in memory."""
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HttpPool:
+    """
+    One httpx.AsyncClient for the life of the app, so ingestion reuses
+    connections (and TLS sessions) instead of handshaking on every fetch.
+    Started and closed by the FastAPI lifespan; used outside it (scripts,
+    benchmarks) the client is created on first use.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._hosts = defaultdict(lambda: asyncio.Semaphore(HTTP_MAX_PER_HOST))
+
+    def _make_client(self) -> httpx.AsyncClient:
+        http2 = HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+        return httpx.AsyncClient(
+            http2=http2,
+            follow_redirects=True,
+            headers={"User-Agent": HTTP_USER_AGENT},
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_S,
+            ),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT_S, connect=HTTP_CONNECT_TIMEOUT_S),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self._make_client()
+        return self._client
+
+    async def start(self):
+        self.client
+        logger.info("HTTP client pool started")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._hosts.clear()
+
+    async def fetch(
+        self, url: str, max_bytes: int = MAX_DOWNLOAD_BYTES, **kwargs
+    ) -> Download:
+        """
+        GET `url`, streaming the body into a Download. Raises for error
+        statuses, and DownloadTooLarge once the body passes `max_bytes`
+        (up front if Content-Length already says so). A 304 answer to a
+        conditional request comes back as a Download rather than an error.
+        """
+        async with self._hosts[urlparse(url).netloc.lower()]:
+            async with self.client.stream("GET", url, **kwargs) as response:
+                if response.status_code != 304:
+                    response.raise_for_status()
+                length = response.headers.get("Content-Length")
+                if length and length.isdigit() and int(length) > max_bytes:
+                    raise DownloadTooLarge(
+                        f"{url} is {int(length)} bytes, over the {max_bytes} byte limit"
+                    )
+                download = Download(
+                    str(response.url), response.status_code, response.headers
+                )
+                try:
+                    async for chunk in response.aiter_bytes():
+                        download.size += len(chunk)
+                        if download.size > max_bytes:
+                            raise DownloadTooLarge(
+                                f"{url} is over the {max_bytes} byte limit"
+                            )
+                        download.hash.update(chunk)
+                        download.file.write(chunk)
+                except BaseException:
+                    download.close()
+                    raise
+                return download
+
+
+http_pool = HttpPool()
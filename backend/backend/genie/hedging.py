@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Optional
+from .llm import parse_completion
+from .metrics import listener_var
+from .ratelimit import scheduler
+
+logger = logging.getLogger(__name__)
+
+HEDGE_ENABLED = os.getenv("GENIE_HEDGE_ENABLED", "0") in ("1", "true", "True")
+# fire the backup once the primary is slower than this share of recent calls
+HEDGE_PERCENTILE = float(os.getenv("GENIE_HEDGE_PERCENTILE", "0.95"))
+# model for the backup request; empty means the primary's model
+HEDGE_MODEL = os.getenv("GENIE_HEDGE_MODEL", "")
+HEDGE_MIN_SAMPLES = int(os.getenv("GENIE_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_S = float(os.getenv("GENIE_HEDGE_MIN_DELAY_S", "1.0"))
+# never hedge more than this fraction of calls, so a slow API isn't doubled
+HEDGE_MAX_RATE = float(os.getenv("GENIE_HEDGE_MAX_RATE", "0.1"))
+LATENCY_WINDOW = 200
+
+
+class Hedger:
+    """
+    Hedged structured-output completions. Recent primary latencies are kept
+    per (model, response format); once a primary call outlives the configured
+    percentile of them, a backup request goes out and whichever valid parsed
+    result lands first wins, the other is cancelled.
+    """
+
+    def __init__(
+        self,
+        percentile: float = HEDGE_PERCENTILE,
+        hedge_model: str = HEDGE_MODEL,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+        min_delay_s: float = HEDGE_MIN_DELAY_S,
+        max_rate: float = HEDGE_MAX_RATE,
+    ):
+        self.percentile = percentile
+        self.hedge_model = hedge_model
+        self.min_samples = min_samples
+        self.min_delay_s = min_delay_s
+        self.max_rate = max_rate
+        self._latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.saved_s = 0.0
+
+    def _observe(self, key, latency: float):
+        with self._lock:
+            self._latencies[key].append(latency)
+
+    def delay(self, key) -> Optional[float]:
+        """Seconds to wait before hedging, or None if there's no basis yet."""
+        with self._lock:
+            samples = sorted(self._latencies[key])
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(self.percentile * len(samples)))
+        return max(self.min_delay_s, samples[index])
+
+    def _estimated_saving(self, key, elapsed: float) -> float:
+        """
+        The cancelled primary's latency is unknown, so estimate it as the mean
+        of recent latencies longer than the time it had already taken.
+        """
+        with self._lock:
+            slower = [s for s in self._latencies[key] if s > elapsed]
+        if not slower:
+            return 0.0
+        return sum(slower) / len(slower) - elapsed
+
+    def _may_hedge(self, model: str) -> bool:
+        if self.calls and self.hedged / self.calls >= self.max_rate:
+            return False
+        # the scheduler is backing off from throttling: a second request
+        # would only deepen the queue
+        concurrency = scheduler.concurrency(model)
+        return concurrency.limit >= concurrency.maximum
+
+    @staticmethod
+    def _start(response_format, params: dict, records: list) -> asyncio.Task:
+        """parse_completion as a task whose call records land in `records`."""
+        outer = listener_var.get()
+
+        def listen(record):
+            records.append(record)
+            if outer is not None:
+                outer(record)
+
+        token = listener_var.set(listen)
+        try:
+            # the task copies the context, listener included
+            return asyncio.create_task(parse_completion(response_format, **params))
+        finally:
+            listener_var.reset(token)
+
+    async def parse(self, response_format, **params):
+        model = params.get("model", "")
+        key = (model, response_format.__name__)
+        self.calls += 1
+        started = time.perf_counter()
+        records = []
+        primary = self._start(response_format, params, records)
+
+        delay = self.delay(key)
+        if delay is not None:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        if delay is None or done or not self._may_hedge(model):
+            result = await primary
+            # a cache hit says nothing about upstream latency
+            if not any(record.cached for record in records):
+                self._observe(key, time.perf_counter() - started)
+            return result
+
+        self.hedged += 1
+        hedge_params = {**params, "model": self.hedge_model or model}
+        backup = asyncio.create_task(parse_completion(response_format, **hedge_params))
+        pending = {primary, backup}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                # both can finish together, and an error or empty parse from
+                # one side must not hide a result from the other
+                for task in (primary, backup):
+                    if task not in done or task.exception() or task.result() is None:
+                        continue
+                    elapsed = time.perf_counter() - started
+                    if task is primary:
+                        self._observe(key, elapsed)
+                    else:
+                        self.hedge_wins += 1
+                        self.saved_s += self._estimated_saving(key, elapsed)
+                        # censored sample: the primary took at least this long
+                        self._observe(key, elapsed)
+                    return task.result()
+            # neither succeeded: the primary's error (or empty parse) stands
+            return primary.result()
+        finally:
+            for task in (primary, backup):
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": HEDGE_ENABLED,
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_rate": self.hedged / self.calls if self.calls else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "estimated_latency_saved_s": round(self.saved_s, 3),
+        }
+
+
+hedger = Hedger()
+
+
+async def hedged_parse(response_format, **params):
+    """parse_completion, hedged when GENIE_HEDGE_ENABLED is set."""
+    if not HEDGE_ENABLED:
+        return await parse_completion(response_format, **params)
+    return await hedger.parse(response_format, **params)
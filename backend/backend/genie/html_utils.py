@@ -0,0 +1,285 @@
+import logging
+import os
+import re
+import threading
+from typing import Optional
+from bs4 import BeautifulSoup, Comment, Tag
+from markdownify import MarkdownConverter
+from pydantic import BaseModel
+from .chunking import count_tokens
+
+logger = logging.getLogger(__name__)
+
+try:
+    import lxml  # noqa: F401
+
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# keep only the page's main content; 0 converts the whole <body>
+HTML_EXTRACT = os.getenv("GENIE_HTML_EXTRACT", "1") == "1"
+# a main-content candidate shorter than this falls back to the whole body
+HTML_MIN_CONTENT_CHARS = int(os.getenv("GENIE_HTML_MIN_CONTENT_CHARS", "250"))
+# tokenizer used to report what stripping saves (gpt-4o family)
+HTML_TOKEN_MODEL = "gpt-4o-mini"
+# bytes per token assumed when that tokenizer can't be loaded
+BYTES_PER_TOKEN = 4
+
+# never content, whatever the scoring says
+DROP_TAGS = {
+    "script", "style", "noscript", "template", "iframe", "svg", "canvas",
+    "form", "button", "input", "select", "textarea", "nav", "footer", "aside",
+    "dialog", "object", "embed",
+}  # fmt: skip
+DROP_ROLES = {"navigation", "banner", "contentinfo", "complementary", "dialog", "alert"}
+# class/id hints, after Mozilla's Readability
+UNLIKELY = re.compile(
+    r"-ad-|\bads?\b|ad-break|advert|agegate|banner|breadcrumb|combx|comment|"
+    r"community|consent|cookie|cover-wrap|disqus|editsection|extra|footer|gdpr|"
+    r"header|legends|menu|modal|newsletter|pager|pagination|popup|promo|related|"
+    r"remark|replies|rss|share|shoutbox|sidebar|skyscraper|social|sponsor|"
+    r"subscribe|supplemental|widget",
+    re.I,
+)
+MAYBE = re.compile(r"and|article|body|column|content|main|shadow", re.I)
+POSITIVE = re.compile(
+    r"article|body|content|entry|hentry|h-entry|main|page|post|text|blog|story",
+    re.I,
+)
+NEGATIVE = re.compile(
+    r"-ad-|hidden|^hid$| hid$| hid |^hid |banner|combx|comment|com-|contact|foot|"
+    r"footer|footnote|gdpr|masthead|media|meta|outbrain|promo|related|scroll|"
+    r"share|shoutbox|sidebar|skyscraper|sponsor|shopping|tags|tool|widget",
+    re.I,
+)
+SCORED_TAGS = {"p", "pre", "td", "blockquote", "li", "section", "h2", "h3", "h4"}
+TAG_SCORES = {
+    "div": 5, "article": 10, "main": 10, "section": 3,
+    "pre": 3, "td": 3, "blockquote": 3,
+    "address": -3, "ol": -3, "ul": -3, "dl": -3, "dd": -3, "dt": -3, "li": -3,
+    "form": -3, "th": -5, "h1": -5, "h2": -5, "h3": -5, "h4": -5, "h5": -5, "h6": -5,
+}  # fmt: skip
+KEEP_TAGS = {"html", "body", "article", "main"}
+HINTLESS_PARENTS = ["table", "pre", "code"]
+
+_converter = MarkdownConverter(
+    heading_style="ATX", strip=["meta", "link", "img"], newline_style="backslash"
+)
+
+
+class HtmlStats(BaseModel):
+    """What converting one page kept and dropped."""
+
+    html_bytes: int
+    markdown_bytes: int
+    page_tokens: int  # visible text of the whole page
+    content_tokens: int  # visible text of the extracted content
+    extracted: bool  # False if the whole body was used
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.html_bytes - self.markdown_bytes
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.page_tokens - self.content_tokens
+
+
+_tokenizer_missing = False
+
+
+def stats_tokens(text: str) -> int:
+    """
+    Tokens of `text` for the savings stats. tiktoken downloads its encoding
+    on first use; without it (e.g. offline) the count is estimated from the
+    byte length rather than failing the conversion.
+    """
+    global _tokenizer_missing
+    if not _tokenizer_missing:
+        try:
+            return count_tokens(text, HTML_TOKEN_MODEL)
+        except Exception as e:
+            logger.warning(f"Estimating HTML token counts, no tokenizer: {e}")
+            _tokenizer_missing = True
+    return len(text.encode()) // BYTES_PER_TOKEN
+
+
+def _hints(tag: Tag) -> str:
+    return " ".join(tag.get("class") or []) + " " + (tag.get("id") or "")
+
+
+def _is_boilerplate(tag: Tag) -> bool:
+    if tag.name in DROP_TAGS:
+        return True
+    if (tag.get("role") or "").lower() in DROP_ROLES:
+        return True
+    if tag.has_attr("hidden") or tag.get("aria-hidden") == "true":
+        return True
+    # hints on links (e.g. heading anchors with class="header") and inside
+    # tables or code say nothing about the page layout
+    if tag.name in KEEP_TAGS or tag.name == "a" or tag.find_parent(HINTLESS_PARENTS):
+        return False
+    hints = _hints(tag)
+    return bool(UNLIKELY.search(hints)) and not MAYBE.search(hints)
+
+
+def _strip_boilerplate(root: Tag):
+    for comment in root.find_all(string=lambda s: isinstance(s, Comment)):
+        comment.extract()
+    # in-page anchors (e.g. heading permalinks) are noise in markdown
+    for link in root.find_all("a", href=re.compile(r"^#")):
+        if re.search(r"\w", link.get_text()):
+            link.unwrap()
+        else:  # permalink markers like ¶ or #
+            link.decompose()
+    # collect first: decomposing while walking skips siblings
+    drop = [tag for tag in root.find_all(True) if _is_boilerplate(tag)]
+    for tag in drop:
+        if not tag.decomposed:
+            tag.decompose()
+
+
+def _class_weight(tag: Tag) -> int:
+    hints = _hints(tag)
+    return (25 if POSITIVE.search(hints) else 0) - (25 if NEGATIVE.search(hints) else 0)
+
+
+def _link_density(tag: Tag, text_length: int) -> float:
+    if not text_length:
+        return 0.0
+    links = sum(len(a.get_text(strip=True)) for a in tag.find_all("a"))
+    return links / text_length
+
+
+def _main_content(root: Tag) -> Optional[Tag]:
+    """The node with the best readability score, or None if nothing scores."""
+    scores: dict[int, float] = {}
+    nodes: dict[int, Tag] = {}
+
+    def credit(tag: Tag, points: float):
+        if id(tag) not in scores:
+            nodes[id(tag)] = tag
+            scores[id(tag)] = TAG_SCORES.get(tag.name, 0) + _class_weight(tag)
+        scores[id(tag)] += points
+
+    for block in root.find_all(SCORED_TAGS):
+        text = block.get_text(" ", strip=True)
+        if len(text) < 25:
+            continue
+        points = 1 + text.count(",") + min(len(text) // 100, 3)
+        parent = block.parent
+        for level in range(3):
+            if parent is None or parent is root.parent:
+                break
+            credit(parent, points / (1, 2, 6)[level])
+            parent = parent.parent
+
+    best, best_score = None, 0.0
+    for key, tag in nodes.items():
+        length = len(tag.get_text(" ", strip=True))
+        score = scores[key] * (1 - _link_density(tag, length))
+        if score > best_score:
+            best, best_score = tag, score
+    if best is None:
+        return None
+
+    # several near-best candidates elsewhere (e.g. the question and answers of
+    # a forum thread) mean the content is their common ancestor
+    near = [
+        tag
+        for key, tag in nodes.items()
+        if tag is not best
+        and scores[key] >= best_score * 0.75
+        and best not in tag.parents
+        and tag not in best.parents
+    ]
+    if len(near) >= 2:
+        near_ancestors = [set(map(id, tag.parents)) for tag in near]
+        for ancestor in best.parents:
+            if ancestor is root.parent:
+                break
+            if sum(id(ancestor) in ids for ids in near_ancestors) >= 2:
+                return ancestor
+
+    # content split over siblings (e.g. consecutive <div>s of an article)
+    # belongs together; take the shared parent if they score close to the best
+    siblings = [
+        tag
+        for tag in best.parent.find_all(recursive=False)
+        if tag is not best and scores.get(id(tag), 0) >= max(10, best_score * 0.2)
+    ]
+    if siblings and best.parent is not root.parent:
+        return best.parent
+    return best
+
+
+def html_to_markdown(content: bytes) -> tuple[str, HtmlStats]:
+    """
+    Markdown of a page's main content: one parse, boilerplate (navigation,
+    footers, scripts, banners) dropped, the best-scoring content node
+    written straight to markdown.
+    """
+    soup = BeautifulSoup(content, HTML_PARSER)
+    root = soup.body or soup
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    page_text = root.get_text(" ", strip=True)
+
+    node, extracted = root, False
+    if HTML_EXTRACT:
+        _strip_boilerplate(root)
+        candidate = _main_content(root)
+        if (
+            candidate is not None
+            and len(candidate.get_text(" ", strip=True)) >= HTML_MIN_CONTENT_CHARS
+        ):
+            node, extracted = candidate, True
+
+    markdown = _converter.convert_soup(node)
+    markdown = re.sub(r"(\n\s*)+\n", "\n\n", markdown).strip()
+    if title and node.find("h1") is None:
+        markdown = f"# {title}\n\n{markdown}"
+
+    stats = HtmlStats(
+        html_bytes=len(content),
+        markdown_bytes=len(markdown.encode()),
+        page_tokens=stats_tokens(page_text),
+        content_tokens=stats_tokens(node.get_text(" ", strip=True)),
+        extracted=extracted,
+    )
+    return markdown, stats
+
+
+class HtmlSavings:
+    """Running totals of what html_to_markdown dropped, for /metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pages = 0
+        self.extracted = 0
+        self.bytes_saved = 0
+        self.tokens_saved = 0
+
+    def record(self, stats: HtmlStats):
+        logger.info(
+            f"HTML {stats.html_bytes / 1024:.0f} KB -> markdown "
+            f"{stats.markdown_bytes / 1024:.0f} KB, {stats.tokens_saved} of "
+            f"{stats.page_tokens} page tokens dropped"
+            + ("" if stats.extracted else " (no main content found, kept body)")
+        )
+        with self._lock:
+            self.pages += 1
+            self.extracted += stats.extracted
+            self.bytes_saved += stats.bytes_saved
+            self.tokens_saved += stats.tokens_saved
+
+    def stats(self) -> dict:
+        return {
+            "pages": self.pages,
+            "extracted": self.extracted,
+            "bytes_saved": self.bytes_saved,
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+html_savings = HtmlSavings()
@@ -0,0 +1,102 @@
+import io
+import os
+from typing import Optional
+from PIL import Image
+
+# the vision model fits images in a 2048px square, then scales the short
+# side to 768px; anything larger only costs bytes and upload time
+VISION_MAX_SIDE = int(os.getenv("GENIE_VISION_MAX_SIDE", "2048"))
+VISION_SHORT_SIDE = int(os.getenv("GENIE_VISION_SHORT_SIDE", "768"))
+JPEG_QUALITY = int(os.getenv("GENIE_VISION_JPEG_QUALITY", "85"))
+
+# formats the vision endpoint accepts as-is
+SUPPORTED_FORMATS = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+# modes that render the same in every viewer; others get normalized
+PASSTHROUGH_MODES = {"RGB", "L"}
+
+
+def sniff_format(data: bytes) -> Optional[str]:
+    """Image format from its magic bytes, or None if unrecognized."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    if data.startswith(b"BM"):
+        return "bmp"
+    if data.startswith(b"\x00\x00\x00\x0cjP  ") or data.startswith(b"\xff\x4f\xff\x51"):
+        return "jpx"
+    return None
+
+
+def vision_size(width: int, height: int) -> tuple[int, int]:
+    """The largest size the vision model will actually look at."""
+    fit = min(1.0, VISION_MAX_SIDE / max(width, height))
+    short = min(1.0, VISION_SHORT_SIDE / (min(width, height) * fit))
+    scale = fit * short
+    if scale >= 1.0:
+        return width, height
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def normalize_mode(image: Image.Image) -> Image.Image:
+    """CMYK, palette, 16-bit and transparent images to plain RGB (or L)."""
+    if image.mode in PASSTHROUGH_MODES:
+        return image
+    if image.mode in ("RGBA", "LA", "PA") or (
+        image.mode == "P" and "transparency" in image.info
+    ):
+        # flatten onto white, as the page would show it
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    if image.mode in ("1", "I;16", "I;16B", "I;16L", "I"):
+        return image.convert("L")
+    return image.convert("RGB")
+
+
+def prepare_image(data: bytes) -> tuple[bytes, str]:
+    """
+    (bytes, mime type) to send to the vision model. The original encoded
+    bytes pass through untouched when the format is supported and the image
+    is already within the vision model's resolution and a plain color mode;
+    otherwise it is normalized, downscaled and re-encoded once.
+    """
+    fmt = sniff_format(data)
+    # opened here, undecoded, so draft() below can still shrink the decode
+    image = Image.open(io.BytesIO(data))
+    target = vision_size(*image.size)
+
+    if (
+        fmt in SUPPORTED_FORMATS
+        and target == image.size
+        and image.mode in PASSTHROUGH_MODES
+        and not getattr(image, "is_animated", False)
+    ):
+        return data, SUPPORTED_FORMATS[fmt]
+
+    if fmt == "jpeg" and target != image.size:
+        # let the decoder skip detail we are about to throw away
+        image.draft(image.mode, target)
+    image = normalize_mode(image)
+    if image.size != target:
+        image = image.resize(target, Image.LANCZOS)
+
+    out = io.BytesIO()
+    if fmt in ("png", "gif", "bmp", "tiff"):
+        # lossless sources are usually diagrams and text, keep them sharp
+        image.save(out, format="PNG")
+        return out.getvalue(), "image/png"
+    image.save(out, format="JPEG", quality=JPEG_QUALITY)
+    return out.getvalue(), "image/jpeg"
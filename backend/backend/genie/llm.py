@@ -0,0 +1,356 @@
+import hashlib
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import AsyncIterator
+import openai
+from .cache import response_cache, cached_parse_key
+from .metrics import CallTimer
+from .ratelimit import scheduler, estimate_request_tokens
+
+logger = logging.getLogger(__name__)
+
+# openai | stub | record | replay
+LLM_PROVIDER = os.getenv("GENIE_LLM_PROVIDER", "openai")
+STUB_BASE_URL = os.getenv("GENIE_STUB_URL", "http://127.0.0.1:8100/v1")
+CASSETTE_DIR = os.getenv(
+    "GENIE_CASSETTE_DIR", os.path.join(os.path.dirname(__file__), "cassettes")
+)
+
+
+class CassetteMissError(LookupError):
+    pass
+
+
+class LLMProvider(ABC):
+    """
+    Every model call in genie goes through a provider: structured-output
+    completions, audio transcription and streamed chat. Sync variants exist
+    for the document parsers, which run outside the event loop.
+
+    parse returns (parsed, usage dict or None); stream_chat yields text
+    tokens and, if the backend reports it, a final {"usage": {...}} dict.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def parse(self, response_format, **params): ...
+
+    @abstractmethod
+    def parse_sync(self, response_format, **params): ...
+
+    @abstractmethod
+    async def transcribe(self, audio: bytes, filename: str, model: str) -> str: ...
+
+    @abstractmethod
+    def transcribe_sync(self, audio: bytes, filename: str, model: str) -> str: ...
+
+    @abstractmethod
+    def stream_chat(self, **params) -> AsyncIterator[str]: ...
+
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI API, or anything speaking its protocol (e.g. the stub server)."""
+
+    name = "openai"
+
+    def __init__(self, base_url: str | None = None, api_key: str | None = None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self._client = None
+        self._async_client = None
+
+    @property
+    def client(self) -> openai.OpenAI:
+        if self._client is None:
+            self._client = openai.OpenAI(
+                api_key=self.api_key or os.getenv("OPENAI_API_KEY"),
+                base_url=self.base_url,
+                # retries are owned by the scheduler in ratelimit.py
+                max_retries=0,
+            )
+        return self._client
+
+    @property
+    def async_client(self) -> openai.AsyncOpenAI:
+        if self._async_client is None:
+            self._async_client = openai.AsyncOpenAI(
+                api_key=self.api_key or os.getenv("OPENAI_API_KEY"),
+                base_url=self.base_url,
+                # retries are owned by the scheduler in ratelimit.py
+                max_retries=0,
+            )
+        return self._async_client
+
+    async def parse(self, response_format, **params):
+        completion = await self.async_client.beta.chat.completions.parse(
+            response_format=response_format, **params
+        )
+        usage = completion.usage.model_dump() if completion.usage else None
+        return completion.choices[0].message.parsed, usage
+
+    def parse_sync(self, response_format, **params):
+        completion = self.client.beta.chat.completions.parse(
+            response_format=response_format, **params
+        )
+        usage = completion.usage.model_dump() if completion.usage else None
+        return completion.choices[0].message.parsed, usage
+
+    async def transcribe(self, audio: bytes, filename: str, model: str) -> str:
+        transcription = await self.async_client.audio.transcriptions.create(
+            model=model, file=(filename, audio)
+        )
+        return transcription.text
+
+    def transcribe_sync(self, audio: bytes, filename: str, model: str) -> str:
+        transcription = self.client.audio.transcriptions.create(
+            model=model, file=(filename, audio)
+        )
+        return transcription.text
+
+    async def stream_chat(self, **params) -> AsyncIterator[str]:
+        stream = await self.async_client.chat.completions.create(
+            stream=True, stream_options={"include_usage": True}, **params
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage:
+                yield {"usage": chunk.usage.model_dump()}
+
+
+def cassette_key(kind: str, request: dict) -> str:
+    payload = json.dumps({"kind": kind, **request}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CassetteProvider(LLMProvider):
+    """
+    Record/replay backend. In "record" mode calls go to `inner` and every
+    request/response pair is written to `cassette_dir` as JSON; in "replay"
+    mode responses are served from the cassettes only, and a request that was
+    never recorded raises CassetteMissError.
+    """
+
+    def __init__(self, mode: str, cassette_dir: str, inner: LLMProvider | None = None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if mode == "record" and inner is None:
+            raise ValueError("Recording needs a provider to record from")
+        self.mode = mode
+        self.name = mode
+        self.cassette_dir = cassette_dir
+        self.inner = inner
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cassette_dir, f"{key}.json")
+
+    def _load(self, kind: str, request: dict):
+        """Returns (key, cassette) where cassette is None if not recorded yet."""
+        key = cassette_key(kind, request)
+        path = self._path(key)
+        if not os.path.exists(path):
+            if self.mode == "replay":
+                raise CassetteMissError(f"No cassette recorded for {kind} {key}")
+            return key, None
+        with open(path) as f:
+            return key, json.load(f)
+
+    def _save(self, key: str, kind: str, request: dict, response):
+        os.makedirs(self.cassette_dir, exist_ok=True)
+        with open(self._path(key), "w") as f:
+            json.dump(
+                {"kind": kind, "request": request, "response": response},
+                f,
+                indent=2,
+                default=str,
+            )
+
+    def _parse_request(self, response_format, params):
+        return {"response_format": response_format.model_json_schema(), **params}
+
+    async def parse(self, response_format, **params):
+        request = self._parse_request(response_format, params)
+        key, cassette = self._load("parse", request)
+        if cassette is not None:
+            response = cassette["response"]
+        else:
+            parsed, usage = await self.inner.parse(response_format, **params)
+            response = {
+                "parsed": parsed.model_dump() if parsed is not None else None,
+                "usage": usage,
+            }
+            self._save(key, "parse", request, response)
+        parsed = response["parsed"]
+        return (
+            response_format.model_validate(parsed) if parsed else None,
+            response["usage"],
+        )
+
+    def parse_sync(self, response_format, **params):
+        request = self._parse_request(response_format, params)
+        key, cassette = self._load("parse", request)
+        if cassette is not None:
+            response = cassette["response"]
+        else:
+            parsed, usage = self.inner.parse_sync(response_format, **params)
+            response = {
+                "parsed": parsed.model_dump() if parsed is not None else None,
+                "usage": usage,
+            }
+            self._save(key, "parse", request, response)
+        parsed = response["parsed"]
+        return (
+            response_format.model_validate(parsed) if parsed else None,
+            response["usage"],
+        )
+
+    def _audio_request(self, audio: bytes, model: str):
+        return {"model": model, "audio_sha256": hashlib.sha256(audio).hexdigest()}
+
+    async def transcribe(self, audio: bytes, filename: str, model: str) -> str:
+        request = self._audio_request(audio, model)
+        key, cassette = self._load("transcribe", request)
+        if cassette is not None:
+            return cassette["response"]
+        response = await self.inner.transcribe(audio, filename, model)
+        self._save(key, "transcribe", request, response)
+        return response
+
+    def transcribe_sync(self, audio: bytes, filename: str, model: str) -> str:
+        request = self._audio_request(audio, model)
+        key, cassette = self._load("transcribe", request)
+        if cassette is not None:
+            return cassette["response"]
+        response = self.inner.transcribe_sync(audio, filename, model)
+        self._save(key, "transcribe", request, response)
+        return response
+
+    async def stream_chat(self, **params) -> AsyncIterator[str]:
+        key, cassette = self._load("stream_chat", params)
+        if cassette is not None:
+            for item in cassette["response"]:
+                yield item
+            return
+        items = []
+        async for item in self.inner.stream_chat(**params):
+            items.append(item)
+            yield item
+        self._save(key, "stream_chat", params, items)
+
+
+def make_provider(name: str = LLM_PROVIDER) -> LLMProvider:
+    match name:
+        case "openai":
+            return OpenAIProvider()
+        case "stub":
+            return OpenAIProvider(base_url=STUB_BASE_URL, api_key="stub")
+        case "record":
+            return CassetteProvider("record", CASSETTE_DIR, OpenAIProvider())
+        case "replay":
+            return CassetteProvider("replay", CASSETTE_DIR)
+        case _:
+            raise ValueError(f"Unknown LLM provider: {name}")
+
+
+provider: LLMProvider = make_provider()
+logger.info(f"Using LLM provider: {provider.name}")
+
+
+def set_provider(new_provider: LLMProvider):
+    """Swap the process-wide provider (benchmarks, load tests)."""
+    global provider
+    provider = new_provider
+
+
+async def parse_completion(response_format, **params):
+    """
+    Structured-output completion backed by the response cache. Every
+    generator is deterministic (temperature=0, fixed seed), so identical
+    requests reuse the stored parsed result instead of paying for it again.
+    """
+    key = cached_parse_key(response_format, **params)
+    with CallTimer("parse", params.get("model", "")) as timer:
+        cached = response_cache.get(key)
+        if cached is not None:
+            timer.record.cached = True
+            return response_format.model_validate_json(cached)
+
+        parsed, usage = await scheduler.run(
+            params.get("model", ""),
+            estimate_request_tokens(params),
+            lambda: provider.parse(response_format, **params),
+            timer,
+        )
+        timer.usage(usage)
+
+    if parsed is not None:
+        response_cache.set(key, parsed.model_dump_json())
+    return parsed
+
+
+def parse_completion_sync(response_format, **params):
+    """Blocking counterpart of parse_completion for the document parsers."""
+    key = cached_parse_key(response_format, **params)
+    with CallTimer("parse", params.get("model", "")) as timer:
+        cached = response_cache.get(key)
+        if cached is not None:
+            timer.record.cached = True
+            return response_format.model_validate_json(cached)
+
+        parsed, usage = scheduler.run_sync(
+            params.get("model", ""),
+            estimate_request_tokens(params),
+            lambda: provider.parse_sync(response_format, **params),
+            timer,
+        )
+        timer.usage(usage)
+
+    if parsed is not None:
+        response_cache.set(key, parsed.model_dump_json())
+    return parsed
+
+
+async def transcribe(
+    audio: bytes,
+    filename: str = "audio.mp3",
+    model: str = "whisper-1",
+    duration_s: float = 0.0,
+) -> str:
+    with CallTimer("transcribe", model) as timer:
+        timer.audio_seconds = duration_s
+        return await scheduler.run(
+            model, 0, lambda: provider.transcribe(audio, filename, model), timer
+        )
+
+
+def transcribe_sync(
+    audio: bytes,
+    filename: str = "audio.mp3",
+    model: str = "whisper-1",
+    duration_s: float = 0.0,
+) -> str:
+    with CallTimer("transcribe", model) as timer:
+        timer.audio_seconds = duration_s
+        return scheduler.run_sync(
+            model, 0, lambda: provider.transcribe_sync(audio, filename, model), timer
+        )
+
+
+async def stream_chat(**params) -> AsyncIterator[str]:
+    model = params.get("model", "")
+    with CallTimer("stream_chat", model) as timer:
+        stream = scheduler.stream(
+            model,
+            estimate_request_tokens(params),
+            lambda: provider.stream_chat(**params),
+            timer,
+        )
+        async for item in stream:
+            if isinstance(item, dict):
+                timer.usage(item.get("usage"))
+                continue
+            timer.first_token()
+            yield item
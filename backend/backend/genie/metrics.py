@@ -0,0 +1,207 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+from pydantic import BaseModel
+
+# USD per 1M tokens (input, output); whisper is priced per audio minute
+MODEL_PRICING = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-2024-08-06": (2.50, 10.00),
+}
+WHISPER_PRICE_PER_MINUTE = 0.006
+MAX_RECORDS = 50000
+
+course_id_var: ContextVar[Optional[str]] = ContextVar("course_id", default=None)
+stage_var: ContextVar[Optional[str]] = ContextVar("stage", default=None)
+item_var: ContextVar[Optional[str]] = ContextVar("item", default=None)
+# called with every finished record, e.g. to report a background job's progress
+listener_var: ContextVar[Optional[Callable]] = ContextVar("listener", default=None)
+
+
+class LLMCallRecord(BaseModel):
+    kind: str  # parse | transcribe | stream_chat
+    model: str
+    course_id: Optional[str] = None
+    stage: Optional[str] = None
+    item: Optional[str] = None  # e.g. the chunk a call was made for
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_s: float = 0.0
+    ttft_s: Optional[float] = None
+    retries: int = 0
+    cost_usd: float = 0.0
+    cached: bool = False
+    error: Optional[str] = None
+    started_at: float
+
+
+def estimate_cost(
+    model: str,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    audio_seconds: float = 0.0,
+) -> float:
+    if model.startswith("whisper"):
+        return audio_seconds / 60 * WHISPER_PRICE_PER_MINUTE
+    price_in, price_out = MODEL_PRICING.get(model, (0.0, 0.0))
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+
+@contextmanager
+def metrics_context(
+    course_id: Optional[str] = None,
+    stage: Optional[str] = None,
+    item: Optional[str] = None,
+):
+    """
+    Tag every LLM call made inside the block. Values propagate into tasks
+    spawned from it, so a router can set the course and genie the stage.
+    """
+    tokens = []
+    for var, value in (
+        (course_id_var, course_id),
+        (stage_var, stage),
+        (item_var, item),
+    ):
+        if value is not None:
+            tokens.append((var, var.set(value)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _aggregate(records: list[LLMCallRecord]) -> dict:
+    live = [r for r in records if not r.cached]
+    latencies = [r.latency_s for r in live]
+    ttfts = [r.ttft_s for r in live if r.ttft_s is not None]
+    return {
+        "calls": len(records),
+        "cached_calls": len(records) - len(live),
+        "errors": sum(1 for r in records if r.error and r.error != "cancelled"),
+        "cancelled": sum(1 for r in records if r.error == "cancelled"),
+        "retries": sum(r.retries for r in records),
+        "prompt_tokens": sum(r.prompt_tokens for r in live),
+        "completion_tokens": sum(r.completion_tokens for r in live),
+        "cost_usd": round(sum(r.cost_usd for r in live), 6),
+        "latency_s_total": round(sum(latencies), 3),
+        "latency_s_p50": round(_percentile(latencies, 0.5), 3),
+        "latency_s_p95": round(_percentile(latencies, 0.95), 3),
+        "latency_s_max": round(max(latencies, default=0.0), 3),
+        "ttft_s_p50": round(_percentile(ttfts, 0.5), 3) if ttfts else None,
+    }
+
+
+class MetricsRegistry:
+    """In-process store of recent LLM call records with per-course rollups."""
+
+    def __init__(self, max_records: int = MAX_RECORDS):
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def record(self, record: LLMCallRecord):
+        with self._lock:
+            self._records.append(record)
+
+    def records(self, course_id: Optional[str] = None) -> list[LLMCallRecord]:
+        with self._lock:
+            records = list(self._records)
+        if course_id is not None:
+            records = [r for r in records if r.course_id == course_id]
+        return records
+
+    def summary(self) -> dict:
+        records = self.records()
+        by_model = defaultdict(list)
+        by_stage = defaultdict(list)
+        for r in records:
+            by_model[r.model].append(r)
+            by_stage[r.stage or "untagged"].append(r)
+        return {
+            "total": _aggregate(records),
+            "by_model": {k: _aggregate(v) for k, v in by_model.items()},
+            "by_stage": {k: _aggregate(v) for k, v in by_stage.items()},
+        }
+
+    def course_summary(self, course_id: str, slowest: int = 10) -> dict:
+        records = self.records(course_id)
+        by_stage = defaultdict(list)
+        for r in records:
+            by_stage[r.stage or "untagged"].append(r)
+        slowest_calls = sorted(
+            (r for r in records if not r.cached), key=lambda r: -r.latency_s
+        )[:slowest]
+        return {
+            "course_id": course_id,
+            "total": _aggregate(records),
+            "by_stage": {k: _aggregate(v) for k, v in by_stage.items()},
+            "slowest_calls": [
+                r.model_dump(include={"stage", "item", "model", "latency_s", "ttft_s"})
+                for r in slowest_calls
+            ],
+        }
+
+
+registry = MetricsRegistry()
+
+
+class CallTimer:
+    """
+    Measures one LLM call and records it on exit. Usage, time-to-first-token
+    and retries are filled in by the caller as they become known.
+    """
+
+    def __init__(self, kind: str, model: str):
+        self.record = LLMCallRecord(
+            kind=kind,
+            model=model,
+            course_id=course_id_var.get(),
+            stage=stage_var.get(),
+            item=item_var.get(),
+            started_at=time.time(),
+        )
+        self._t0 = time.perf_counter()
+        self.audio_seconds = 0.0
+
+    def first_token(self):
+        if self.record.ttft_s is None:
+            self.record.ttft_s = time.perf_counter() - self._t0
+
+    def usage(self, usage: Optional[dict]):
+        if usage:
+            self.record.prompt_tokens = usage.get("prompt_tokens", 0)
+            self.record.completion_tokens = usage.get("completion_tokens", 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        r = self.record
+        r.latency_s = time.perf_counter() - self._t0
+        # GeneratorExit just means a stream consumer stopped early
+        if exc_type is asyncio.CancelledError:
+            r.error = "cancelled"
+        elif exc is not None and exc_type is not GeneratorExit:
+            r.error = type(exc).__name__
+        if not r.cached:
+            r.cost_usd = estimate_cost(
+                r.model, r.prompt_tokens, r.completion_tokens, self.audio_seconds
+            )
+        registry.record(r)
+        listener = listener_var.get()
+        if listener is not None:
+            listener(r)
+        return False
@@ -0,0 +1,104 @@
+import io
+import re
+from typing import Iterator
+from docx import Document
+from docx.table import Table
+from pptx import Presentation
+from pptx.shapes.group import GroupShape
+
+HEADING_STYLE = re.compile(r"^Heading (\d)$")
+
+
+def markdown_table(rows: list[list[str]]) -> str:
+    """Rows of cell texts as a markdown table, the first row as its header."""
+    if not rows:
+        return ""
+    width = max(len(row) for row in rows)
+    lines = []
+    for i, row in enumerate(rows):
+        cells = [
+            " ".join(cell.split()).replace("|", "\\|")
+            for cell in row + [""] * (width - len(row))
+        ]
+        lines.append("| " + " | ".join(cells) + " |")
+        if i == 0:
+            lines.append("|" + " --- |" * width)
+    return "\n".join(lines)
+
+
+def _docx_cell_text(cell) -> str:
+    parts = []
+    for block in cell.iter_inner_content():
+        if isinstance(block, Table):
+            parts += [_docx_cell_text(c) for row in block.rows for c in row.cells]
+        else:
+            parts.append(block.text)
+    return " ".join(part for part in parts if part)
+
+
+def _docx_paragraph(paragraph, style_names: dict) -> str:
+    text = paragraph.text.strip()
+    if not text:
+        return ""
+    # paragraph.style resolves the style afresh on every access, which costs
+    # more than the rest of the extraction together; look the id up instead
+    style = style_names.get(paragraph._p.style, "")
+    heading = HEADING_STYLE.match(style)
+    if heading:
+        return "#" * int(heading.group(1)) + " " + text
+    if style == "Title":
+        return "# " + text
+    if style.startswith("List"):
+        return "- " + text
+    return text
+
+
+def iter_docx_blocks(content: bytes) -> Iterator[str]:
+    """
+    Markdown blocks of a DOCX, in document order: paragraphs (headings and
+    list items marked up) and tables.
+    """
+    doc = Document(io.BytesIO(content))
+    style_names = {style.style_id: style.name for style in doc.styles}
+    for block in doc.iter_inner_content():
+        if isinstance(block, Table):
+            text = markdown_table(
+                [[_docx_cell_text(cell) for cell in row.cells] for row in block.rows]
+            )
+        else:
+            text = _docx_paragraph(block, style_names)
+        if text:
+            yield text
+
+
+def _iter_shape_blocks(shapes) -> Iterator[str]:
+    for shape in shapes:
+        if isinstance(shape, GroupShape):
+            yield from _iter_shape_blocks(shape.shapes)
+        elif getattr(shape, "has_table", False):
+            yield markdown_table(
+                [[cell.text for cell in row.cells] for row in shape.table.rows]
+            )
+        elif shape.has_text_frame:
+            lines = [
+                "  " * paragraph.level + paragraph.text.strip()
+                for paragraph in shape.text_frame.paragraphs
+                if paragraph.text.strip()
+            ]
+            if lines:
+                yield "\n".join(lines)
+
+
+def iter_pptx_blocks(content: bytes) -> Iterator[str]:
+    """
+    Markdown blocks of a PPTX, slide by slide: a heading per slide, the text
+    of every shape (inside groups too) and tables, then the speaker notes.
+    """
+    ppt = Presentation(io.BytesIO(content))
+    for number, slide in enumerate(ppt.slides, start=1):
+        yield f"## Slide {number}"
+        yield from _iter_shape_blocks(slide.shapes)
+        if slide.has_notes_slide:
+            notes = slide.notes_slide.notes_text_frame
+            if notes is not None and notes.text.strip():
+                yield "Speaker notes: " + notes.text.strip()
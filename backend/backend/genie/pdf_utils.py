@@ -1,62 +1,205 @@
 from pydantic import BaseModel
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterator
+import contextvars
+import hashlib
 import io
+import multiprocessing
+import os
 import base64
 from PIL import Image
-import openai
 import fitz
+from .llm import parse_completion_sync
+from .metrics import metrics_context
+from .cache import image_cache
+from .images import prepare_image
+from .workers import in_parser_worker
 
-client = openai.OpenAI()
+# text extraction: worker processes, pages per task, and the page count
+# below which a pool costs more than it saves
+PDF_WORKERS = int(os.getenv("GENIE_PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PAGES_PER_TASK = int(os.getenv("GENIE_PDF_PAGES_PER_TASK", "16"))
+PARALLEL_MIN_PAGES = int(os.getenv("GENIE_PDF_PARALLEL_MIN_PAGES", "48"))
+# images transcribed at once per document
+IMAGE_CONCURRENCY = int(os.getenv("GENIE_IMAGE_CONCURRENCY", "4"))
+# smaller images are treated as decorative (bullets, rules, icons)
+MIN_IMAGE_BYTES = int(os.getenv("GENIE_PDF_MIN_IMAGE_BYTES", "512"))
+MIN_IMAGE_AREA = int(os.getenv("GENIE_PDF_MIN_IMAGE_AREA", str(64 * 64)))
+# reuse the description of a perceptually near-identical image (opt-in)
+IMAGE_NEAR_MATCH = os.getenv("GENIE_IMAGE_NEAR_MATCH", "0") in ("1", "true", "True")
+IMAGE_NEAR_MATCH_BITS = int(os.getenv("GENIE_IMAGE_NEAR_MATCH_BITS", "4"))
 
 
 class ImageDescription(BaseModel):
     description: str
 
 
-def gpt_image_description(image, mime_type):
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format=mime_type.split("/")[-1].upper())
-    img_base64 = base64.b64encode(img_byte_arr.getvalue()).decode("utf-8")
-
-    response = client.beta.chat.completions.parse(
-        model="gpt-4o",
-        messages=[
-            {
-                "role": "system",
-                "content": "Extract text from images verbatim for document transcription.",
-            },
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": "Here is the image:"},
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:{mime_type};base64,{img_base64}"},
-                    },
-                ],
-            },
-        ],
-        response_format=ImageDescription,
-    )
-
-    return response.choices[0].message.parsed.description
+def gpt_image_description(image_bytes: bytes, mime_type: str) -> str:
+    img_base64 = base64.b64encode(image_bytes).decode("utf-8")
 
+    with metrics_context(stage="image_description"):
+        parsed = parse_completion_sync(
+            model="gpt-4o",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Extract text from images verbatim for document transcription.",
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "Here is the image:"},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:{mime_type};base64,{img_base64}"
+                            },
+                        },
+                    ],
+                },
+            ],
+            response_format=ImageDescription,
+        )
 
-def process_pdf(content: bytes) -> str:
+    return parsed.description
+
+
+def collect_images(doc) -> list[tuple[str, bytes]]:
+    """
+    (sha256, encoded bytes) of every distinct image worth transcribing, in
+    order of first appearance. Images repeated across pages (logos, headers)
+    are kept once, by xref and then by content hash, and images below the
+    size or area thresholds are skipped as decorative.
+    """
+    seen_xrefs, seen_hashes, images = set(), set(), []
+    for page in doc:
+        for img in page.get_images(full=True):
+            xref = img[0]
+            if xref in seen_xrefs:
+                continue
+            seen_xrefs.add(xref)
+
+            base_image = doc.extract_image(xref)
+            image_bytes = base_image["image"]
+            if (
+                len(image_bytes) < MIN_IMAGE_BYTES
+                or base_image["width"] * base_image["height"] < MIN_IMAGE_AREA
+            ):
+                continue
+
+            digest = hashlib.sha256(image_bytes).hexdigest()
+            if digest in seen_hashes:
+                continue
+            seen_hashes.add(digest)
+            images.append((digest, image_bytes))
+    return images
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """64-bit difference hash: brightness gradients of a 9x8 thumbnail."""
+    pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left, right = pixels[row * 9 + col], pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def describe_image(key: str, image_bytes: bytes) -> str:
+    """
+    Description of an image, cached under `key`, the sha256 of its bytes.
+    A cache hit decodes nothing; on a miss the image is decoded for the
+    perceptual hash only if near matches are on, and prepare_image decodes
+    (drafted, or not at all) what is sent to the model.
+    """
+    description = image_cache.get(key)
+    if description is not None:
+        return description
+
+    phash = None
+    if IMAGE_NEAR_MATCH:
+        phash = perceptual_hash(Image.open(io.BytesIO(image_bytes)))
+        description = image_cache.get_near(phash, IMAGE_NEAR_MATCH_BITS)
+        if description is not None:
+            return description
+
+    description = gpt_image_description(*prepare_image(image_bytes))
+    image_cache.set(key, description, phash)
+    return description
+
+
+_worker_doc = None
+
+
+def _open_worker_doc(content: bytes):
+    global _worker_doc
+    _worker_doc = fitz.open(stream=content, filetype="pdf")
+
+
+def _extract_page_range(start: int, stop: int) -> list[str]:
+    return [_worker_doc[i].get_text() for i in range(start, stop)]
+
+
+def iter_pdf_pages(content: bytes, workers: int = PDF_WORKERS) -> Iterator[str]:
+    """
+    Yield the text of every page, in page order, as soon as it is extracted.
+    Large documents are split into page ranges extracted in parallel by a
+    process pool; each worker opens the document once. Inside a parser
+    worker pages are extracted in order: the parser pool already runs
+    documents in parallel, and a nested pool would escape its limits.
+    """
+    if in_parser_worker():
+        workers = 1
+    with fitz.open(stream=content, filetype="pdf") as doc:
+        page_count = doc.page_count
+        if workers <= 1 or page_count < PARALLEL_MIN_PAGES:
+            for page in doc:
+                yield page.get_text()
+            return
+
+    ranges = [
+        (start, min(start + PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PAGES_PER_TASK)
+    ]
+    # spawn: forking a process that runs threads and an event loop is unsafe
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(ranges)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_open_worker_doc,
+        initargs=(content,),
+    ) as pool:
+        futures = [pool.submit(_extract_page_range, *r) for r in ranges]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def extract_pdf(content: bytes) -> tuple[str, list[tuple[str, bytes]]]:
+    """The CPU-bound half of process_pdf: page text and images to describe."""
+    text = "".join(page + "\n\n" for page in iter_pdf_pages(content))
     with fitz.open(stream=content, filetype="pdf") as doc:
-        text = ""
-        image_descriptions = []
-        for page in doc:
-            text += page.get_text() + "\n\n"
-
-            for img in page.get_images(full=True):
-                base_image = doc.extract_image(img[0])
-                image_bytes = base_image["image"]
-                mime_type = (
-                    "image/jpeg" if base_image["colorspace"] == 1 else "image/png"
-                )
-
-                image = Image.open(io.BytesIO(image_bytes))
-                description = gpt_image_description(image, mime_type)
-                image_descriptions.append(description)
-
-        return text + "\n\nImage Descriptions:\n" + "\n\n".join(image_descriptions)
+        images = collect_images(doc)
+    return text, images
+
+
+def describe_images(images: list[tuple[str, bytes]]) -> str:
+    """The model-bound half of process_pdf: descriptions of the images."""
+    # each worker runs in a copy of the caller's context so the calls keep
+    # their course/stage metrics tags
+    with ThreadPoolExecutor(max_workers=IMAGE_CONCURRENCY) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, describe_image, *image)
+            for image in images
+        ]
+        image_descriptions = [future.result() for future in futures]
+
+    return "\n\nImage Descriptions:\n" + "\n\n".join(image_descriptions)
+
+
+def process_pdf(content: bytes) -> str:
+    text, images = extract_pdf(content)
+    return text + describe_images(images)
@@ -0,0 +1,415 @@
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+import openai
+from .cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# memory | sqlite (shared by every worker on the host)
+RATE_LIMIT_BACKEND = os.getenv("GENIE_RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_PATH = os.getenv(
+    "GENIE_RATE_LIMIT_PATH", os.path.join(CACHE_DIR, "ratelimit.sqlite3")
+)
+DEFAULT_RPM = float(os.getenv("GENIE_RPM_LIMIT", "500"))
+DEFAULT_TPM = float(os.getenv("GENIE_TPM_LIMIT", "200000"))
+MAX_RETRIES = int(os.getenv("GENIE_MAX_RETRIES", "6"))
+RETRY_BASE_S = float(os.getenv("GENIE_RETRY_BASE_S", "1.0"))
+RETRY_MAX_S = float(os.getenv("GENIE_RETRY_MAX_S", "30"))
+# bounds of the adaptive limit on in-flight calls per model; the fan-out of
+# one generation is GENIE_MAX_CONCURRENCY in tools.py
+MIN_IN_FLIGHT = int(os.getenv("GENIE_MIN_IN_FLIGHT", "1"))
+MAX_IN_FLIGHT = int(os.getenv("GENIE_MAX_IN_FLIGHT", "8"))
+# completion budget assumed for requests that don't set max_tokens
+DEFAULT_COMPLETION_TOKENS = 1000
+
+# (requests per minute, tokens per minute); tokens=None means unmetered
+MODEL_LIMITS = {
+    "whisper-1": (50, None),
+}
+
+
+class RateLimitBackend(ABC):
+    """
+    Token-bucket storage. `take` debits `amount` from the bucket if it holds
+    enough and returns 0, otherwise leaves it untouched and returns how many
+    seconds until it will.
+    """
+
+    @abstractmethod
+    def take(
+        self, key: str, capacity: float, per_second: float, amount: float
+    ) -> float: ...
+
+
+def _refill(
+    tokens: float, updated_at: float, now: float, capacity: float, per_second: float
+):
+    return min(capacity, tokens + (now - updated_at) * per_second)
+
+
+class MemoryBackend(RateLimitBackend):
+    """Buckets shared by the threads and event loops of one process."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, per_second, amount):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated_at, now, capacity, per_second)
+            if tokens >= amount:
+                self._buckets[key] = (min(capacity, tokens - amount), now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (amount - tokens) / per_second
+
+
+class SQLiteBackend(RateLimitBackend):
+    """
+    Buckets in a SQLite file, so every uvicorn worker on the host draws from
+    the same budget. Each take is one IMMEDIATE transaction.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None, timeout=30
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+        return self._conn
+
+    def take(self, key, capacity, per_second, amount):
+        # wall clock, since monotonic clocks aren't comparable across processes
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens, updated_at = row if row else (capacity, now)
+                tokens = _refill(tokens, updated_at, now, capacity, per_second)
+                wait = 0.0
+                if tokens >= amount:
+                    tokens = min(capacity, tokens - amount)
+                else:
+                    wait = (amount - tokens) / per_second
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return wait
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on in-flight calls for one model: halved when the API
+    throttles us, grown by one slot per limit's worth of clean completions.
+
+    Callers beyond the limit sleep until a release or a raised limit frees a
+    slot: threads on a Condition, coroutines on a future of their event
+    loop. Both kinds are woken from whichever thread releases.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._waiters = deque()  # (loop, future) of waiting coroutines
+
+    def _free(self) -> int:
+        return int(self.limit) - self.in_flight
+
+    def _notify(self):
+        """Wake as many waiters as there are free slots; lock held."""
+        free = self._free()
+        if free <= 0:
+            return
+        self._slot_freed.notify(free)
+        for _ in range(min(free, len(self._waiters))):
+            loop, waiter = self._waiters.popleft()
+            try:
+                loop.call_soon_threadsafe(self._wake, waiter)
+            except RuntimeError:  # its loop is closed
+                pass
+
+    def _wake(self, waiter: asyncio.Future):
+        if not waiter.done():
+            waiter.set_result(None)
+        elif waiter.cancelled():
+            # the waiter gave up before its wake-up arrived; pass it on
+            with self._lock:
+                self._notify()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._free() > 0:
+                    self.in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    if (loop, waiter) in self._waiters:
+                        self._waiters.remove((loop, waiter))
+                    elif waiter.done() and not waiter.cancelled():
+                        self._notify()
+                raise
+
+    def acquire_sync(self):
+        with self._lock:
+            while self._free() <= 0:
+                self._slot_freed.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._notify()
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in (408, 409) or exc.status_code >= 500
+    return False
+
+
+def is_throttle(exc: BaseException) -> bool:
+    return isinstance(exc, openai.RateLimitError) or (
+        isinstance(exc, openai.APIStatusError) and exc.status_code == 503
+    )
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def estimate_request_tokens(params: dict) -> int:
+    """Rough prompt + completion token count used to debit the TPM bucket."""
+    prompt_chars = sum(
+        len(str(m.get("content", ""))) for m in params.get("messages", [])
+    )
+    completion = params.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return prompt_chars // 4 + completion
+
+
+class Scheduler:
+    """
+    Admission control for every model call: per-model request and token
+    buckets, an adaptive concurrency limit, and retries with exponential
+    backoff and full jitter on 429s, 5xxs and connection errors.
+
+    Buckets live in the backend (shared across workers with SQLiteBackend);
+    concurrency limits and counters are per process.
+    """
+
+    def __init__(self, backend: RateLimitBackend):
+        self.backend = backend
+        self._concurrency = {}
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.throttles = 0
+        self.waited_s = 0.0
+
+    def limits(self, model: str):
+        return MODEL_LIMITS.get(model, (DEFAULT_RPM, DEFAULT_TPM))
+
+    def concurrency(self, model: str) -> AdaptiveConcurrency:
+        with self._lock:
+            if model not in self._concurrency:
+                self._concurrency[model] = AdaptiveConcurrency(
+                    MAX_IN_FLIGHT, MIN_IN_FLIGHT, MAX_IN_FLIGHT
+                )
+            return self._concurrency[model]
+
+    def _bucket_wait(self, model: str, tokens: int) -> float:
+        rpm, tpm = self.limits(model)
+        wait = self.backend.take(f"{model}:requests", rpm, rpm / 60, 1)
+        if wait or not tpm:
+            return wait
+        # a request larger than the whole budget would otherwise wait forever
+        wait = self.backend.take(f"{model}:tokens", tpm, tpm / 60, min(tokens, tpm))
+        if wait:
+            # give the request slot back so the next attempt isn't charged twice
+            self.backend.take(f"{model}:requests", rpm, rpm / 60, -1)
+        return wait
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float:
+        delay = retry_after(exc)
+        if delay is None:
+            delay = random.uniform(0, min(RETRY_MAX_S, RETRY_BASE_S * 2**attempt))
+        return delay
+
+    def _note_failure(self, model: str, exc: BaseException, attempt: int):
+        with self._lock:
+            self.retries += 1
+            if is_throttle(exc):
+                self.throttles += 1
+        logger.warning(
+            f"{model} call failed ({type(exc).__name__}), retry {attempt + 1}/{MAX_RETRIES}"
+        )
+
+    @asynccontextmanager
+    async def slot(self, model: str, tokens: int):
+        """Wait for budget and a concurrency slot, hold it for the block."""
+        concurrency = self.concurrency(model)
+        await concurrency.acquire()
+        throttled = False
+        try:
+            while wait := self._bucket_wait(model, tokens):
+                self.waited_s += wait
+                await asyncio.sleep(wait)
+            yield
+        except BaseException as e:
+            throttled = is_throttle(e)
+            raise
+        finally:
+            concurrency.release(throttled)
+
+    @contextmanager
+    def slot_sync(self, model: str, tokens: int):
+        concurrency = self.concurrency(model)
+        concurrency.acquire_sync()
+        throttled = False
+        try:
+            while wait := self._bucket_wait(model, tokens):
+                self.waited_s += wait
+                time.sleep(wait)
+            yield
+        except BaseException as e:
+            throttled = is_throttle(e)
+            raise
+        finally:
+            concurrency.release(throttled)
+
+    async def run(self, model: str, tokens: int, call, timer=None):
+        """Await `call()` under the model's budget, retrying transient errors."""
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                async with self.slot(model, tokens):
+                    return await call()
+            except Exception as e:
+                if attempt == MAX_RETRIES or not is_retryable(e):
+                    raise
+                self._note_failure(model, e, attempt)
+                if timer is not None:
+                    timer.record.retries += 1
+                await asyncio.sleep(self._backoff(attempt, e))
+
+    def run_sync(self, model: str, tokens: int, call, timer=None):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                with self.slot_sync(model, tokens):
+                    return call()
+            except Exception as e:
+                if attempt == MAX_RETRIES or not is_retryable(e):
+                    raise
+                self._note_failure(model, e, attempt)
+                if timer is not None:
+                    timer.record.retries += 1
+                time.sleep(self._backoff(attempt, e))
+
+    async def stream(self, model: str, tokens: int, open_stream, timer=None):
+        """
+        Iterate `open_stream()` under the model's budget. Only failures before
+        the first item are retried; after that the consumer has seen output.
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            started = False
+            try:
+                async with self.slot(model, tokens):
+                    async for item in open_stream():
+                        started = True
+                        yield item
+                return
+            except Exception as e:
+                if started or attempt == MAX_RETRIES or not is_retryable(e):
+                    raise
+                self._note_failure(model, e, attempt)
+                if timer is not None:
+                    timer.record.retries += 1
+                await asyncio.sleep(self._backoff(attempt, e))
+
+    def stats(self) -> dict:
+        with self._lock:
+            concurrency = {
+                model: {"limit": int(c.limit), "in_flight": c.in_flight}
+                for model, c in self._concurrency.items()
+            }
+        return {
+            "backend": type(self.backend).__name__,
+            "retries": self.retries,
+            "throttles": self.throttles,
+            "bucket_wait_s": round(self.waited_s, 3),
+            "concurrency": concurrency,
+        }
+
+
+def make_backend(name: str = RATE_LIMIT_BACKEND) -> RateLimitBackend:
+    match name:
+        case "memory":
+            return MemoryBackend()
+        case "sqlite":
+            return SQLiteBackend(RATE_LIMIT_PATH)
+        case _:
+            raise ValueError(f"Unknown rate limit backend: {name}")
+
+
+scheduler = Scheduler(make_backend())
@@ -0,0 +1,90 @@
+import asyncio
+import functools
+import logging
+import os
+from fastapi.encoders import jsonable_encoder
+from .cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+SINGLE_FLIGHT_ENABLED = os.getenv("GENIE_SINGLE_FLIGHT", "1") in ("1", "true", "True")
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one in-flight task instead of
+    each doing the work. Every caller gets the task's result or exception.
+    A caller that is cancelled stops waiting without disturbing the others;
+    the shared task is only cancelled once no caller is waiting for it.
+
+    The task runs in the context of the caller that started it, so its LLM
+    calls are attributed to that caller's course in the metrics.
+    """
+
+    def __init__(self):
+        self._flights: dict[str, _Flight] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: str, func, *args, **kwargs):
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.create_task(func(*args, **kwargs)))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.shared += 1
+            logger.info(f"Joining in-flight {getattr(func, '__name__', func)} call")
+
+        flight.waiters += 1
+        try:
+            # shield: cancelling one caller must not cancel the shared task
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # the last caller gave up; nobody wants the result any more
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        return {
+            "enabled": SINGLE_FLIGHT_ENABLED,
+            "calls": self.calls,
+            "shared": self.shared,
+            "in_flight": len(self._flights),
+        }
+
+
+flights = SingleFlight()
+
+
+def single_flight(func):
+    """
+    Coalesce concurrent calls of the async function `func` that have equal
+    arguments (compared by their JSON encoding).
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not SINGLE_FLIGHT_ENABLED:
+            return await func(*args, **kwargs)
+        key = ResponseCache.make_key(
+            func=f"{func.__module__}.{func.__qualname__}",
+            args=jsonable_encoder(args),
+            kwargs=jsonable_encoder(kwargs),
+        )
+        return await flights.do(key, func, *args, **kwargs)
+
+    return wrapper
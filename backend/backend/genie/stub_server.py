@@ -0,0 +1,221 @@
+"""
+Local stand-in for the OpenAI API, for load tests and offline benchmarks.
+
+Returns schema-valid structured outputs for whatever `response_format` the
+request carries (ExcerptData, Lesson, TestItem, InstructionUnit, ...), streams
+chat completions and answers transcription requests, after a configurable
+latency with jitter. STUB_ERROR_RATE injects 429s to exercise client
+retries. Point the backend at it with:
+
+    uvicorn backend.genie.stub_server:app --port 8100
+    GENIE_LLM_PROVIDER=stub GENIE_STUB_URL=http://127.0.0.1:8100/v1 ...
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "200"))
+STUB_JITTER_MS = float(os.getenv("STUB_JITTER_MS", "100"))
+STUB_SEED = int(os.getenv("STUB_SEED", "1337"))
+# fraction of requests answered with a 429, to exercise client retries
+STUB_ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+
+LOREM = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua"
+).split()
+
+app = FastAPI()
+jitter_rng = random.Random(STUB_SEED)
+
+
+async def simulate_latency():
+    jitter = jitter_rng.uniform(-STUB_JITTER_MS, STUB_JITTER_MS)
+    await asyncio.sleep(max(0.0, STUB_LATENCY_MS + jitter) / 1000)
+
+
+def maybe_throttle():
+    if STUB_ERROR_RATE and jitter_rng.random() < STUB_ERROR_RATE:
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after-ms": "200"},
+            content={
+                "error": {
+                    "message": "Rate limit reached (stub)",
+                    "type": "requests",
+                    "code": "rate_limit_exceeded",
+                }
+            },
+        )
+    return None
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def sample_value(schema: dict, defs: dict, rng: random.Random):
+    """Build an instance of a (strict-mode) JSON schema."""
+    if "$ref" in schema:
+        return sample_value(defs[schema["$ref"].split("/")[-1]], defs, rng)
+    if "const" in schema:
+        return schema["const"]
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    if "anyOf" in schema:
+        options = [s for s in schema["anyOf"] if s.get("type") != "null"]
+        return sample_value((options or schema["anyOf"])[0], defs, rng)
+
+    match schema.get("type"):
+        case "object":
+            return {
+                name: sample_value(prop, defs, rng)
+                for name, prop in schema.get("properties", {}).items()
+            }
+        case "array":
+            count = rng.randint(max(1, schema.get("minItems", 1)), 4)
+            return [sample_value(schema["items"], defs, rng) for _ in range(count)]
+        case "string":
+            return " ".join(rng.choices(LOREM, k=rng.randint(3, 12)))
+        case "integer":
+            return rng.randint(0, 100)
+        case "number":
+            return rng.uniform(0, 100)
+        case "boolean":
+            return rng.random() < 0.5
+        case _:
+            return None
+
+
+def sample_excerpts(markdown: str, rng: random.Random) -> dict:
+    """ExcerptData whose start/end quotes actually occur in the source."""
+    paragraphs = [p for p in markdown.split("\n\n") if p.strip()]
+    per_chunk = max(1, len(paragraphs) // rng.randint(3, 8))
+    excerpts = []
+    for i in range(0, len(paragraphs), per_chunk):
+        group = paragraphs[i : i + per_chunk]
+        excerpts.append(
+            {
+                "title": group[0].strip()[:40],
+                "start": group[0][:40],
+                "end": group[-1][-40:],
+            }
+        )
+    return {"excerpts": excerpts}
+
+
+def build_structured_output(body: dict) -> str:
+    response_format = body.get("response_format") or {}
+    json_schema = response_format.get("json_schema") or {}
+    schema = json_schema.get("schema") or {"type": "string"}
+    user_content = next(
+        (m["content"] for m in body["messages"] if m["role"] == "user"), ""
+    )
+    rng = random.Random(f"{STUB_SEED}:{json.dumps(body, sort_keys=True)}")
+
+    if json_schema.get("name") == "ExcerptData" and isinstance(user_content, str):
+        try:
+            markdown = json.loads(user_content).get("markdown_text", "")
+        except ValueError:
+            markdown = user_content
+        return json.dumps(sample_excerpts(markdown, rng))
+
+    value = sample_value(schema, schema.get("$defs", {}), rng)
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def completion_envelope(body: dict, **fields) -> dict:
+    return {
+        "id": f"chatcmpl-stub-{uuid.uuid4().hex[:12]}",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "system_fingerprint": "stub",
+        **fields,
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    if throttled := maybe_throttle():
+        return throttled
+    body = await request.json()
+    content = build_structured_output(body)
+    prompt_tokens = estimate_tokens(json.dumps(body["messages"]))
+    completion_tokens = estimate_tokens(content)
+
+    def usage_of():
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    await simulate_latency()
+
+    if body.get("stream"):
+
+        async def event_stream():
+            words = content.split(" ")
+            for i, word in enumerate(words):
+                delta = word if i == 0 else " " + word
+                chunk = completion_envelope(
+                    body,
+                    object="chat.completion.chunk",
+                    choices=[
+                        {"index": 0, "delta": {"content": delta}, "finish_reason": None}
+                    ],
+                )
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(0.005)
+            done = completion_envelope(
+                body,
+                object="chat.completion.chunk",
+                choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            )
+            yield f"data: {json.dumps(done)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage = completion_envelope(
+                    body, object="chat.completion.chunk", choices=[], usage=usage_of()
+                )
+                yield f"data: {json.dumps(usage)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    return completion_envelope(
+        body,
+        object="chat.completion",
+        choices=[
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content, "refusal": None},
+                "finish_reason": "stop",
+                "logprobs": None,
+            }
+        ],
+        usage=usage_of(),
+    )
+
+
+@app.post("/v1/audio/transcriptions")
+async def audio_transcriptions(request: Request):
+    if throttled := maybe_throttle():
+        return throttled
+    form = await request.form()
+    audio = await form["file"].read()
+    await simulate_latency()
+    rng = random.Random(f"{STUB_SEED}:{len(audio)}")
+    # roughly one word per 2kB of mp3 keeps transcript length proportional
+    words = rng.choices(LOREM, k=max(5, len(audio) // 2048))
+    return {"text": " ".join(words)}
+
+
+@app.get("/health")
+async def health():
+    return {"message": "Active"}
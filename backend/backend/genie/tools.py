@@ -1,6 +1,6 @@
 from anthropic import AsyncAnthropic
 from fuzzysearch import find_near_matches
-from typing import List
+from typing import List, Optional
 from .datatypes import (
     SupportedModel,
     ContentChunk,
@@ -8,11 +8,21 @@ from .datatypes import (
     ExcerptData,
     Lesson,
     InstructionUnit,
+    ReportUnit,
+    LessonWithTest,
 )
+from .hedging import hedged_parse
+from .metrics import metrics_context
+from .singleflight import single_flight
+from .chunking import split_into_windows, merge_spans, count_tokens
+from .anchoring import ExcerptAnchorer
 from fastapi.encoders import jsonable_encoder
+import asyncio
+import logging
 import os
 import json
-import openai
+
+logger = logging.getLogger(__name__)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
@@ -20,13 +30,41 @@ ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 SUPPORTED_MODELS: List[SupportedModel] = ["gpt-4o-mini"]
 MODEL_DEPLOYED = "gpt-4o-mini"  # "gpt-4o-2024-08-06"
 PROMPTS_DIR = os.path.join(os.path.dirname(__file__), "prompts")
+# upper bound on in-flight completions when fanning out over chunks
+MAX_CONCURRENCY = int(os.getenv("GENIE_MAX_CONCURRENCY", "8"))
+# token budgets for the instruction report: per summarized section, and for
+# the section reports handed to one reduce call
+REPORT_SECTION_TOKENS = int(os.getenv("GENIE_REPORT_SECTION_TOKENS", "12000"))
+REPORT_REDUCE_TOKENS = int(os.getenv("GENIE_REPORT_REDUCE_TOKENS", "12000"))
 
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
 anthropic = AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
 
 # MODEL_DEPLOYED = "gpt-4o-mini"
 
 
+async def map_bounded(func, items, limit: int = MAX_CONCURRENCY):
+    """
+    Run the async `func` over `items` concurrently, with at most `limit`
+    calls in flight. Results are returned in the same order as `items`.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(item):
+        async with semaphore:
+            return await func(item)
+
+    return await asyncio.gather(*(run(item) for item in items))
+
+
+def chunk_label(chunk) -> str:
+    """Identifies a chunk in metrics: its row id if stored, else its title."""
+    if isinstance(chunk, dict):
+        return str(
+            chunk.get("chunk_id") or chunk.get("chunk_title") or chunk.get("title")
+        )
+    return chunk.title
+
+
 def get_match(excerpt, source, direction):
     """
     # HACK: fuzzy search of excerpt in source doesn't always work well
@@ -51,20 +89,19 @@ def get_match(excerpt, source, direction):
     return None
 
 
+def anchor_excerpts(excerpts, source_md):
+    """
+    Resolve each excerpt's start/end text to (title, start, end) offsets in
+    `source_md`, dropping excerpts that can't be located. Uses an indexed
+    anchorer instead of running get_match over the whole source per excerpt.
+    """
+    anchorer = ExcerptAnchorer(source_md)
+    matches = [anchorer.anchor(ex.title, ex.start, ex.end) for ex in excerpts]
+    return [m for m in matches if m is not None]
+
+
 def convert_excerpts_to_chunks(excerpts, source_md):
-    matches = [
-        (
-            ex.title,
-            get_match(ex.start, source_md, "start"),
-            get_match(ex.end, source_md, "end"),
-        )
-        for ex in excerpts
-    ]
-    matches = [
-        (title, m1.start, m2.end)
-        for (title, m1, m2) in matches
-        if m1 is not None and m2 is not None
-    ]
+    matches = anchor_excerpts(excerpts, source_md)
     chunks = [
         ContentChunk(title=title, content=source_md[start:end])
         for (title, start, end) in matches
@@ -72,100 +109,193 @@ def convert_excerpts_to_chunks(excerpts, source_md):
     return chunks
 
 
+@single_flight
 async def gen_chunks_with_model(
-    content: str
+    content: str, max_concurrency: int = MAX_CONCURRENCY
 ):  # xxx add instructions as params {title, summary, instructions}
+    """
+    Map-reduce chunking: the markdown is split into overlapping token-bounded
+    windows, excerpts are extracted from every window concurrently, then the
+    anchored spans are merged back into one ordered, de-overlapped list.
+    """
     with open(os.path.join(PROMPTS_DIR, "chunk.txt")) as f:
         sys_prompt = f.read()
 
-    user_prompt = json.dumps({"markdown_text": content})
-
-    completion = client.beta.chat.completions.parse(
-        model=MODEL_DEPLOYED,
-        messages=[
-            {"role": "system", "content": sys_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0,
-        seed=1337,
-        response_format=ExcerptData,
-    )
-
-    ret = completion.choices[0].message.parsed
-    excerpts = ret.excerpts
-    final_chunks = convert_excerpts_to_chunks(excerpts, content)
+    windows = split_into_windows(content, MODEL_DEPLOYED)
+
+    async def extract(window):
+        with metrics_context(stage="chunking", item=f"{window.start}-{window.end}"):
+            return await hedged_parse(
+                model=MODEL_DEPLOYED,
+                messages=[
+                    {"role": "system", "content": sys_prompt},
+                    {
+                        "role": "user",
+                        "content": json.dumps({"markdown_text": window.text}),
+                    },
+                ],
+                temperature=0,
+                seed=1337,
+                response_format=ExcerptData,
+            )
+
+    results = await map_bounded(extract, windows, max_concurrency)
+
+    spans = []
+    for window, ret in zip(windows, results):
+        if ret is None:
+            continue
+        spans += [
+            (title, window.start + start, window.start + end)
+            for (title, start, end) in anchor_excerpts(ret.excerpts, window.text)
+        ]
+
+    final_chunks = [
+        ContentChunk(title=title, content=content[start:end])
+        for (title, start, end) in merge_spans(spans)
+    ]
     return final_chunks
 
 
+@single_flight
 async def gen_lessons_with_model(
-    chunks: list[ContentChunk], instructions: InstructionUnit
+    chunks: list[ContentChunk],
+    instructions: InstructionUnit,
+    max_concurrency: int = MAX_CONCURRENCY,
 ):
     with open(os.path.join(PROMPTS_DIR, "lesson_content.txt")) as f:
         sys_prompt = f.read()
 
     sys_prompt += f"While creating the lesson content, keep in mind the instructions that will be used to create the tests: {instructions.instructions}"
 
-    completions = [
-        client.beta.chat.completions.parse(
-            model=MODEL_DEPLOYED,
-            messages=[
-                {"role": "system", "content": sys_prompt},
-                {
-                    "role": "user",
-                    "content": json.dumps(jsonable_encoder(chunk)),
-                },
-            ],
-            temperature=0,
-            seed=1337,
-            response_format=Lesson,
-        )
-        for chunk in chunks
-    ]
-
-    lessons = [c.choices[0].message.parsed for c in completions]
-
-    lessons = [
-        Lesson(
-            title=lesson.title,
-            subtitle=lesson.subtitle,
-            bullet_points=lesson.bullet_points,
-        )
-        for lesson in lessons
-    ]
-
+    async def gen_lesson(chunk):
+        with metrics_context(stage="lessons", item=chunk_label(chunk)):
+            return await hedged_parse(
+                model=MODEL_DEPLOYED,
+                messages=[
+                    {"role": "system", "content": sys_prompt},
+                    {
+                        "role": "user",
+                        "content": json.dumps(jsonable_encoder(chunk)),
+                    },
+                ],
+                temperature=0,
+                seed=1337,
+                response_format=Lesson,
+            )
+
+    # a chunk the model failed on stays None; callers skip it
+    lessons = await map_bounded(gen_lesson, chunks, max_concurrency)
     return {"lessons": lessons}
 
 
-async def gen_tests_with_model(
-    chunks: List[ContentChunk], instructions: InstructionUnit, max_tokens: int = 4000
-):  # xxx add instructions as params {title, summary, instructions}
+def quiz_generator(instructions: InstructionUnit, max_tokens: int = 4000):
+    """Per-chunk test generation call, shared by the batch and streaming paths."""
     with open(os.path.join(PROMPTS_DIR, "tests.txt")) as f:
         sys_prompt = f.read()
 
     sys_prompt += f"Follow these instructions while creating the test questions: {instructions.instructions}"
 
-    completions = [
-        client.beta.chat.completions.parse(
-            model=MODEL_DEPLOYED,
-            messages=[
-                {"role": "system", "content": sys_prompt},
-                {
-                    "role": "user",
-                    "content": json.dumps(jsonable_encoder(chunk)),
-                },
-            ],
-            temperature=0,
-            max_tokens=max_tokens,
-            seed=1337,
-            response_format=TestItem,
-        )
-        for chunk in chunks
-    ]
-
-    tests = [c.choices[0].message.parsed for c in completions]
+    async def gen_test(chunk):
+        with metrics_context(stage="tests", item=chunk_label(chunk)):
+            return await hedged_parse(
+                model=MODEL_DEPLOYED,
+                messages=[
+                    {"role": "system", "content": sys_prompt},
+                    {
+                        "role": "user",
+                        "content": json.dumps(jsonable_encoder(chunk)),
+                    },
+                ],
+                temperature=0,
+                max_tokens=max_tokens,
+                seed=1337,
+                response_format=TestItem,
+            )
+
+    return gen_test
+
+
+@single_flight
+async def gen_tests_with_model(
+    chunks: List[ContentChunk],
+    instructions: InstructionUnit,
+    max_tokens: int = 4000,
+    max_concurrency: int = MAX_CONCURRENCY,
+):  # xxx add instructions as params {title, summary, instructions}
+    gen_test = quiz_generator(instructions, max_tokens)
+    tests = await map_bounded(gen_test, chunks, max_concurrency)
     return tests
 
 
+async def stream_tests_with_model(
+    chunks: List[ContentChunk],
+    instructions: InstructionUnit,
+    max_tokens: int = 4000,
+    max_concurrency: int = MAX_CONCURRENCY,
+):
+    """
+    Like gen_tests_with_model, but yields (chunk index, TestItem) as soon as
+    each chunk's completion returns, in completion order. Pending calls are
+    cancelled if the consumer stops early.
+    """
+    gen_test = quiz_generator(instructions, max_tokens)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(index, chunk):
+        async with semaphore:
+            return index, await gen_test(chunk)
+
+    tasks = [asyncio.create_task(run(i, chunk)) for i, chunk in enumerate(chunks)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@single_flight
+async def gen_lessons_and_tests_with_model(
+    chunks: List[ContentChunk],
+    instructions: InstructionUnit,
+    max_tokens: int = 6000,
+    max_concurrency: int = MAX_CONCURRENCY,
+):
+    """
+    Combined mode: each chunk is sent once, and the lesson and its test come
+    back together. Same output shapes as gen_lessons_with_model and
+    gen_tests_with_model, aligned with `chunks` (None where a call failed).
+    """
+    with open(os.path.join(PROMPTS_DIR, "lesson_test.txt")) as f:
+        sys_prompt = f.read()
+
+    sys_prompt += f"Follow these instructions while creating the lesson and the test questions: {instructions.instructions}"
+
+    async def gen_lesson_test(chunk):
+        with metrics_context(stage="lessons_tests", item=chunk_label(chunk)):
+            return await hedged_parse(
+                model=MODEL_DEPLOYED,
+                messages=[
+                    {"role": "system", "content": sys_prompt},
+                    {
+                        "role": "user",
+                        "content": json.dumps(jsonable_encoder(chunk)),
+                    },
+                ],
+                temperature=0,
+                max_tokens=max_tokens,
+                seed=1337,
+                response_format=LessonWithTest,
+            )
+
+    results = await map_bounded(gen_lesson_test, chunks, max_concurrency)
+    return {
+        "lessons": [r.lesson if r else None for r in results],
+        "tests": [r.test if r else None for r in results],
+    }
+
+
 async def gen_image_with_model(prompt: str) -> str:
     """
     Returns a URL to an image generated by a model.
@@ -176,72 +306,133 @@ async def gen_image_with_model(prompt: str) -> str:
     return image_url
 
 
-# async def gen_report_with_model(documents: list[str]):
-#     """
-#     documents => { document => summary, tags, key-insights, testable-questions } x N => title, tags, summary, instructions
-#     summary: a summary of all the documents, common themes, and key insights, talk about the big picture
-#     instructions: a set of instructions on what to do with the report, what to learn, what to think about, what to do with the report that will be used by the model to generate a quiz
-#     """
-#     completions = [
-#         client.beta.chat.completions.parse(
-#             model=MODEL_DEPLOYED,
-#             messages=[
-#                 {
-#                     "role": "system",
-#                     "content": "You are a helpful assistant that summarizes documents and understand the overall big picture.",
-#                 },
-#                 {
-#                     "role": "user",
-#                     "content": json.dumps({"document": document}),
-#                 },
-#             ],
-#             temperature=0,
-#             seed=1337,
-#             response_format=InstructionUnit,
-#         )
-#         for document in documents
-#     ]
-
-#     report_units = [c.choices[0].message.parsed for c in completions]
-#     concatenated_summaries = " ".join([unit.summary for unit in report_units])
-
-#     completion = client.beta.chat.completions.create(
-#         model=MODEL_DEPLOYED,
-#         messages=[
-#             {
-#                 "role": "system",
-#                 "content": "You are a helpful assistant that creates a final report based on the summaries provided.",
-#             },
-#             {"role": "user", "content": concatenated_summaries},
-#         ],
-#         temperature=0,
-#         seed=1337,
-#         response_format=InstructionUnit,
-#     )
-
-#     final_report = completion.choices[0].message.parsed
-
-#     return final_report
+async def summarize_sections(
+    sections: list[str], max_concurrency: int = MAX_CONCURRENCY
+) -> list[ReportUnit]:
+    """Map step: one ReportUnit per section, produced concurrently."""
+    with open(os.path.join(PROMPTS_DIR, "report_section.txt")) as f:
+        sys_prompt = f.read()
+
+    async def summarize(indexed_section):
+        index, section = indexed_section
+        with metrics_context(stage="instructions", item=f"section {index}"):
+            return await hedged_parse(
+                model=MODEL_DEPLOYED,
+                messages=[
+                    {"role": "system", "content": sys_prompt},
+                    {"role": "user", "content": json.dumps({"section": section})},
+                ],
+                temperature=0,
+                seed=1337,
+                response_format=ReportUnit,
+            )
+
+    reports = await map_bounded(summarize, list(enumerate(sections)), max_concurrency)
+    return [r for r in reports if r is not None]
+
+
+async def reduce_reports(reports: list[ReportUnit], response_format):
+    """Combine section reports (in document order) into one `response_format`."""
+    with open(os.path.join(PROMPTS_DIR, "report_reduce.txt")) as f:
+        sys_prompt = f.read()
+
+    payload = {"reports": [report.model_dump() for report in reports]}
+    with metrics_context(stage="instructions", item=f"reduce {len(reports)}"):
+        return await hedged_parse(
+            model=MODEL_DEPLOYED,
+            messages=[
+                {"role": "system", "content": sys_prompt},
+                {"role": "user", "content": json.dumps(payload)},
+            ],
+            temperature=0,
+            seed=1337,
+            response_format=response_format,
+        )
 
 
+def group_reports(reports: list[ReportUnit], max_tokens: int) -> list[list[ReportUnit]]:
+    """Consecutive runs of reports whose combined JSON fits in `max_tokens`."""
+    groups, group, size = [], [], 0
+    for report in reports:
+        tokens = count_tokens(report.model_dump_json(), MODEL_DEPLOYED)
+        if group and size + tokens > max_tokens:
+            groups.append(group)
+            group, size = [], 0
+        group.append(report)
+        size += tokens
+    if group:
+        groups.append(group)
+    return groups
+
+
+async def gen_report_with_model(
+    document: str,
+    section_tokens: int = REPORT_SECTION_TOKENS,
+    reduce_tokens: int = REPORT_REDUCE_TOKENS,
+    max_concurrency: int = MAX_CONCURRENCY,
+) -> Optional[InstructionUnit]:
+    """
+    document => { section => summary, tags, key-insights, testable-questions } x N
+    => title, summary, instructions
+
+    Sections are token-bounded windows of the document, summarized
+    concurrently. If the section reports are too large to reduce in one call
+    they are first reduced in consecutive groups, level by level, so the
+    number of sequential calls grows only logarithmically with the document.
+    None if no section could be summarized.
+    """
+    windows = split_into_windows(document, MODEL_DEPLOYED, section_tokens, 0)
+    reports = await summarize_sections([w.text for w in windows], max_concurrency)
+
+    async def reduce_group(group):
+        # a report that fills a group on its own can't get any smaller
+        if len(group) == 1:
+            return group[0]
+        return await reduce_reports(group, ReportUnit)
+
+    while len(reports) > 1:
+        groups = group_reports(reports, reduce_tokens)
+        if len(groups) == 1:
+            break
+        if len(groups) == len(reports):
+            # every report fills the budget on its own, so grouping makes no
+            # progress; reduce neighbours in pairs to keep halving the list
+            groups = [reports[i : i + 2] for i in range(0, len(reports), 2)]
+        reduced = await map_bounded(reduce_group, groups, max_concurrency)
+        reports = [r for r in reduced if r is not None]
+
+    if not reports:
+        logger.warning("No section reports to reduce into instructions")
+        return None
+    return await reduce_reports(reports, InstructionUnit)
+
+
+@single_flight
 async def gen_instructions_with_model(document: str):
-    completion = client.beta.chat.completions.parse(
-        model=MODEL_DEPLOYED,
-        messages=[
-            {
-                "role": "system",
-                "content": "You are a helpful assistant that summarizes documents in detail and understand the overall big picture. You want to guide test generation and impart the best lessons throught assessment.",
-            },
-            {
-                "role": "user",
-                "content": json.dumps({"document": document}),
-            },
-        ],
-        temperature=0,
-        seed=1337,
-        response_format=InstructionUnit,
-    )
-
-    instructions = completion.choices[0].message.parsed
+    """
+    Course title, summary and test-generation instructions. Documents that
+    don't fit in one section budget go through the map-reduce report.
+    None if the model produced none; callers must report that.
+    """
+    if count_tokens(document, MODEL_DEPLOYED) > REPORT_SECTION_TOKENS:
+        return await gen_report_with_model(document)
+
+    with metrics_context(stage="instructions"):
+        instructions = await hedged_parse(
+            model=MODEL_DEPLOYED,
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You are a helpful assistant that summarizes documents in detail and understand the overall big picture. You want to guide test generation and impart the best lessons throught assessment.",
+                },
+                {
+                    "role": "user",
+                    "content": json.dumps({"document": document}),
+                },
+            ],
+            temperature=0,
+            seed=1337,
+            response_format=InstructionUnit,
+        )
 
     return instructions
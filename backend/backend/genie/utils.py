@@ -1,21 +1,31 @@
+import asyncio
 import os
 import tempfile
 import httpx
 import logging
 import yt_dlp
 import re
+from typing import Optional
 from urllib.parse import urlparse
-from docx import Document
-from pptx import Presentation
-from bs4 import BeautifulSoup
 from markdownify import markdownify as md
-from pydub import AudioSegment
-from openai import OpenAI
-from dotenv import load_dotenv
 from pytube import extract
 import gdown
 import mimetypes
-from .pdf_utils import process_pdf
+from .office_utils import iter_docx_blocks, iter_pptx_blocks
+from .pdf_utils import process_pdf, extract_pdf, describe_images
+from .audio import transcribe_audio, segment_audio, transcribe_segments
+from .cache import ingest_cache
+from .captions import (
+    YOUTUBE_CAPTIONS,
+    captions_to_markdown,
+    fetch_video_info,
+    parse_captions,
+    pick_caption_track,
+)
+from .fetch import Download, http_pool
+from .html_utils import html_to_markdown, html_savings
+from .singleflight import single_flight
+from .workers import parser_pool
 
 # Configure logging
 logging.basicConfig(
@@ -24,12 +34,99 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+async def fetch_and_process(url: str, process) -> str:
+    """
+    Fetch `url` through the shared pool and turn it into markdown with
+    `await process(download)`. The request is conditional on what the ingestion
+    cache holds for `url`; on a 304, or a body with the same hash as before,
+    the cached markdown is reused instead of processing again.
+    """
+    cached = ingest_cache.lookup(url)
+    headers = ingest_cache.conditional_headers(cached)
+    with await http_pool.fetch(url, headers=headers) as download:
+        if download.not_modified:
+            if cached is None:
+                raise ValueError(f"Unexpected 304 Not Modified from {url}")
+            # a 304 may leave out the validators it confirmed
+            etag = download.headers.get("ETag", cached["etag"])
+            last_modified = download.headers.get(
+                "Last-Modified", cached["last_modified"]
+            )
+            content_hash = cached["content_hash"]
+        else:
+            etag = download.headers.get("ETag")
+            last_modified = download.headers.get("Last-Modified")
+            content_hash = download.content_hash
+
+        if cached is not None and content_hash == cached["content_hash"]:
+            logger.info(f"Reusing cached markdown for unchanged {url}")
+            ingest_cache.revalidated += 1
+            markdown = cached["markdown"]
+        else:
+            markdown = await process(download)
+
+    ingest_cache.store(url, markdown, etag, last_modified, content_hash)
+    return markdown
+
+
+async def reuse_or_process(url: str, process) -> str:
+    """
+    For sources fetched by other tools (yt-dlp, gdown), which can't be
+    revalidated: reuse markdown cached within INGEST_MAX_AGE_S, else
+    `await process(url)` and cache the result.
+    """
+    markdown = ingest_cache.fresh(url)
+    if markdown is not None:
+        logger.info(f"Reusing cached markdown for {url}")
+        return markdown
+    markdown = await process(url)
+    ingest_cache.store(url, markdown)
+    return markdown
+
+
+async def youtube_captions(url: str) -> Optional[str]:
+    """
+    Timestamped markdown from a video's uploaded or automatic subtitles, or
+    None if it has none or they can't be fetched.
+    """
+    try:
+        info = await asyncio.to_thread(fetch_video_info, url)
+    except Exception as e:
+        # the audio download reports it properly if the video is unavailable
+        logger.warning(f"Could not look up captions for {url}: {e}")
+        return None
+    track = pick_caption_track(info)
+    if track is None:
+        logger.info(f"No captions for {url}")
+        return None
+    try:
+        with await http_pool.fetch(track.url) as download:
+            cues = parse_captions(track.ext, download.read())
+    except (httpx.HTTPError, ValueError) as e:
+        logger.warning(f"Could not use {track.kind} captions for {url}: {e}")
+        return None
+    if not cues:
+        return None
+    logger.info(
+        f"Using {track.kind} {track.language} captions ({len(cues)} cues) for {url}"
+    )
+    return captions_to_markdown(cues, info.get("title") or "")
+
+
 # Website-specific processors
-async def process_youtube(url: str, openai_client: OpenAI) -> str:
-    """Process YouTube videos by downloading audio and transcribing"""
+async def process_youtube(url: str) -> str:
+    """
+    Process YouTube videos from their captions, or by downloading the audio
+    and transcribing it if they have none
+    """
     logger.info(f"Processing YouTube URL: {url}")
 
     try:
+        if YOUTUBE_CAPTIONS:
+            markdown = await youtube_captions(url)
+            if markdown is not None:
+                return markdown
+
         video_id = extract.video_id(url)
         with tempfile.TemporaryDirectory() as temp_dir:
             # Configure yt-dlp options
@@ -48,8 +145,11 @@ async def process_youtube(url: str, openai_client: OpenAI) -> str:
             }
 
             # Download audio
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
+            def download():
+                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                    ydl.download([url])
+
+            await asyncio.to_thread(download)
 
             # Process the downloaded audio
             audio_path = os.path.join(temp_dir, f"{video_id}.mp3")
@@ -58,7 +158,7 @@ async def process_youtube(url: str, openai_client: OpenAI) -> str:
 
             # Process audio through the audio processor
             with open(audio_path, "rb") as audio_file:
-                return process_audio(audio_file.read(), openai_client)
+                return await parse_content("audio/mpeg", audio_file.read())
 
     except Exception as e:
         logger.error(f"Error processing YouTube video: {str(e)}")
@@ -82,11 +182,10 @@ async def process_arxiv(url: str) -> str:
         pdf_url = f"https://arxiv.org/pdf/{arxiv_id}.pdf"
 
         # Download PDF
-        async with httpx.AsyncClient() as client:
-            response = await client.get(pdf_url)
-            response.raise_for_status()
+        async def process(download: Download) -> str:
+            return await parse_content("application/pdf", download.read())
 
-            return process_pdf(response.content)
+        return await fetch_and_process(pdf_url, process)
 
     except Exception as e:
         logger.error(f"Error processing arXiv paper: {str(e)}")
@@ -102,16 +201,15 @@ async def process_github(url: str) -> str:
         raw_url = url.replace("github.com", "raw.githubusercontent.com")
         raw_url = raw_url.replace("/blob/", "/")
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(raw_url)
-            response.raise_for_status()
-            content = response.content
-
+        async def process(download: Download) -> str:
+            content = download.read()
             # Handle based on file extension
             if url.endswith(".py"):
                 return content.decode("utf-8")
             else:
-                return md(content.decode("utf-8"))
+                return await parser_pool.run(md, content.decode("utf-8"))
+
+        return await fetch_and_process(raw_url, process)
 
     except Exception as e:
         logger.error(f"Error processing GitHub file: {str(e)}")
@@ -119,7 +217,7 @@ async def process_github(url: str) -> str:
 
 
 # Add this new function after the other specific processors:
-async def process_google_drive(url: str, openai_client: OpenAI) -> str:
+async def process_google_drive(url: str) -> str:
     """Process Google Drive files by downloading and processing based on type"""
     logger.info(f"Processing Google Drive URL: {url}")
 
@@ -127,7 +225,9 @@ async def process_google_drive(url: str, openai_client: OpenAI) -> str:
         with tempfile.TemporaryDirectory() as temp_dir:
             # Download file using gdown
             output_path = os.path.join(temp_dir, "downloaded_file")
-            gdown.download(url, output_path, fuzzy=True, quiet=False)
+            await asyncio.to_thread(
+                gdown.download, url, output_path, fuzzy=True, quiet=False
+            )
 
             if not os.path.exists(output_path):
                 raise ValueError("Failed to download file from Google Drive")
@@ -149,7 +249,7 @@ async def process_google_drive(url: str, openai_client: OpenAI) -> str:
                     mime_type = "text/plain"
 
             logger.info(f"Detected MIME type for Google Drive file: {mime_type}")
-            return process_content(mime_type, content, openai_client)
+            return await parse_content(mime_type, content)
 
     except Exception as e:
         logger.error(f"Error processing Google Drive file: {str(e)}")
@@ -158,59 +258,28 @@ async def process_google_drive(url: str, openai_client: OpenAI) -> str:
 
 # Content type processors
 def process_html(content: bytes) -> str:
-    """Extract text from HTML content"""
-    soup = BeautifulSoup(content, "html.parser")
-    markdown = md(soup.prettify(), strip=["meta", "link"], newline_style="backslash")
-    return re.sub(r"(\n\s*)+\n", "\n\n", markdown)
+    """Extract the main content of an HTML page as markdown"""
+    markdown, stats = html_to_markdown(content)
+    html_savings.record(stats)
+    return markdown
 
 
 def process_docx(content: bytes) -> str:
-    """Extract text from DOCX content"""
-    with tempfile.NamedTemporaryFile(suffix=".docx") as temp_file:
-        temp_file.write(content)
-        temp_file.flush()
-        doc = Document(temp_file.name)
-        return "\n\n".join(para.text for para in doc.paragraphs)
+    """Extract text and tables from DOCX content"""
+    return "\n\n".join(iter_docx_blocks(content))
 
 
 def process_pptx(content: bytes) -> str:
-    """Extract text from PPTX content"""
-    with tempfile.NamedTemporaryFile(suffix=".pptx") as temp_file:
-        temp_file.write(content)
-        temp_file.flush()
-        ppt = Presentation(temp_file.name)
-        text_content = []
-        for slide in ppt.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text_content.append(shape.text)
-        return "\n\n".join(text_content)
-
-
-def process_audio(content: bytes, openai_client: OpenAI) -> str:
-    """Process and transcribe audio content"""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_file:
-        temp_file.write(content)
-        temp_file_path = temp_file.name
+    """Extract text, tables and speaker notes from PPTX content"""
+    return "\n\n".join(iter_pptx_blocks(content))
 
-    try:
-        # Truncate to 8 minutes
-        eight_minutes_ms = 8 * 60 * 1000
-        mp3_audio = AudioSegment.from_file(temp_file_path, format="mp3")
-        truncated_audio = mp3_audio[:eight_minutes_ms]
-        truncated_audio.export(temp_file_path, format="mp3")
-
-        with open(temp_file_path, "rb") as audio_file:
-            transcription = openai_client.audio.transcriptions.create(
-                model="whisper-1", file=audio_file
-            )
 
-        return transcription.text
-    finally:
-        os.unlink(temp_file_path)  # Clean up temp file
+def process_audio(content: bytes) -> str:
+    """Process and transcribe audio content"""
+    return transcribe_audio(content)
 
 
-def process_content(content_type: str, content: bytes, openai_client: OpenAI) -> str:
+def process_content(content_type: str, content: bytes) -> str:
     """Process content based on its MIME type using pattern matching"""
     # Get base MIME type without parameters
     base_type = content_type.split(";")[0].strip()
@@ -226,7 +295,7 @@ def process_content(content_type: str, content: bytes, openai_client: OpenAI) ->
             case "application/vnd.openxmlformats-officedocument.presentationml.presentation":
                 return process_pptx(content)
             case typ if typ.startswith("audio/"):
-                return process_audio(content, openai_client)
+                return process_audio(content)
             case _:
                 raise ValueError(f"Unsupported content type: {base_type}")
 
@@ -235,19 +304,41 @@ def process_content(content_type: str, content: bytes, openai_client: OpenAI) ->
         raise
 
 
+async def parse_content(content_type: str, content: bytes) -> str:
+    """
+    process_content without blocking the event loop: parsing runs in the
+    parser pool, and the model calls for PDF images and audio on a thread.
+    """
+    base_type = content_type.split(";")[0].strip()
+
+    match base_type:
+        case "text/html":
+            markdown, stats = await parser_pool.run(html_to_markdown, content)
+            html_savings.record(stats)
+            return markdown
+        case "application/pdf":
+            text, images = await parser_pool.run(extract_pdf, content)
+            return text + await asyncio.to_thread(describe_images, images)
+        case typ if typ.startswith("audio/"):
+            segments = await parser_pool.run(segment_audio, content)
+            return await asyncio.to_thread(transcribe_segments, segments)
+        case _:
+            return await parser_pool.run(process_content, content_type, content)
+
+
+async def process_download(download: Download) -> str:
+    """Process a fetched body based on its Content-Type"""
+    content_type = download.content_type
+    logger.info(f"Processing URL: {download.url} with content type: {content_type}")
+    return await parse_content(content_type, download.read())
+
+
+@single_flight
 async def ingest_url(url: str) -> str:
     """
     Main entry point: Process URLs with special handling for specific websites
     and fallback to content-type based processing
     """
-    # Initialize OpenAI client
-    load_dotenv()
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    if not openai_api_key:
-        raise ValueError("OPENAI_API_KEY not found in environment variables")
-
-    openai_client = OpenAI(api_key=openai_api_key)
-
     try:
         # Parse URL for domain matching
         parsed_url = urlparse(url)
@@ -256,26 +347,16 @@ async def ingest_url(url: str) -> str:
         # Pattern match on domain for special handling
         match domain:
             case d if "youtube.com" in d or "youtu.be" in d:
-                return await process_youtube(url, openai_client)
+                return await reuse_or_process(url, process_youtube)
             case d if "arxiv.org" in d:
                 return await process_arxiv(url)
             case d if "github.com" in d:
                 return await process_github(url)
             case d if "drive.google.com" in d:
-                return await process_google_drive(url, openai_client)
+                return await reuse_or_process(url, process_google_drive)
             case _:
                 # Default handling for other URLs
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(url, follow_redirects=True)
-                    response.raise_for_status()
-
-                    content_type = response.headers.get("Content-Type", "text/html")
-                    content = response.content
-
-                    logger.info(
-                        f"Processing URL: {response.url} with content type: {content_type}"
-                    )
-                    return process_content(content_type, content, openai_client)
+                return await fetch_and_process(url, process_download)
 
     except httpx.HTTPError as e:
         logger.error(f"HTTP error while fetching {url}: {str(e)}")
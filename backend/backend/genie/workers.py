@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# processes parsing documents; 0 runs parsers on a thread instead
+PARSER_WORKERS = int(
+    os.getenv("GENIE_PARSER_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+PARSER_TIMEOUT_S = float(os.getenv("GENIE_PARSER_TIMEOUT_S", "600"))
+# address space per worker (and the tools it spawns, e.g. ffmpeg); 0 = no limit.
+# A job holds its upload plus the parsed result: audio decodes at 16 kHz mono,
+# ~2 MB a minute, so GENIE_AUDIO_MAX_MINUTES=180 needs ~350 MB beside the file
+PARSER_MAX_MEMORY_MB = int(os.getenv("GENIE_PARSER_MAX_MEMORY_MB", "2048"))
+# workers are replaced after this many jobs, returning fragmented memory
+PARSER_MAX_TASKS_PER_CHILD = int(os.getenv("GENIE_PARSER_MAX_TASKS_PER_CHILD", "20"))
+
+
+class ParserTimeout(TimeoutError):
+    pass
+
+
+_in_worker = False
+
+
+def in_parser_worker() -> bool:
+    """
+    True inside a ParserPool worker. Parsers check it so they don't start
+    pools of their own: the parser pool is the one layer of processes, whose
+    timeouts, kills and memory limit cover everything a job runs.
+    """
+    return _in_worker
+
+
+def _init_worker(max_mb: int):
+    global _in_worker
+    _in_worker = True
+    if max_mb <= 0:
+        return
+    import resource
+
+    limit = max_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+class ParserPool:
+    """
+    Runs CPU-bound parsers in worker processes so a large document doesn't
+    stall the event loop (and every other request with it). Jobs get a
+    timeout; a worker that overruns it, or dies (e.g. past its memory
+    limit), is killed and the pool replaced. Jobs caught in a replaced pool
+    are retried once on the new one.
+    """
+
+    def __init__(
+        self,
+        workers: int = PARSER_WORKERS,
+        timeout: float = PARSER_TIMEOUT_S,
+        max_memory_mb: int = PARSER_MAX_MEMORY_MB,
+        max_tasks_per_child: int = PARSER_MAX_TASKS_PER_CHILD,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_memory_mb = max_memory_mb
+        self.max_tasks_per_child = max_tasks_per_child
+        self._pool = None
+        self._generation = 0
+        self.jobs = 0
+        self.timeouts = 0
+        self.crashes = 0
+
+    def _make_pool(self) -> ProcessPoolExecutor:
+        # spawn: forking a process that runs threads and an event loop is unsafe
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.max_memory_mb,),
+            max_tasks_per_child=self.max_tasks_per_child or None,
+        )
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = self._make_pool()
+        return self._pool
+
+    def start(self):
+        if self.workers > 0:
+            self.pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _replace(self, generation: int):
+        """Kill the workers of `generation`'s pool, unless already replaced."""
+        if generation != self._generation or self._pool is None:
+            return
+        pool, self._pool = self._pool, None
+        self._generation += 1
+        # a running job can't be cancelled, only its process killed
+        for process in list((pool._processes or {}).values()):
+            process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, func, *args, timeout: float = None):
+        """
+        `func(*args)` in a worker process; `func` and its arguments and
+        result must be picklable. Raises ParserTimeout after `timeout`.
+        """
+        self.jobs += 1
+        timeout = timeout or self.timeout
+        if self.workers <= 0:
+            return await asyncio.wait_for(asyncio.to_thread(func, *args), timeout)
+
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            generation = self._generation
+            future = loop.run_in_executor(self.pool, func, *args)
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self._replace(generation)
+                raise ParserTimeout(
+                    f"{func.__name__} did not finish within {timeout:.0f}s"
+                ) from None
+            except BrokenProcessPool:
+                if generation != self._generation and attempt == 0:
+                    # another job's timeout took our pool down with it
+                    continue
+                self.crashes += 1
+                self._replace(generation)
+                raise RuntimeError(
+                    f"{func.__name__} crashed its worker "
+                    f"(memory limit {self.max_memory_mb} MB)"
+                ) from None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "jobs": self.jobs,
+            "timeouts": self.timeouts,
+            "crashes": self.crashes,
+            "pool_generation": self._generation,
+        }
+
+
+parser_pool = ParserPool()
@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
@@ -10,12 +11,29 @@ from backend.app.routers import lesson
 from backend.app.routers import media
 from backend.app.routers import instruct
 from backend.app.routers import chat
+from backend.app.routers import metrics
+from backend.app.routers import jobs
+from backend.app.jobs import job_queue
+from backend.genie.fetch import http_pool
+from backend.genie.workers import parser_pool
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await http_pool.start()
+    parser_pool.start()
+    job_queue.start()
+    yield
+    await job_queue.close()
+    parser_pool.close()
+    await http_pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 app.include_router(content.router, prefix="/generate", tags=["generate"])
@@ -27,6 +45,8 @@ app.include_router(lesson.router, prefix="/lesson", tags=["lesson"])
 app.include_router(media.router, prefix="/media", tags=["media"])
 app.include_router(instruct.router, prefix="/instruct", tags=["instruct"])
 app.include_router(chat.router, prefix="/chat", tags=["chat"])
+app.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
+app.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
 
 # Configure CORS
 app.add_middleware(
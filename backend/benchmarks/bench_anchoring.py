@@ -0,0 +1,93 @@
+"""
+Compare excerpt anchoring: the original per-excerpt get_match scan against
+the indexed ExcerptAnchorer, on synthetic 100k+ character documents.
+
+Run from backend/:  OPENAI_API_KEY=x python -m benchmarks.bench_anchoring
+"""
+
+import random
+import time
+from backend.genie.anchoring import ExcerptAnchorer
+from backend.genie.tools import get_match
+
+
+def make_vocabulary(size: int, rng: random.Random):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return [
+        "".join(rng.choice(letters) for _ in range(rng.randint(2, 10)))
+        for _ in range(size)
+    ]
+
+
+def make_document(n_sections: int, section_chars: int, rng: random.Random):
+    # zipf-ish word frequencies so common words repeat like in real prose
+    vocab = make_vocabulary(5000, rng)
+    weights = [1 / (rank + 1) for rank in range(len(vocab))]
+    sections = []
+    for i in range(n_sections):
+        body = []
+        while sum(len(w) + 1 for w in body) < section_chars:
+            body += rng.choices(vocab, weights, k=50)
+        sections.append(f"## Section {i}\n\n" + " ".join(body))
+    return "\n\n".join(sections), sections
+
+
+def typo(text: str, rng: random.Random, lo: int = 0, hi: int | None = None) -> str:
+    i = rng.randrange(lo, hi or len(text))
+    return text[:i] + "x" + text[i + 1 :]
+
+
+def paraphrase(text: str, rng: random.Random) -> str:
+    # several edits away from the source, but the 25-char affixes survive
+    for _ in range(3):
+        text = typo(text, rng, 28, len(text) - 28)
+    return text
+
+
+def make_excerpts(sections, rng: random.Random):
+    excerpts = []
+    for i, section in enumerate(sections):
+        start, end = section[:60], section[-60:]
+        if i % 10 == 0:
+            start, end = paraphrase(start, rng), paraphrase(end, rng)
+        elif i % 3 == 0:
+            start, end = typo(start, rng), typo(end, rng)
+        excerpts.append((f"Section {i}", start, end))
+    return excerpts
+
+
+def bench(n_sections: int, section_chars: int):
+    rng = random.Random(1337)
+    source, sections = make_document(n_sections, section_chars, rng)
+    excerpts = make_excerpts(sections, rng)
+    truth, offset = set(), 0
+    for (title, _, _), section in zip(excerpts, sections):
+        truth.add((title, offset, offset + len(section)))
+        offset += len(section) + 2
+
+    t0 = time.perf_counter()
+    baseline = []
+    for title, start, end in excerpts:
+        m1 = get_match(start, source, "start")
+        m2 = get_match(end, source, "end")
+        if m1 is not None and m2 is not None:
+            baseline.append((title, m1.start, m2.end))
+    t_baseline = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    anchorer = ExcerptAnchorer(source)
+    indexed = [anchorer.anchor(*ex) for ex in excerpts]
+    indexed = [m for m in indexed if m is not None]
+    t_indexed = time.perf_counter() - t0
+
+    print(
+        f"{len(source):>9,} chars {len(excerpts):>4} excerpts | "
+        f"get_match {t_baseline:7.3f}s ({len(truth & set(baseline))} correct) | "
+        f"indexed {t_indexed:7.3f}s ({len(truth & set(indexed))} correct) | "
+        f"speedup {t_baseline / t_indexed:5.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    for n_sections, section_chars in ((40, 2500), (80, 2500), (100, 5000), (400, 5000)):
+        bench(n_sections, section_chars)
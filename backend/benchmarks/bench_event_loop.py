@@ -0,0 +1,79 @@
+"""
+Event-loop latency while documents are being ingested: a ticker coroutine
+asks to wake every 10ms and records how late it runs, standing in for
+/health and chat streaming sharing the worker. Compares parsing inline in
+the coroutine (as ingest_url used to) against the parser process pool.
+
+Run from backend/:  OPENAI_API_KEY=x python -m benchmarks.bench_event_loop
+"""
+
+import asyncio
+import time
+from backend.genie.utils import parse_content, process_content
+from backend.genie.workers import parser_pool
+
+DOCUMENTS = 8
+TICK_S = 0.01
+
+
+def make_html(paragraphs: int = 4000) -> bytes:
+    body = "".join(
+        f"<h2>Section {i}</h2><p>Paragraph {i} with <b>bold</b>, <i>italic</i> "
+        f"and a <a href='/link/{i}'>link</a>.</p><ul><li>one</li><li>two</li></ul>"
+        for i in range(paragraphs)
+    )
+    return f"<html><body>{body}</body></html>".encode()
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def measure(ingest, documents):
+    lags, running = [], True
+
+    async def ticker():
+        while running:
+            t0 = time.perf_counter()
+            await asyncio.sleep(TICK_S)
+            lags.append(time.perf_counter() - t0 - TICK_S)
+
+    tick = asyncio.create_task(ticker())
+    t0 = time.perf_counter()
+    await asyncio.gather(*(ingest(doc) for doc in documents))
+    wall = time.perf_counter() - t0
+    running = False
+    await tick
+    return wall, lags
+
+
+async def inline(content: bytes) -> str:
+    return process_content("text/html", content)
+
+
+async def pooled(content: bytes) -> str:
+    return await parse_content("text/html", content)
+
+
+async def main():
+    documents = [make_html() for _ in range(DOCUMENTS)]
+    print(
+        f"{DOCUMENTS} concurrent HTML ingestions, {len(documents[0]) / 1e6:.1f} MB each"
+    )
+
+    # start the workers outside the measurement
+    parser_pool.start()
+    await parse_content("text/html", b"<p>warmup</p>")
+
+    for label, ingest in (("inline", inline), ("parser pool", pooled)):
+        wall, lags = await measure(ingest, documents)
+        print(
+            f"{label:<12} wall {wall:6.2f}s | loop lag p50 {percentile(lags, 0.5) * 1000:7.1f}ms "
+            f"p99 {percentile(lags, 0.99) * 1000:7.1f}ms max {max(lags) * 1000:7.1f}ms"
+        )
+    parser_pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""
+Tail latency of structured-output calls with and without hedging, against an
+in-process provider whose latency has a heavy tail (most calls fast, a few
+stall for seconds), the shape that dominates our p99.
+
+Run from backend/:  OPENAI_API_KEY=x python -m benchmarks.bench_hedging
+"""
+
+import asyncio
+import random
+import time
+from backend.genie import llm, ratelimit
+from backend.genie.cache import response_cache
+from backend.genie.datatypes import Lesson
+from backend.genie.hedging import Hedger
+from backend.genie.stub_server import sample_value
+
+MODEL = "bench-model"
+CALLS = 400
+CONCURRENCY = 20
+
+
+class TailLatencyProvider(llm.OpenAIProvider):
+    """Simulated parse calls; the benchmark makes no others."""
+
+    name = "tail"
+
+    def __init__(self, slow_rate: float, seed: int = 1337):
+        super().__init__()
+        self.slow_rate = slow_rate
+        self.rng = random.Random(seed)
+
+    async def parse(self, response_format, **params):
+        latency = self.rng.uniform(0.2, 0.6)
+        if self.rng.random() < self.slow_rate:
+            latency += self.rng.uniform(2.0, 4.0)
+        await asyncio.sleep(latency)
+        schema = response_format.model_json_schema()
+        value = sample_value(schema, schema.get("$defs", {}), self.rng)
+        return response_format.model_validate(value), None
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(parse):
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            t0 = time.perf_counter()
+            await parse(
+                Lesson,
+                model=MODEL,
+                messages=[{"role": "user", "content": f"chunk {i}"}],
+            )
+            latencies.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*(one(i) for i in range(CALLS)))
+    return latencies
+
+
+def report(label, latencies, extra=""):
+    print(
+        f"{label:<22} p50 {percentile(latencies, 0.5):.3f}s "
+        f"p95 {percentile(latencies, 0.95):.3f}s "
+        f"p99 {percentile(latencies, 0.99):.3f}s {extra}"
+    )
+
+
+async def main():
+    response_cache.enabled = False
+    ratelimit.MODEL_LIMITS[MODEL] = (1_000_000, None)
+    # leave room for the backup requests, so queueing doesn't blur the tail
+    ratelimit.MAX_IN_FLIGHT = 2 * CONCURRENCY
+
+    for slow_rate in (0.02, 0.05):
+        print(f"-- {slow_rate:.0%} of calls stall for 2-4s")
+        llm.set_provider(TailLatencyProvider(slow_rate))
+        report("no hedging", await run(llm.parse_completion))
+
+        for q in (0.9, 0.95):
+            llm.set_provider(TailLatencyProvider(slow_rate))
+            hedger = Hedger(percentile=q, min_samples=20, min_delay_s=0.0, max_rate=0.1)
+            latencies = await run(hedger.parse)
+            stats = hedger.stats()
+            report(
+                f"hedged at p{int(q * 100)}",
+                latencies,
+                f"| hedge rate {stats['hedge_rate']:.1%}, "
+                f"{stats['hedge_wins']} wins, "
+                f"~{stats['estimated_latency_saved_s']:.1f}s saved",
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""
+HTML-to-markdown on the saved pages in benchmarks/html/: the old converter
+(BeautifulSoup, prettify, markdownify over the string again, whole page)
+against html_to_markdown (one parse, main content only), with lxml and with
+the stdlib parser. Reports wall time per page and the markdown bytes and
+tokens each produces, i.e. what every downstream LLM call over it pays
+(estimated from bytes when tiktoken can't fetch its encoding, e.g. offline).
+
+Run from backend/:  OPENAI_API_KEY=x python -m benchmarks.bench_html
+"""
+
+import re
+import time
+from pathlib import Path
+from bs4 import BeautifulSoup
+from markdownify import markdownify as md
+from backend.genie import html_utils
+
+CORPUS = Path(__file__).parent / "html"
+REPEAT = 20
+PARSERS = (
+    ["lxml", "html.parser"] if html_utils.HTML_PARSER == "lxml" else ["html.parser"]
+)
+
+
+def legacy_html(content: bytes) -> str:
+    soup = BeautifulSoup(content, "html.parser")
+    markdown = md(soup.prettify(), strip=["meta", "link"], newline_style="backslash")
+    return re.sub(r"(\n\s*)+\n", "\n\n", markdown)
+
+
+def timed(func, content: bytes) -> tuple[str, float]:
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        result = func(content)
+    return result, (time.perf_counter() - t0) / REPEAT
+
+
+def main():
+    pages = sorted(CORPUS.glob("*.html"))
+    # markdown bytes and tokens over the corpus, old converter vs new
+    totals = {"legacy": [0, 0], "extracted": [0, 0]}
+    print(f"{'page':<14} {'converter':<23} {'ms':>7} {'md bytes':>9} {'tokens':>7}")
+    for path in pages:
+        content = path.read_bytes()
+        markdown, seconds = timed(legacy_html, content)
+        rows = [("legacy", "legacy (html.parser)", markdown, seconds)]
+        for parser in PARSERS:
+            html_utils.HTML_PARSER = parser
+            (markdown, _), seconds = timed(html_utils.html_to_markdown, content)
+            rows.append(("extracted", f"extracted ({parser})", markdown, seconds))
+        for key, label, markdown, seconds in rows:
+            size = len(markdown.encode())
+            tokens = html_utils.stats_tokens(markdown)
+            print(
+                f"{path.stem:<14} {label:<23} {seconds * 1000:7.1f} {size:9d} {tokens:7d}"
+            )
+        # the default parser's output stands for the new converter
+        for key, _, markdown, _ in rows[:2]:
+            totals[key][0] += len(markdown.encode())
+            totals[key][1] += html_utils.stats_tokens(markdown)
+        print()
+
+    (old_bytes, old_tokens), (new_bytes, new_tokens) = totals.values()
+    print(
+        f"{len(pages)} pages: markdown {old_bytes} -> {new_bytes} bytes "
+        f"({1 - new_bytes / old_bytes:.0%} less), {old_tokens} -> {new_tokens} "
+        f"tokens ({1 - new_tokens / old_tokens:.0%} less)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+DOCX/PPTX extraction: the old temp-file readers (paragraph text only, top
+level shapes only) against the in-memory block extractors, on a generated
+300-page document and 200-slide deck. Each run happens in a fresh process
+so peak RSS is its own; RSS is reported above the process's baseline.
+
+Run from backend/:  OPENAI_API_KEY=x python -m benchmarks.bench_office
+"""
+
+import io
+import multiprocessing
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from docx import Document
+from pptx import Presentation
+from pptx.util import Inches
+
+PAGES = 300
+SLIDES = 200
+
+
+def make_docx(pages: int = PAGES) -> bytes:
+    doc = Document()
+    for page in range(pages):
+        doc.add_heading(f"Section {page}", level=2)
+        for i in range(8):
+            doc.add_paragraph(f"Paragraph {i} of page {page}. " * 6)
+        doc.add_paragraph(f"Point {page}", style="List Bullet")
+        if page % 3 == 0:
+            table = doc.add_table(rows=6, cols=4)
+            for r, row in enumerate(table.rows):
+                for c, cell in enumerate(row.cells):
+                    cell.text = f"r{r}c{c} p{page}"
+        doc.add_page_break()
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def make_pptx(slides: int = SLIDES) -> bytes:
+    ppt = Presentation()
+    layout = ppt.slide_layouts[5]  # title only
+    for n in range(slides):
+        slide = ppt.slides.add_slide(layout)
+        slide.shapes.title.text = f"Slide title {n}"
+        body = slide.shapes.add_textbox(Inches(1), Inches(1.5), Inches(4), Inches(2))
+        for i in range(5):
+            body.text_frame.add_paragraph().text = f"Bullet {i} on slide {n}"
+        group = slide.shapes.add_group_shape()
+        for i in range(3):
+            box = group.shapes.add_textbox(
+                Inches(5), Inches(1 + i), Inches(3), Inches(1)
+            )
+            box.text_frame.text = f"Grouped label {i} on slide {n}"
+        if n % 4 == 0:
+            table = slide.shapes.add_table(
+                5, 3, Inches(1), Inches(4), Inches(6), Inches(2)
+            ).table
+            for r in range(5):
+                for c in range(3):
+                    table.cell(r, c).text = f"r{r}c{c} s{n}"
+        slide.notes_slide.notes_text_frame.text = f"Speaker notes for slide {n}. " * 3
+    out = io.BytesIO()
+    ppt.save(out)
+    return out.getvalue()
+
+
+def legacy_docx(content: bytes) -> str:
+    with tempfile.NamedTemporaryFile(suffix=".docx") as temp_file:
+        temp_file.write(content)
+        temp_file.flush()
+        doc = Document(temp_file.name)
+        return "\n\n".join(para.text for para in doc.paragraphs)
+
+
+def legacy_pptx(content: bytes) -> str:
+    with tempfile.NamedTemporaryFile(suffix=".pptx") as temp_file:
+        temp_file.write(content)
+        temp_file.flush()
+        ppt = Presentation(temp_file.name)
+        text_content = []
+        for slide in ppt.slides:
+            for shape in slide.shapes:
+                if hasattr(shape, "text"):
+                    text_content.append(shape.text)
+        return "\n\n".join(text_content)
+
+
+def measure(name: str, content: bytes) -> tuple[float, float, int]:
+    """(wall seconds, peak RSS above baseline in MB, output chars) in this process."""
+    from backend.genie.utils import process_docx, process_pptx
+
+    func = {
+        "legacy docx": legacy_docx,
+        "legacy pptx": legacy_pptx,
+        "process_docx": process_docx,
+        "process_pptx": process_pptx,
+    }[name]
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    text = func(content)
+    wall = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return wall, (peak - baseline) / 1024, len(text)
+
+
+def main():
+    cases = [
+        (f"{PAGES}-page docx", make_docx(), ("legacy docx", "process_docx")),
+        (f"{SLIDES}-slide pptx", make_pptx(), ("legacy pptx", "process_pptx")),
+    ]
+    context = multiprocessing.get_context("spawn")
+    for label, content, names in cases:
+        print(f"-- {label}, {len(content) / 1e6:.1f} MB")
+        for name in names:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                wall, rss, chars = pool.submit(measure, name, content).result()
+            print(
+                f"{name:<14} wall {wall:6.2f}s | peak RSS +{rss:6.1f} MB | {chars} chars"
+            )
+
+
+if __name__ == "__main__":
+    main()
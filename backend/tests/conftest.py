@@ -0,0 +1,47 @@
+"""
+Run from backend/:  python -m pytest tests
+
+Nothing here touches the network: model calls go to the stub server
+mounted in-process, and caches live in a temporary directory.
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "test")
+os.environ["GENIE_CACHE_DIR"] = tempfile.mkdtemp(prefix="genie-tests-")
+# parsers on a thread, not a process pool
+os.environ["GENIE_PARSER_WORKERS"] = "0"
+os.environ["STUB_LATENCY_MS"] = "0"
+os.environ["STUB_JITTER_MS"] = "0"
+
+import openai
+import pytest
+from fastapi.testclient import TestClient
+from backend.genie import llm, stub_server
+
+
+@pytest.fixture
+def stub_provider():
+    """The stub server as the model provider, with a log of the paths it served."""
+    calls = []
+
+    def log_request(request):
+        calls.append(request.url.path)
+
+    http_client = TestClient(stub_server.app)
+    http_client.event_hooks = {"request": [log_request], "response": []}
+    provider = llm.OpenAIProvider(base_url="http://testserver/v1", api_key="stub")
+    provider._client = openai.OpenAI(
+        api_key="stub",
+        base_url="http://testserver/v1",
+        http_client=http_client,
+        max_retries=0,
+    )
+    previous = llm.provider
+    llm.set_provider(provider)
+    yield calls
+    llm.set_provider(previous)
+    http_client.close()
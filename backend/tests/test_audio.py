@@ -0,0 +1,67 @@
+import io
+from itertools import pairwise
+import pytest
+from pydub import AudioSegment
+from pydub.generators import Sine
+from backend.genie import audio
+from backend.genie.stub_server import LOREM
+
+# tone, pause, tone, ...: pauses sit at 9-10s, 19-20s and 29-30s
+SPEECH_MS, PAUSE_MS = 9000, 1000
+
+
+def make_wav(bursts: int = 4, rate: int = 44100, channels: int = 2) -> bytes:
+    clip = AudioSegment.empty()
+    for _ in range(bursts):
+        clip += Sine(440).to_audio_segment(duration=SPEECH_MS, volume=-6)
+        clip += AudioSegment.silent(duration=PAUSE_MS)
+    clip = clip.set_frame_rate(rate).set_channels(channels)
+    buffer = io.BytesIO()
+    clip.export(buffer, format="wav")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def short_segments(monkeypatch):
+    monkeypatch.setattr(audio, "SEGMENT_S", 12)
+    monkeypatch.setattr(audio, "OVERLAP_S", 1)
+    monkeypatch.setattr(audio, "SILENCE_SEARCH_S", 5)
+    # mp3 needs ffmpeg
+    monkeypatch.setattr(audio, "SEGMENT_FORMAT", "wav")
+
+
+def test_decode_downmixes_to_16k_mono():
+    decoded = audio.decode_audio(make_wav())
+    assert decoded.channels == 1
+    assert decoded.frame_rate == audio.DECODE_RATE
+    assert decoded.sample_width == 2
+    assert abs(len(decoded) - 4 * (SPEECH_MS + PAUSE_MS)) <= 10
+
+
+def test_decode_stops_at_max_duration(monkeypatch):
+    monkeypatch.setattr(audio, "MAX_DURATION_S", 15)
+    assert abs(len(audio.decode_audio(make_wav())) - 15000) <= 10
+
+
+def test_segments_cut_in_pauses(short_segments):
+    segments = audio.segment_audio(make_wav())
+    bounds = [(start, end) for start, end, _ in segments]
+    assert bounds[0][0] == 0
+    assert bounds[-1][1] == pytest.approx(40000, abs=10)
+    for (_, end), (start, _) in pairwise(bounds):
+        assert end - start == 1000  # the overlap
+        # every cut lands in a pause, not mid-tone
+        assert SPEECH_MS <= end % (SPEECH_MS + PAUSE_MS)
+    for _, _, data in segments:
+        assert AudioSegment.from_file(io.BytesIO(data), format="wav").channels == 1
+
+
+def test_silent_audio_cuts_at_segment_length(short_segments):
+    clip = AudioSegment.silent(duration=30000, frame_rate=16000)
+    assert audio.plan_segments(clip) == [(0, 12000), (11000, 23000), (22000, 30000)]
+
+
+def test_transcribe_audio_against_stub(short_segments, stub_provider):
+    text = audio.transcribe_audio(make_wav())
+    assert stub_provider.count("/v1/audio/transcriptions") == 4
+    assert text and set(text.split()) <= set(LOREM)
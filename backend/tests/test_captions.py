@@ -0,0 +1,131 @@
+import asyncio
+import json
+from pathlib import Path
+import httpx
+import pytest
+from backend.genie import utils
+from backend.genie.fetch import http_pool
+from backend.genie.captions import (
+    Cue,
+    captions_to_markdown,
+    parse_captions,
+    pick_caption_track,
+)
+
+FIXTURES = Path(__file__).parent / "fixtures" / "captions"
+
+
+def info(name: str) -> dict:
+    return json.loads((FIXTURES / f"info_{name}.json").read_text())
+
+
+def test_manual_track_preferred_in_first_format():
+    track = pick_caption_track(info("manual"), ["en"])
+    assert (track.kind, track.language, track.ext) == ("manual", "en-GB", "json3")
+    assert "lang=en-GB&fmt=json3" in track.url
+
+
+def test_language_preference_order():
+    track = pick_caption_track(info("manual"), ["de", "en"])
+    assert (track.kind, track.language, track.ext) == ("manual", "de", "json3")
+
+
+def test_auto_track_untranslated_original_first():
+    # no English wanted: the video's own language, and its "-orig" track
+    track = pick_caption_track(info("auto"), ["es"])
+    assert (track.kind, track.language, track.ext) == ("auto", "fr-orig", "vtt")
+
+
+def test_auto_track_in_wanted_language():
+    track = pick_caption_track(info("auto"), ["en"])
+    assert (track.kind, track.language, track.ext) == ("auto", "en", "json3")
+
+
+def test_no_captions():
+    # live chat replays are not captions
+    assert pick_caption_track(info("none"), ["en"]) is None
+    assert pick_caption_track({}, ["en"]) is None
+
+
+def test_parse_rolling_vtt():
+    cues = parse_captions("vtt", (FIXTURES / "auto.vtt").read_bytes())
+    assert cues == [
+        Cue(start=0.0, end=2.5, text="so today we look at scope"),
+        Cue(start=2.51, end=5.0, text="and closures & why they matter"),
+        Cue(start=62.0, end=64.0, text="a closure keeps its scope"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "ext, second",
+    [
+        ("json3", "And closures, and why they matter."),
+        ("srv3", "And closures & why they matter."),
+    ],
+)
+def test_parse_manual_tracks(ext, second):
+    cues = parse_captions(ext, (FIXTURES / f"manual.{ext}").read_bytes())
+    assert cues == [
+        Cue(start=0.0, end=2.5, text="So today we look at scope."),
+        Cue(start=5.0, end=8.0, text=second),
+        Cue(start=62.0, end=64.0, text="A closure keeps its scope."),
+    ]
+
+
+def test_parse_unsupported_format():
+    with pytest.raises(ValueError):
+        parse_captions("ttml", b"<tt/>")
+
+
+def test_truncated_srv3_is_a_value_error():
+    with pytest.raises(ValueError):
+        parse_captions("srv3", (FIXTURES / "truncated.srv3").read_bytes())
+
+
+def youtube_captions(monkeypatch, fetch_video_info, body: bytes = b""):
+    """utils.youtube_captions with yt-dlp and the caption download faked."""
+    monkeypatch.setattr(utils, "fetch_video_info", fetch_video_info)
+
+    async def main():
+        http_pool._client = httpx.AsyncClient(
+            transport=httpx.MockTransport(
+                lambda request: httpx.Response(200, content=body)
+            )
+        )
+        try:
+            return await utils.youtube_captions("https://youtu.be/dQw4w9WgXcQ")
+        finally:
+            await http_pool.close()
+
+    return asyncio.run(main())
+
+
+def test_malformed_captions_fall_back_to_audio(monkeypatch):
+    srv3_only = {
+        "subtitles": {
+            "en": [{"ext": "srv3", "url": "https://www.youtube.com/api/timedtext"}]
+        }
+    }
+    body = (FIXTURES / "truncated.srv3").read_bytes()
+    assert youtube_captions(monkeypatch, lambda url: srv3_only, body) is None
+
+
+def test_failed_info_lookup_falls_back_to_audio(monkeypatch):
+    def fetch_video_info(url):
+        raise RuntimeError("ERROR: [youtube] dQw4w9WgXcQ: Sign in to confirm your age")
+
+    assert youtube_captions(monkeypatch, fetch_video_info) is None
+
+
+def test_captions_to_markdown():
+    cues = parse_captions("vtt", (FIXTURES / "auto.vtt").read_bytes())
+    assert captions_to_markdown(cues, "Lecture 3", paragraph_s=60) == (
+        "# Lecture 3\n\n"
+        "**[00:00]** so today we look at scope and closures & why they matter\n\n"
+        "**[01:02]** a closure keeps its scope"
+    )
+
+
+def test_captions_to_markdown_hours():
+    cues = [Cue(start=3725.0, end=3727.0, text="late")]
+    assert captions_to_markdown(cues) == "**[1:02:05]** late"
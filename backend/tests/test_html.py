@@ -0,0 +1,42 @@
+from pathlib import Path
+import pytest
+from backend.genie import html_utils
+
+CORPUS = Path(__file__).parent.parent / "benchmarks" / "html"
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    """tiktoken as it behaves without network: its encoding can't be fetched."""
+
+    def count_tokens(text, model):
+        raise ConnectionError("openaipublic.blob.core.windows.net unreachable")
+
+    monkeypatch.setattr(html_utils, "count_tokens", count_tokens)
+    monkeypatch.setattr(html_utils, "_tokenizer_missing", False)
+
+
+def test_converts_offline_with_estimated_tokens(offline):
+    content = (CORPUS / "forum_thread.html").read_bytes()
+    markdown, stats = html_utils.html_to_markdown(content)
+
+    assert stats.extracted
+    assert "Why does my list comprehension change a variable outside it?" in markdown
+    assert "every comprehension now runs in its own hidden function scope" in markdown
+    for boilerplate in ("Hot Network Questions", "Accept all cookies", "Log in"):
+        assert boilerplate not in markdown
+    assert 0 < stats.content_tokens < stats.page_tokens
+    assert stats.html_bytes == len(content)
+
+
+def test_tokenizer_is_not_retried_once_missing(offline, monkeypatch):
+    html_utils.stats_tokens("first")
+    monkeypatch.setattr(html_utils, "count_tokens", pytest.fail)
+    assert html_utils.stats_tokens("x" * 40) == 40 // html_utils.BYTES_PER_TOKEN
+
+
+@pytest.mark.parametrize("page", sorted(p.name for p in CORPUS.glob("*.html")))
+def test_corpus_pages_convert(offline, page):
+    markdown, stats = html_utils.html_to_markdown((CORPUS / page).read_bytes())
+    assert "\n# " in "\n" + markdown  # the page title or its own h1
+    assert stats.markdown_bytes < stats.html_bytes
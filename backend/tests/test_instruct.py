@@ -0,0 +1,31 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from backend.app.routers import instruct
+
+
+class Table:
+    """Just enough of a supabase table query for generate_instructions."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        return self
+
+
+def test_no_instructions_is_a_clear_error(monkeypatch):
+    async def no_instructions(document):
+        return None
+
+    monkeypatch.setattr(
+        instruct.supabase, "table", lambda name: Table([{"markdown": "# Notes"}])
+    )
+    monkeypatch.setattr(instruct, "gen_instructions_with_model", no_instructions)
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(instruct.generate_instructions("course", "user", None))
+    assert "Could not generate instructions" in raised.value.detail
@@ -0,0 +1,85 @@
+import asyncio
+from backend.app import jobs as jobs_module
+from backend.app.jobs import FAILED, QUEUED, SUCCEEDED, JobQueue, JobStore
+
+
+def run_jobs(tmp_path, handlers: dict, submit: list[str]) -> dict:
+    """Submit one job per kind in `submit` to a one-worker queue, run them all."""
+    queue = JobQueue(JobStore(str(tmp_path / "jobs.sqlite3")), workers=1)
+    for kind, handler in handlers.items():
+        queue.handler(kind)(handler)
+
+    async def main():
+        queue.start()
+        jobs = [queue.submit(kind, {}) for kind in submit]
+        try:
+            for _ in range(200):
+                current = [queue.store.get(job.job_id) for job in jobs]
+                if all(job.done for job in current):
+                    return {job.kind: job for job in current}
+                await asyncio.sleep(0.02)
+            raise AssertionError("jobs did not finish")
+        finally:
+            await queue.close()
+
+    return asyncio.run(main())
+
+
+async def ok():
+    return {"answer": 42}
+
+
+async def broken():
+    raise RuntimeError("model said no")
+
+
+async def cancelled():
+    raise asyncio.CancelledError()
+
+
+async def unstorable():
+    return object()
+
+
+def test_failures_do_not_stop_the_worker(tmp_path):
+    jobs = run_jobs(
+        tmp_path,
+        {"broken": broken, "cancelled": cancelled, "unstorable": unstorable, "ok": ok},
+        ["broken", "cancelled", "unstorable", "ok"],
+    )
+    assert jobs["broken"].status == FAILED
+    assert jobs["broken"].error == "model said no"
+    assert jobs["cancelled"].status == FAILED
+    assert jobs["cancelled"].error == "cancelled"
+    assert jobs["unstorable"].status == FAILED
+    assert jobs["unstorable"].error.startswith("could not store the result")
+    # the one worker is still alive for the job after them
+    assert jobs["ok"].status == SUCCEEDED
+    assert jobs["ok"].result == {"answer": 42}
+
+
+def test_succeeded_job_is_reused_until_stale_or_forced(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job, created = store.submit("lessons", "course", {}, "inputs")
+    assert created
+    store.finish(job.job_id, {}, {"answer": 42})
+
+    again, created = store.submit("lessons", "course", {}, "inputs")
+    assert not created and again.status == SUCCEEDED
+
+    # the generated rows may have been deleted since: run it again
+    forced, created = store.submit("lessons", "course", {}, "inputs", force=True)
+    assert created and forced.job_id == job.job_id and forced.status == QUEUED
+    assert forced.result is None
+
+    store.finish(job.job_id, {}, {"answer": 42})
+    monkeypatch.setattr(jobs_module, "JOB_REUSE_S", 0)
+    stale, created = store.submit("lessons", "course", {}, "inputs")
+    assert created and stale.status == QUEUED
+
+
+def test_force_does_not_requeue_a_job_in_progress(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job, _ = store.submit("lessons", "course", {}, "inputs")
+    again, created = store.submit("lessons", "course", {}, "inputs", force=True)
+    assert not created and again.job_id == job.job_id
@@ -0,0 +1,14 @@
+import pytest
+from backend.genie import llm
+
+
+def test_providers_implement_the_whole_interface():
+    llm.OpenAIProvider()
+    llm.CassetteProvider("replay", "/nonexistent")
+
+    class ParseOnly(llm.LLMProvider):
+        async def parse(self, response_format, **params):
+            return None, None
+
+    with pytest.raises(TypeError):
+        ParseOnly()
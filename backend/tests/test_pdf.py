@@ -0,0 +1,72 @@
+import asyncio
+import hashlib
+import io
+import fitz
+from PIL import Image
+from backend.genie import pdf_utils
+from backend.genie.workers import ParserPool
+
+
+def make_pdf(pages: int) -> bytes:
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"page {i}")
+    return doc.tobytes()
+
+
+def extract_without_nested_pool(content: bytes) -> tuple[bool, list[str]]:
+    def refuse(*args, **kwargs):
+        raise AssertionError("a parser worker started a pool of its own")
+
+    pdf_utils.ProcessPoolExecutor = refuse
+    return pdf_utils.in_parser_worker(), list(pdf_utils.iter_pdf_pages(content))
+
+
+def test_large_pdf_in_parser_worker_extracts_in_process():
+    content = make_pdf(pdf_utils.PARALLEL_MIN_PAGES + 12)
+    pool = ParserPool(workers=1, max_memory_mb=0)
+    try:
+        in_worker, pages = asyncio.run(pool.run(extract_without_nested_pool, content))
+    finally:
+        pool.close()
+    assert in_worker
+    assert [page.strip() for page in pages] == [
+        f"page {i}" for i in range(pdf_utils.PARALLEL_MIN_PAGES + 12)
+    ]
+
+
+def jpeg(seed: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.effect_noise((256, 256), 40 + seed).convert("RGB").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def test_cached_image_is_not_decoded(monkeypatch):
+    descriptions = []
+
+    def gpt_image_description(data, mime_type):
+        descriptions.append(mime_type)
+        return "a noisy square"
+
+    monkeypatch.setattr(pdf_utils, "gpt_image_description", gpt_image_description)
+    data = jpeg(1)
+    key = hashlib.sha256(data).hexdigest()
+    assert pdf_utils.describe_image(key, data) == "a noisy square"
+
+    def no_decoding(*args, **kwargs):
+        raise AssertionError("decoded a cached image")
+
+    monkeypatch.setattr(pdf_utils.Image, "open", no_decoding)
+    assert pdf_utils.describe_image(key, data) == "a noisy square"
+    assert descriptions == ["image/jpeg"]
+
+
+def test_collect_images_keys_by_content_hash():
+    data = jpeg(2)
+    doc = fitz.open()
+    for _ in range(2):  # the same image on two pages, as separate objects
+        doc.new_page().insert_image(fitz.Rect(0, 0, 256, 256), stream=data)
+    images = pdf_utils.collect_images(doc)
+    assert len(images) == 1
+    key, image_bytes = images[0]
+    assert key == hashlib.sha256(image_bytes).hexdigest()
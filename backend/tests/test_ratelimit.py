@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import time
+import pytest
+from backend.genie.ratelimit import AdaptiveConcurrency, RateLimitBackend
+
+
+def test_waiters_never_exceed_the_limit():
+    concurrency = AdaptiveConcurrency(2, 2, 2)
+    running, peak = 0, 0
+
+    async def call():
+        nonlocal running, peak
+        await concurrency.acquire()
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        concurrency.release()
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(10)))
+
+    asyncio.run(main())
+    assert peak == 2
+    assert concurrency.in_flight == 0
+
+
+def test_release_from_a_thread_wakes_a_coroutine():
+    concurrency = AdaptiveConcurrency(1, 1, 1)
+    concurrency.acquire_sync()
+
+    async def main():
+        threading.Timer(0.05, concurrency.release).start()
+        started = time.perf_counter()
+        await asyncio.wait_for(concurrency.acquire(), 1)
+        return time.perf_counter() - started
+
+    assert 0.04 < asyncio.run(main()) < 0.5
+    assert concurrency.in_flight == 1
+
+
+def test_release_from_a_coroutine_wakes_a_thread():
+    concurrency = AdaptiveConcurrency(1, 1, 1)
+    acquired = threading.Event()
+
+    async def hold():
+        await concurrency.acquire()
+        thread = threading.Thread(
+            target=lambda: (concurrency.acquire_sync(), acquired.set())
+        )
+        thread.start()
+        await asyncio.sleep(0.02)
+        assert not acquired.is_set()
+        concurrency.release()
+        await asyncio.to_thread(thread.join, 1)
+
+    asyncio.run(hold())
+    assert acquired.is_set()
+
+
+def test_cancelled_waiter_passes_its_slot_on():
+    concurrency = AdaptiveConcurrency(1, 1, 1)
+
+    async def main():
+        await concurrency.acquire()
+        first = asyncio.create_task(concurrency.acquire())
+        second = asyncio.create_task(concurrency.acquire())
+        await asyncio.sleep(0)
+        # the wake-up goes to `first`, which is cancelled before it runs
+        concurrency.release()
+        first.cancel()
+        await asyncio.wait_for(second, 1)
+
+    asyncio.run(main())
+    assert concurrency.in_flight == 1
+
+
+def test_backend_must_implement_take():
+    with pytest.raises(TypeError):
+        RateLimitBackend()
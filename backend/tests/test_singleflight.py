@@ -0,0 +1,91 @@
+import asyncio
+import httpx
+import pytest
+from backend.genie import utils
+from backend.genie.fetch import http_pool
+from backend.genie.singleflight import SingleFlight, single_flight
+
+URL = "https://example.com/notes.html"
+PAGE = "<h1>Notes</h1><p>Hello</p>"
+
+
+def test_concurrent_identical_ingests_fetch_once(monkeypatch):
+    fetches = []
+
+    async def upstream(request):
+        fetches.append(str(request.url))
+        await asyncio.sleep(0.05)  # stay in flight while the others arrive
+        return httpx.Response(200, headers={"Content-Type": "text/html"}, text=PAGE)
+
+    async def process_download(download):
+        return download.read().decode()
+
+    monkeypatch.setattr(utils, "process_download", process_download)
+
+    async def main():
+        http_pool._client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+        try:
+            return await asyncio.gather(*(utils.ingest_url(URL) for _ in range(10)))
+        finally:
+            await http_pool.close()
+
+    assert asyncio.run(main()) == [PAGE] * 10
+    assert fetches == [URL]
+
+
+def test_different_arguments_are_not_shared():
+    calls = []
+
+    @single_flight
+    async def work(x):
+        calls.append(x)
+        await asyncio.sleep(0.01)
+        return x * 2
+
+    async def main():
+        return await asyncio.gather(work(1), work(1), work(2))
+
+    assert asyncio.run(main()) == [2, 2, 4]
+    assert sorted(calls) == [1, 2]
+
+
+def test_every_waiter_gets_the_error_and_the_key_is_released():
+    flight = SingleFlight()
+    calls = 0
+
+    async def fail():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def main():
+        results = await asyncio.gather(
+            *(flight.do("key", fail) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+        # a failed flight is forgotten, so the next call retries
+        with pytest.raises(RuntimeError):
+            await flight.do("key", fail)
+
+    asyncio.run(main())
+    assert calls == 2
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_cancelled_caller_leaves_the_others_waiting():
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        first = asyncio.create_task(flight.do("key", slow))
+        second = asyncio.create_task(flight.do("key", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "done"
+        assert first.cancelled()
+
+    asyncio.run(main())
@@ -0,0 +1,25 @@
+import asyncio
+from backend.genie import tools
+from backend.genie.datatypes import ContentChunk, InstructionUnit, Lesson
+
+INSTRUCTIONS = InstructionUnit(title="t", summary="s", instructions="i")
+
+
+def test_failed_lesson_stays_none(monkeypatch):
+    async def hedged_parse(messages, **params):
+        if "refused" in messages[1]["content"]:
+            return None
+        return Lesson(title="ok", subtitle="", bullet_points=[])
+
+    monkeypatch.setattr(tools, "hedged_parse", hedged_parse)
+    chunks = [
+        ContentChunk(title="one", content="fine"),
+        ContentChunk(title="two", content="refused"),
+        ContentChunk(title="three", content="fine"),
+    ]
+    result = asyncio.run(tools.gen_lessons_with_model(chunks, INSTRUCTIONS))
+    assert [lesson and lesson.title for lesson in result["lessons"]] == [
+        "ok",
+        None,
+        "ok",
+    ]